@@ -1,8 +1,14 @@
-import fitz  # PyMuPDF
+import argparse
+import bisect
+import hashlib
 import json
+import os
 import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 # Rutas relativas al directorio raíz del proyecto
 REPO_ROOT = Path(__file__).resolve().parent.parent
@@ -10,6 +16,19 @@ PDF_PATH = REPO_ROOT / "iaf_nace_classifier" / "data" / "Codigo_NACE_sectoresema
 # Archivo de salida principal con mapeo IAF→NACE expandido y descripciones completas
 OUTPUT_JSON = REPO_ROOT / "iaf_nace_classifier" / "data" / "iaf_nace_mapeo_expandido.json"
 LOG_FILE = REPO_ROOT / "extract_log.txt"
+# Artefactos precompilados (mapeo limpio, índice de búsqueda, tabla de códigos), ver `snapshot`
+ARTIFACTS_DIR = OUTPUT_JSON.parent / "snapshots"
+# Caché de líneas por página (IAF_NACE_EXTRACT_CACHE para cambiarla)
+CACHE_DIR = Path(os.environ.get("IAF_NACE_EXTRACT_CACHE") or REPO_ROOT / ".cache" / "extract_pages")
+
+# Versión del formato de las líneas en caché: hay que subirla si cambia cómo se
+# agrupan las palabras en líneas (Y_TOL, _norm_text), no al retocar el parser
+FORMATO_LINEAS = 1
+# Tolerancia vertical (en puntos) para considerar dos palabras en la misma línea
+Y_TOL = 1.5
+
+# Línea reconstruida de una página: (coordenada Y, texto normalizado)
+Linea = Tuple[float, str]
 
 
 # Utilidades de normalización para mitigar errores comunes de OCR
@@ -73,22 +92,14 @@ def _parse_codigos_y_exclusiones(segmento: str) -> Tuple[List[str], List[str]]:
     return _dedup(codigos), _dedup(exclusiones)
 
 
-def extraer_iaf_nace_desde_pdf():
-    doc = fitz.open(PDF_PATH)
-    sectores: List[dict] = []
-    warnings: List[str] = []
-
-    # Usar palabras para reconstruir líneas y alinear columnas por coordenada Y
-    page = doc[0]
-    words = page.get_text("words") or []
+def _agrupar_lineas(words) -> List[Linea]:
+    """Reconstruye las líneas de una página agrupando sus palabras por coordenada Y."""
     # words: (x0, y0, x1, y1, word, block_no, line_no, word_no)
-    words.sort(key=lambda w: (round(w[1], 1), w[0]))
+    words = sorted(words, key=lambda w: (round(w[1], 1), w[0]))
 
-    # Agrupar en líneas por proximidad vertical
-    lines: List[Tuple[float, str]] = []  # (y, text)
+    lines: List[Linea] = []  # (y, text)
     cur_y = None
     cur_words: List[Tuple[float, str]] = []  # (x, word)
-    Y_TOL = 1.5
 
     for x0, y0, x1, y1, wtxt, *_ in words:
         if cur_y is None or abs(y0 - cur_y) <= Y_TOL:
@@ -109,6 +120,105 @@ def extraer_iaf_nace_desde_pdf():
         text_line = _norm_text(" ".join(t[1] for t in cur_words))
         if text_line:
             lines.append((cur_y, text_line))
+    return lines
+
+
+# Documento abierto en este proceso: (ruta, pid, documento). Cada worker del
+# pool abre el PDF una sola vez para todas las páginas que procesa; el pid
+# evita reutilizar el documento heredado por fork, que comparte el descriptor
+_DOC = None
+
+
+def _abrir_pdf(pdf_path: str):
+    global _DOC
+    if _DOC is None or _DOC[:2] != (pdf_path, os.getpid()):
+        # Importación diferida: con todas las páginas en caché no hace falta PyMuPDF
+        import fitz  # PyMuPDF
+
+        _DOC = (pdf_path, os.getpid(), fitz.open(pdf_path))
+    return _DOC[2]
+
+
+def _lineas_pagina(pdf_path: str, i: int) -> List[Linea]:
+    return _agrupar_lineas(_abrir_pdf(pdf_path)[i].get_text("words") or [])
+
+
+def _escribir_atomico(path: Path, data) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _leer_cache(path: Path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def extraer_lineas(
+    pdf_path: str | Path, workers: Optional[int] = None, cache_dir: Optional[Path] = CACHE_DIR
+) -> List[List[Linea]]:
+    """Líneas (y, texto) de cada página del PDF, en orden.
+
+    Las páginas se extraen en paralelo en un pool de `workers` procesos (por
+    defecto, los núcleos disponibles) y el resultado de cada una se guarda en
+    `cache_dir`, en un directorio por huella SHA-256 del PDF y versión del
+    formato (`FORMATO_LINEAS`). Al volver a ejecutar con el mismo PDF solo se
+    extraen las páginas que falten; retocar el parser no obliga a releerlo.
+    `cache_dir=None` desactiva la caché.
+    """
+    pdf_path = str(pdf_path)
+    destino: Optional[Path] = None
+    if cache_dir is not None:
+        huella = hashlib.sha256(Path(pdf_path).read_bytes()).hexdigest()
+        destino = Path(cache_dir) / f"{huella}-v{FORMATO_LINEAS}"
+        destino.mkdir(parents=True, exist_ok=True)
+
+    indice = _leer_cache(destino / "paginas.json") if destino is not None else None
+    if isinstance(indice, dict) and isinstance(indice.get("paginas"), int):
+        n_paginas = indice["paginas"]
+    else:
+        n_paginas = _abrir_pdf(pdf_path).page_count
+        if destino is not None:
+            _escribir_atomico(destino / "paginas.json", {"paginas": n_paginas})
+
+    paginas: List[Optional[List[Linea]]] = [None] * n_paginas
+    if destino is not None:
+        for i in range(n_paginas):
+            data = _leer_cache(destino / f"{i:04d}.json")
+            if isinstance(data, list):
+                paginas[i] = [(y, texto) for y, texto in data]
+
+    pendientes = [i for i, lineas in enumerate(paginas) if lineas is None]
+    workers = min(workers or os.cpu_count() or 1, len(pendientes))
+    if workers > 1:
+        chunksize = max(1, len(pendientes) // (workers * 4))
+        with ProcessPoolExecutor(workers) as ex:
+            extraidas = list(ex.map(_lineas_pagina, repeat(pdf_path), pendientes, chunksize=chunksize))
+    else:
+        extraidas = [_lineas_pagina(pdf_path, i) for i in pendientes]
+
+    for i, lineas in zip(pendientes, extraidas, strict=True):
+        paginas[i] = lineas
+        if destino is not None:
+            _escribir_atomico(destino / f"{i:04d}.json", lineas)
+
+    print(f"Páginas: {n_paginas} ({n_paginas - len(pendientes)} desde caché, {len(pendientes)} extraídas)")
+    return paginas  # type: ignore[return-value]
+
+
+def extraer_iaf_nace_desde_pdf(paginas: Optional[List[List[Linea]]] = None):
+    """Sectores IAF de la tabla de la primera página.
+
+    `paginas` son las líneas de todas las páginas (`extraer_lineas`); si no
+    se pasan, se extraen (o se leen de la caché).
+    """
+    if paginas is None:
+        paginas = extraer_lineas(PDF_PATH)
+    lines = paginas[0]
+    sectores: List[dict] = []
+    warnings: List[str] = []
 
     # Separar líneas de encabezado, de sectores y de códigos
     sector_lines: List[Tuple[float, int, str]] = []  # (y, iaf, nombre/fragmentos)
@@ -245,14 +355,16 @@ def _normalize_nace_code(code: str) -> str:
     return f"{major}.{int(minor):02d}" if len(minor) == 2 or minor == "00" else f"{major}.{int(minor)}"
 
 
-def _extraer_descripciones(pdf_path: str) -> Dict[str, str]:
+def _extraer_descripciones(pdf_path: str, paginas: Optional[List[List[Linea]]] = None) -> Dict[str, str]:
     """Extrae títulos y CUERPOS completos para todos los niveles NACE.
 
     Detecta encabezados "NN Título" y "NN.N Título" y captura el texto
     subsiguiente (párrafos y viñetas) hasta el próximo encabezado válido.
-    Devuelve dict { codigo_nace -> texto_completo }.
+    Devuelve dict { codigo_nace -> texto_completo }. `paginas` son las
+    líneas de todas las páginas, como en `extraer_iaf_nace_desde_pdf`.
     """
-    doc = fitz.open(pdf_path)
+    if paginas is None:
+        paginas = extraer_lineas(pdf_path)
     desc: Dict[str, str] = {}
     HEAD_RE = re.compile(r"^\s*(\d{2}(?:\.\d{1,2})?)\s+(.+?)\s*$")
 
@@ -269,31 +381,7 @@ def _extraer_descripciones(pdf_path: str) -> Dict[str, str]:
         current_code = None
         buffer_lines = []
 
-    for i in range(1, doc.page_count):
-        page = doc[i]
-        words = page.get_text("words") or []
-        words.sort(key=lambda w: (round(w[1], 1), w[0]))
-        Y_TOL = 1.5
-        lines: List[Tuple[float, str]] = []
-        cur_y = None
-        cur_words: List[Tuple[float, str]] = []
-        for x0, y0, x1, y1, wtxt, *_ in words:
-            if cur_y is None or abs(y0 - cur_y) <= Y_TOL:
-                cur_y = y0 if cur_y is None else cur_y
-                cur_words.append((x0, wtxt))
-            else:
-                cur_words.sort(key=lambda t: t[0])
-                text_line = _norm_text(" ".join(t[1] for t in cur_words))
-                if text_line:
-                    lines.append((cur_y, text_line))
-                cur_y = y0
-                cur_words = [(x0, wtxt)]
-        if cur_words:
-            cur_words.sort(key=lambda t: t[0])
-            text_line = _norm_text(" ".join(t[1] for t in cur_words))
-            if text_line:
-                lines.append((cur_y, text_line))
-
+    for lines in paginas[1:]:
         for _y, raw in lines:
             line = raw
             u = line.upper()
@@ -319,43 +407,52 @@ def _extraer_descripciones(pdf_path: str) -> Dict[str, str]:
     return desc
 
 
-def _expandir_codigos(codigos: List[str], exclusiones: List[str], desc_map: Dict[str, str]) -> List[str]:
+# Claves de `desc_map` ordenadas, y la posición de cada una en `desc_map`
+IndiceCodigos = Tuple[List[str], Dict[str, int]]
+
+
+def _indice_codigos(desc_map: Dict[str, str]) -> IndiceCodigos:
+    return sorted(desc_map), {k: i for i, k in enumerate(desc_map)}
+
+
+def _expandir_codigos(
+    codigos: List[str], exclusiones: List[str], desc_map: Dict[str, str], indice: Optional[IndiceCodigos] = None
+) -> List[str]:
+    """Códigos descritos que empiezan por algún patrón de `codigos` y por ninguno de `exclusiones`.
+
+    `indice` es `_indice_codigos(desc_map)` (se calcula si no se pasa): en la
+    lista ordenada los códigos con un mismo prefijo son contiguos y cada
+    patrón se resuelve con una búsqueda binaria en lugar de recorrer todas
+    las claves.
+    """
+    ordenados, posicion = indice if indice is not None else _indice_codigos(desc_map)
     # Normalizar patrones (e.g., "1" -> "01")
     pats = [_normalize_nace_code(c) for c in codigos]
-    exps = [_normalize_nace_code(e) for e in exclusiones]
-
-    def excluded(c: str) -> bool:
-        for e in exps:
-            if c.startswith(e):
-                return True
-        return False
-
-    # Recolectar todas las descripciones cuyo código coincida por prefijo
-    out: List[str] = []
-    for p in pats:
-        for k in desc_map.keys():
-            if k.startswith(p) and not excluded(k):
-                out.append(k)
-
-    # Desduplicar manteniendo orden natural
-    seen = set()
-    unique: List[str] = []
-    for c in out:
-        if c not in seen:
-            seen.add(c)
-            unique.append(c)
+    exps = tuple(_normalize_nace_code(e) for e in exclusiones)
+
+    # Recolectar todas las descripciones cuyo código coincida por prefijo, con
+    # el orden de primera aparición (patrón, posición en `desc_map`)
+    encontrados: Dict[str, Tuple[int, int]] = {}
+    for n, p in enumerate(pats):
+        i = bisect.bisect_left(ordenados, p)
+        while i < len(ordenados) and ordenados[i].startswith(p):
+            k = ordenados[i]
+            if k not in encontrados and not k.startswith(exps):
+                encontrados[k] = (n, posicion[k])
+            i += 1
 
     def sort_key(c: str):
         if "." in c:
             a, b = c.split(".", 1)
-            return (int(a), int(b))
-        return (int(c), -1)
+            return (int(a), int(b), encontrados[c])
+        return (int(c), -1, encontrados[c])
 
-    unique.sort(key=sort_key)
-    return unique
+    return sorted(encontrados, key=sort_key)
 
 
-def _escribir_log_validacion(sectores: List[dict], desc_map: Dict[str, str], warnings: List[str]) -> None:
+def _escribir_log_validacion(
+    sectores: List[dict], desc_map: Dict[str, str], warnings: List[str], indice: Optional[IndiceCodigos] = None
+) -> None:
     total_codigos = 0
     con_desc = 0
     faltantes: List[str] = []
@@ -369,7 +466,7 @@ def _escribir_log_validacion(sectores: List[dict], desc_map: Dict[str, str], war
                 con_desc += 1
             else:
                 faltantes.append(f"IAF {s.get('codigo_iaf')}: {c}")
-        expanded = _expandir_codigos(base, exc, desc_map)
+        expanded = _expandir_codigos(base, exc, desc_map, indice)
         total_expand += len(expanded)
 
     lines: List[str] = []
@@ -395,26 +492,44 @@ def _escribir_log_validacion(sectores: List[dict], desc_map: Dict[str, str], war
         f.write("\n".join(lines) + "\n")
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Extrae el mapeo IAF→NACE del PDF")
+    parser.add_argument("--workers", type=int, default=None, help="procesos para extraer páginas (por defecto, núcleos)")
+    parser.add_argument("--no-cache", action="store_true", help=f"no leer ni escribir la caché de páginas ({CACHE_DIR})")
+    parser.add_argument("--no-artifacts", action="store_true", help="no generar los artefactos precompilados")
+    args = parser.parse_args(argv)
+
     print("Procesando PDF…")
-    sectores = extraer_iaf_nace_desde_pdf()
+    t0 = time.perf_counter()
+    # El PDF se lee una sola vez: la tabla IAF (página 1) y las descripciones salen de las mismas líneas
+    paginas = extraer_lineas(PDF_PATH, workers=args.workers, cache_dir=None if args.no_cache else CACHE_DIR)
+    print(f"Extracción de páginas: {time.perf_counter() - t0:.2f} s")
+    sectores = extraer_iaf_nace_desde_pdf(paginas)
 
     # Extraer descripciones de NACE desde páginas 2..N
-    desc_map = _extraer_descripciones(PDF_PATH)
+    desc_map = _extraer_descripciones(PDF_PATH, paginas)
 
     # Rellenar descripcion_nace en cada sector, expandiendo a todos los niveles
     warnings: List[str] = []
+    indice = _indice_codigos(desc_map)
     for s in sectores:
-        expanded = _expandir_codigos(s.get("codigos_nace", []), s.get("exclusiones", []), desc_map)
+        expanded = _expandir_codigos(s.get("codigos_nace", []), s.get("exclusiones", []), desc_map, indice)
         desclist = [{"codigo": c, "descripcion": desc_map[c]} for c in expanded if c in desc_map]
         s["descripcion_nace"] = desclist
 
     # Escribir log de validación
-    _escribir_log_validacion(sectores, desc_map, warnings)
+    _escribir_log_validacion(sectores, desc_map, warnings, indice)
 
     guardar_json(sectores)
     print(f"\u2705 JSON generado en {OUTPUT_JSON} con {len(sectores)} sectores IAF procesados.")
 
+    # Artefactos listos para servir, con la huella del JSON recién escrito
+    if not args.no_artifacts:
+        from iaf_nace_classifier.snapshot import build_snapshot
+
+        manifest = build_snapshot(OUTPUT_JSON.read_bytes(), ARTIFACTS_DIR)
+        print(f"\u2705 Artefactos {manifest['key']} generados en {ARTIFACTS_DIR}")
+
 
 if __name__ == "__main__":
     main()
@@ -3,12 +3,51 @@ IAF–NACE classifier utilities.
 
 Primary entrypoints:
 - classify_nace(code): returns matching IAF sector for a NACE code
+- classify_nace_many(codes): classifies many NACE codes via the precompiled lookup table
 - load_mapping(path=None): loads mapping from JSON (defaults to repo file)
 - buscar_actividad(query): searches NACE codes by activity description
+- buscar_actividades(queries): batch version of buscar_actividad, results in input order
+- iter_buscar_actividad(queries) / iter_classify_nace(codes): lazy, constant-memory versions
+- sugerir(query): autocomplete suggestions (word completions and matching activities)
+- SearchIndex(mapping): precompiled search structures reused across queries
+
+Submodules are imported on first access to one of these names, so
+`import iaf_nace_classifier` stays cheap for callers that only need part of it.
 """
 
-from .mapping import load_mapping, classify_nace
-from .search import buscar_actividad
+import importlib
+from typing import TYPE_CHECKING, Any, List
+
+if TYPE_CHECKING:
+    from .index import SearchIndex  # noqa: F401
+    from .mapping import classify_nace, classify_nace_many, iter_classify_nace, load_mapping  # noqa: F401
+    from .search import buscar_actividad, buscar_actividades, iter_buscar_actividad  # noqa: F401
+    from .suggest import sugerir  # noqa: F401
+
+# Public name -> submodule that defines it
+_EXPORTS = {
+    "load_mapping": "mapping",
+    "classify_nace": "mapping",
+    "classify_nace_many": "mapping",
+    "iter_classify_nace": "mapping",
+    "buscar_actividad": "search",
+    "buscar_actividades": "search",
+    "iter_buscar_actividad": "search",
+    "sugerir": "suggest",
+    "SearchIndex": "index",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
 
-__all__ = ["load_mapping", "classify_nace", "buscar_actividad"]
 
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
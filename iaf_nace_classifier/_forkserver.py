@@ -0,0 +1,16 @@
+"""
+Módulo que importa el proceso forkserver de `ScoringPool` al arrancar.
+
+Precarga el mapeo con `pool.precargar_forkserver()` para que los workers,
+que son forks del forkserver, lo hereden (ver `pool`). No se importa en
+ningún otro proceso.
+"""
+
+from .pool import precargar_forkserver
+
+try:
+    precargar_forkserver()
+except Exception:
+    # El forkserver solo tolera ImportError en sus precargas; si esto falla,
+    # cada worker carga el mapeo en su inicializador
+    pass
@@ -7,24 +7,115 @@ Dependencias:
 Ejecutar:
   uvicorn iaf_nace_classifier.api:app --reload
 
+Varios workers compartiendo el índice (construido una vez antes del fork):
+  IAF_NACE_PRELOAD=1 gunicorn --preload -w 16 -k uvicorn.workers.UvicornWorker iaf_nace_classifier.api:app
+
+Por defecto el mapeo y los índices no se cargan al importar el módulo: se
+construyen en segundo plano al arrancar. /health responde desde el primer
+momento y /ready devuelve 503 hasta que los índices están listos; las
+peticiones que llegan antes esperan hasta IAF_NACE_WARMUP_WAIT segundos
+(por defecto 30) y, si no, reciben 503 con Retry-After.
+
 Endpoints:
   - GET /health
+  - GET /ready
   - GET /classify?code=24.46
   - POST /classify  body: {"code": "24.46"}
+  - GET /search?q=restaurante
+  - GET /suggest?q=fabric  (autocompletado, sin puntuar; ver `suggest`)
+  - POST /search/batch  body: {"queries": ["restaurante", "venta de ropa"], "top_n": 5}
+  - GET /cache/stats
+  - GET /synonyms  (versión de la tabla de sinónimos en uso)
+  - GET /pool/stats
+  - GET /metrics  (formato Prometheus; etapas de búsqueda con IAF_NACE_METRICS=1)
+  - POST /admin/reload  (cabecera X-Admin-Token; requiere IAF_NACE_ADMIN_TOKEN)
+  - GET /overlay  (descripciones y alias propios en uso)
+  - PUT /overlay/descriptions/{code}  body: {"descripcion": "...", "codigo_iaf": 17}  (admin)
+  - DELETE /overlay/descriptions/{code}  (retira el código de la búsqueda; admin)
+  - POST /overlay/aliases/{code}  body: {"alias": "..."}  (admin)
+  - DELETE /overlay/aliases/{code}?alias=...  (admin)
+  - DELETE /overlay/{code}  (descarta los cambios del código; admin)
+
+Las búsquedas se puntúan en un pool de procesos (ver `pool.ScoringPool` y las
+variables IAF_NACE_POOL_*); con el pool lleno se responde 503 con Retry-After.
+
+Recarga en caliente: el mapeo (IAF_NACE_MAPPING o el del paquete) se vuelve a
+cargar con POST /admin/reload o, con IAF_NACE_RELOAD_INTERVAL=<segundos>,
+cuando cambia el archivo. El mapeo y los índices nuevos se construyen en
+segundo plano, se reinicia el pool y solo entonces se publican con un número
+de versión nuevo (ver `preload.Warmup.reload`); las peticiones en curso
+terminan con la versión anterior. La tabla de sinónimos se recarga sola (ver
+`synonyms`) y también con /admin/reload.
+
+Descripciones y alias propios: /overlay añade, sustituye o retira entradas
+`descripcion_nace` y alias sin tocar el JSON (ver `overlay`). Cada cambio
+actualiza solo esas entradas del índice y se guarda en IAF_NACE_OVERLAY si
+está definido; se mantiene tras las recargas del mapeo.
 """
 
-from typing import Any, Dict, List, Optional
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+import hmac
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
 
-from . import load_mapping, classify_nace
-from .search import buscar_actividad
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, Field
 
+from . import classify_nace, metrics, synonyms
+from .overlay import Overlay
+from .overlay import cargar as cargar_overlay
+from .pool import PoolSaturado, ScoringPool
+from .preload import ReloadInProgress, Warmup
+from .search import buscar_actividad, buscar_actividades, cache_info
+from .suggest import sugerir
 
-app = FastAPI(title="IAF–NACE Classifier API", version="0.1.0")
+# Carga del mapeo e índices: en segundo plano al arrancar, o al importar con
+# IAF_NACE_PRELOAD=1 (para que `gunicorn --preload` los construya antes del fork)
+WARMUP = Warmup(os.environ.get("IAF_NACE_MAPPING") or None)
+WARMUP_WAIT = float(os.environ.get("IAF_NACE_WARMUP_WAIT", "30"))
+# Segundos entre comprobaciones del archivo de mapeo (0: sin recarga automática)
+RELOAD_INTERVAL = float(os.environ.get("IAF_NACE_RELOAD_INTERVAL", "0"))
+# Token de /admin/reload y de los cambios en /overlay; sin él están deshabilitados
+ADMIN_TOKEN = os.environ.get("IAF_NACE_ADMIN_TOKEN")
+
+# Descripciones y alias propios sobre el mapeo (persistidos en IAF_NACE_OVERLAY si está definido)
+OVERLAY: Overlay = (
+    cargar_overlay(os.environ["IAF_NACE_OVERLAY"]) if os.environ.get("IAF_NACE_OVERLAY") else Overlay()
+)
+_OVERLAY_LOCK = threading.Lock()
+# Tras recargar el mapeo, el overlay se aplica al nuevo antes de publicarlo
+WARMUP.reload_hooks.append(lambda mapping: OVERLAY.aplicado(mapping))
+if os.environ.get("IAF_NACE_PRELOAD") == "1":
+    WARMUP.run()
+
+
+# Pool de puntuación; None si IAF_NACE_POOL_WORKERS=0 (se puntúa en el thread pool de FastAPI)
+POOL: Optional[ScoringPool] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global POOL
+    WARMUP.start()
+    POOL = ScoringPool.from_env(WARMUP.mapping_path)
+    if POOL is not None:
+        # Workers nuevos con el mapeo recargado antes de publicarlo
+        WARMUP.reload_hooks.append(POOL.reiniciar)
+    WARMUP.watch(RELOAD_INTERVAL)
+    yield
+    if POOL is not None:
+        WARMUP.reload_hooks.remove(POOL.reiniciar)
+        POOL.shutdown()
+
+
+app = FastAPI(title="IAF–NACE Classifier API", version="0.1.0", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -35,10 +126,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+REQUEST_SECONDS = metrics.histogram("iaf_nace_http_request_seconds", "Latencia de las peticiones HTTP")
+
+
+@app.middleware("http")
+async def medir_latencia(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Ruta de la plantilla (/search), no la URL concreta, para acotar las etiquetas
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        {"method": request.method, "path": getattr(route, "path", "other"), "status": str(response.status_code)},
+    )
+    return response
+
+
 class ClassifyRequest(BaseModel):
     code: str
 
 
+# Máximo de queries por petición a /search/batch
+MAX_BATCH_QUERIES = 5000
+# Resultados por query: los que devuelve /search, y el máximo en /search/batch
+MAX_TOP_N = 20
+
+
+class SearchBatchRequest(BaseModel):
+    queries: List[str] = Field(..., max_length=MAX_BATCH_QUERIES)
+    top_n: int = Field(MAX_TOP_N, ge=1, le=MAX_TOP_N)
+    # Si es False se omite `descripcion_completa` para aligerar la respuesta
+    include_descriptions: bool = True
+
+
 def _get_sector(mapping, codigo_iaf: Optional[int]) -> Optional[Dict[str, Any]]:
     if codigo_iaf is None:
         return None
@@ -48,36 +168,98 @@ def _get_sector(mapping, codigo_iaf: Optional[int]) -> Optional[Dict[str, Any]]:
     return None
 
 
-MAPPING = load_mapping()
+def _mapping(overlay: Optional[Overlay] = None) -> List[Dict[str, Any]]:
+    """Mapeo cargado con `overlay` (por defecto, el vigente) aplicado.
+
+    Espera al calentamiento o responde 503 si no termina a tiempo.
+    """
+    if overlay is None:
+        overlay = OVERLAY
+    try:
+        mapping = WARMUP.wait(WARMUP_WAIT)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail="Error cargando el mapeo") from e
+    if mapping is None:
+        raise HTTPException(status_code=503, detail="Cargando índices", headers={"Retry-After": "1"})
+    return overlay.aplicado(mapping)
+
+
+async def _mapping_async(overlay: Optional[Overlay] = None) -> List[Dict[str, Any]]:
+    if overlay is None:
+        overlay = OVERLAY
+    if WARMUP.ready:
+        return overlay.aplicado(WARMUP.mapping)
+    return await run_in_threadpool(_mapping, overlay)
+
+
+def _saturado(e: PoolSaturado) -> HTTPException:
+    return HTTPException(status_code=503, detail=f"Servidor saturado: {e}", headers={"Retry-After": "1"})
+
+
+def __getattr__(name: str) -> Any:
+    # Compatibilidad: `api.MAPPING` sigue disponible, pero se carga bajo demanda
+    if name == "MAPPING":
+        return _mapping()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "sectors": len(MAPPING)}
+    """Liveness: responde aunque los índices aún se estén cargando."""
+    return {
+        "status": "ok",
+        "ready": WARMUP.ready,
+        "version": WARMUP.version,
+        "sectors": len(WARMUP.mapping) if WARMUP.ready else None,
+    }
 
 
+@app.get("/ready")
+def ready():
+    """Readiness: 200 cuando el mapeo y los índices están cargados, 503 mientras tanto."""
+    status = WARMUP.status()
+    if not WARMUP.ready:
+        return JSONResponse(status_code=503, content=status, headers={"Retry-After": "1"})
+    status["sectors"] = len(WARMUP.mapping)
+    return status
+
+
+# Clasificar es una consulta a una tabla precompilada: se resuelve en el bucle
+# de eventos, sin pasar por ningún pool
 @app.get("/classify")
-def classify_get(code: str = Query(..., description="Código NACE, p. ej. 24.46 o 47")):
-    res = classify_nace(code, MAPPING)
+async def classify_get(code: str = Query(..., description="Código NACE, p. ej. 24.46 o 47")):
+    mapping = await _mapping_async()
+    res = classify_nace(code, mapping)
     if not res:
         raise HTTPException(status_code=404, detail="No match found")
-    sector = _get_sector(MAPPING, res.get("codigo_iaf"))
+    sector = _get_sector(mapping, res.get("codigo_iaf"))
     return {"input": code, "result": res, "sector": sector}
 
 
 @app.post("/classify")
-def classify_post(body: ClassifyRequest):
-    res = classify_nace(body.code, MAPPING)
+async def classify_post(body: ClassifyRequest):
+    mapping = await _mapping_async()
+    res = classify_nace(body.code, mapping)
     if not res:
         raise HTTPException(status_code=404, detail="No match found")
-    sector = _get_sector(MAPPING, res.get("codigo_iaf"))
+    sector = _get_sector(mapping, res.get("codigo_iaf"))
     return {"input": body.code, "result": res, "sector": sector}
 
 
 @app.get("/search")
-def search(q: str = Query(..., min_length=2, description="Texto a buscar")):
+async def search(q: str = Query(..., min_length=2, description="Texto a buscar")):
     """Busca códigos NACE por descripción de actividad."""
-    response = buscar_actividad(q, mapping=MAPPING, top_n=20)
+    # Un cambio en /overlay sustituye OVERLAY: la petición usa el mismo overlay
+    # para su mapeo (clave de caché) y para los workers del pool
+    overlay = OVERLAY
+    mapping = await _mapping_async(overlay)
+    if POOL is None:
+        response = await run_in_threadpool(buscar_actividad, q, mapping=mapping, top_n=MAX_TOP_N)
+    else:
+        try:
+            response = await POOL.buscar(q, top_n=MAX_TOP_N, mapping=mapping, overlay=overlay.estado())
+        except PoolSaturado as e:
+            raise _saturado(e) from e
     return {
         "query": q,
         "results": response['results'],
@@ -85,6 +267,192 @@ def search(q: str = Query(..., min_length=2, description="Texto a buscar")):
     }
 
 
+# Autocompletado: búsquedas por prefijo en listas ordenadas, sin pasar por el
+# pool. Es síncrono para que la primera llamada, que construye las listas, no
+# bloquee el bucle de eventos
+@app.get("/suggest")
+def suggest(
+    q: str = Query(..., min_length=2, description="Texto escrito hasta ahora"),
+    limit: int = Query(8, ge=1, le=50, description="Sugerencias de cada tipo como máximo"),
+):
+    """Completa la última palabra de la query y propone actividades cuyo título o código empieza por ella."""
+    return {"query": q, **sugerir(q, mapping=_mapping(), limite=limit)}
+
+
+@app.post("/search/batch")
+async def search_batch(body: SearchBatchRequest):
+    """Busca varias descripciones de actividad en una sola petición (resultados en orden)."""
+    overlay = OVERLAY
+    mapping = await _mapping_async(overlay)
+    if POOL is None:
+        responses = await run_in_threadpool(buscar_actividades, body.queries, mapping=mapping, top_n=body.top_n)
+    else:
+        try:
+            responses = await POOL.buscar_lote(body.queries, top_n=body.top_n, overlay=overlay.estado())
+        except PoolSaturado as e:
+            raise _saturado(e) from e
+    items = []
+    for q, response in zip(body.queries, responses, strict=True):
+        if not body.include_descriptions:
+            for r in response['results'] + response['excluded']:
+                r.pop('descripcion_completa', None)
+        items.append({"query": q, "results": response['results'], "excluded": response['excluded']})
+    return {"count": len(items), "items": items}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Contadores de la caché de resultados de búsqueda."""
+    return cache_info()
+
+
+@app.get("/synonyms")
+def synonyms_info():
+    """Versión, origen y tamaño de la tabla de sinónimos (se recarga sola si cambia el archivo)."""
+    return synonyms.info()
+
+
+def _recargar() -> Dict[str, Any]:
+    tabla = synonyms.recargar()
+    info = WARMUP.reload()
+    info["sectors"] = len(WARMUP.mapping)
+    info["synonyms_version"] = tabla.version
+    return info
+
+
+def _exigir_admin(token: Optional[str]) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Administración deshabilitada: define IAF_NACE_ADMIN_TOKEN")
+    if token is None or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Token de administración no válido")
+
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: Optional[str] = Header(None)):
+    """Recarga el mapeo, los índices y los sinónimos sin reiniciar el servidor."""
+    _exigir_admin(x_admin_token)
+    try:
+        return await run_in_threadpool(_recargar)
+    except ReloadInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"}) from e
+    except (OSError, ValueError) as e:
+        # Mapeo o sinónimos no válidos: se sigue sirviendo la versión anterior
+        raise HTTPException(status_code=500, detail=f"Recarga fallida: {type(e).__name__}: {e}") from e
+
+
+class OverlayDescription(BaseModel):
+    descripcion: str
+    codigo_iaf: Optional[int] = None
+
+
+class OverlayAlias(BaseModel):
+    alias: str
+
+
+def _modificar_overlay(cambio: Callable[[Overlay], Any]) -> Dict[str, Any]:
+    """Aplica `cambio` a una copia del overlay, la valida contra el mapeo y la adopta."""
+    global OVERLAY
+    base = WARMUP.wait(WARMUP_WAIT)
+    if base is None:
+        raise HTTPException(status_code=503, detail="Cargando índices", headers={"Retry-After": "1"})
+    with _OVERLAY_LOCK:
+        nuevo = OVERLAY.copia()
+        try:
+            cambio(nuevo)
+            nuevo.version = OVERLAY.version + 1
+            # Deja listos el mapeo y el índice incremental de la versión nueva
+            nuevo.aplicado(base)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e)) from e
+        nuevo.path = OVERLAY.path
+        if nuevo.path is not None:
+            nuevo.guardar()
+        OVERLAY = nuevo
+    return {"version": nuevo.version, "entries": len(nuevo)}
+
+
+@app.get("/overlay")
+def overlay_info():
+    """Descripciones y alias propios aplicados sobre el mapeo."""
+    return {"version": OVERLAY.version, "entries": len(OVERLAY), **OVERLAY.to_dict()}
+
+
+@app.put("/overlay/descriptions/{code}")
+async def overlay_put_description(code: str, body: OverlayDescription, x_admin_token: Optional[str] = Header(None)):
+    """Sustituye la descripción de un código NACE, o la añade si el mapeo no lo tiene."""
+    _exigir_admin(x_admin_token)
+    return await run_in_threadpool(
+        _modificar_overlay, lambda o: o.poner_descripcion(code, body.descripcion, body.codigo_iaf)
+    )
+
+
+@app.delete("/overlay/descriptions/{code}")
+async def overlay_delete_description(code: str, x_admin_token: Optional[str] = Header(None)):
+    """Retira un código NACE de los resultados de búsqueda."""
+    _exigir_admin(x_admin_token)
+    return await run_in_threadpool(_modificar_overlay, lambda o: o.retirar(code))
+
+
+@app.post("/overlay/aliases/{code}")
+async def overlay_add_alias(code: str, body: OverlayAlias, x_admin_token: Optional[str] = Header(None)):
+    """Añade un nombre alternativo a la actividad de un código NACE."""
+    _exigir_admin(x_admin_token)
+    return await run_in_threadpool(_modificar_overlay, lambda o: o.agregar_alias(code, body.alias))
+
+
+def _exigir(encontrado: bool, detalle: str) -> None:
+    if not encontrado:
+        raise HTTPException(status_code=404, detail=detalle)
+
+
+@app.delete("/overlay/aliases/{code}")
+async def overlay_delete_alias(code: str, alias: str = Query(...), x_admin_token: Optional[str] = Header(None)):
+    _exigir_admin(x_admin_token)
+    return await run_in_threadpool(
+        _modificar_overlay, lambda o: _exigir(o.quitar_alias(code, alias), "Alias no encontrado")
+    )
+
+
+@app.delete("/overlay/{code}")
+async def overlay_restore(code: str, x_admin_token: Optional[str] = Header(None)):
+    """Descarta los cambios de un código (vuelve a la entrada del mapeo base)."""
+    _exigir_admin(x_admin_token)
+    return await run_in_threadpool(
+        _modificar_overlay, lambda o: _exigir(o.restaurar(code), "El código no tiene cambios")
+    )
+
+
+_CACHE_GAUGES = {
+    key: metrics.gauge(f"iaf_nace_search_cache_{key}", f"Caché de resultados: {key}")
+    for key in ("hits", "misses", "evictions", "size")
+}
+_POOL_GAUGES = {
+    key: metrics.gauge(f"iaf_nace_pool_{key}", f"Pool de puntuación: {key}")
+    for key in ("pending", "rejected", "workers", "restarts")
+}
+_VERSION_GAUGE = metrics.gauge("iaf_nace_mapping_version", "Versión del mapeo publicado (sube con cada recarga)")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus."""
+    _VERSION_GAUGE.set(WARMUP.version)
+    info = cache_info()
+    for key, gauge in _CACHE_GAUGES.items():
+        gauge.set(info[key])
+    if POOL is not None:
+        stats = POOL.stats()
+        for key, gauge in _POOL_GAUGES.items():
+            gauge.set(stats[key])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/pool/stats")
+def pool_stats():
+    """Estado del pool de puntuación: tareas pendientes, máximo y rechazadas."""
+    return POOL.stats() if POOL is not None else {"kind": None}
+
+
 # Mount static files
 static_path = Path(__file__).parent.parent / "static"
 if static_path.exists():
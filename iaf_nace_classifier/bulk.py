@@ -0,0 +1,257 @@
+"""
+Bulk classification of activity descriptions from CSV/JSONL files.
+
+Reads one activity description per row, classifies the rows with
+`buscar_actividades` across a pool of worker processes and writes the rows
+back, in input order, with the top NACE/IAF codes and scores appended.
+
+Where the platform can fork, the parent builds the mapping and search index
+once (`preload.preload`) and the workers inherit them; otherwise each worker
+loads them once, when it starts. Rows are sent to the workers in chunks and
+only a bounded number of chunks is in flight at any time, so memory use does
+not grow with the input.
+
+Usage:
+  iaf-nace-search empresas.csv --column actividad -o clasificadas.csv --workers 16
+  iaf-nace-search registro.jsonl --column descripcion --top 5 > salida.jsonl
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import IO, Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .index import SearchIndex, get_search_index
+from .mapping import load_mapping
+from .preload import preload
+from .search import buscar_actividades
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_TOP = 3
+
+# (codigo_nace, codigo_iaf, nombre_iaf, relevancia)
+Match = Tuple[str, Any, str, float]
+
+# Index of the current worker process, built once by `_init_worker`
+_WORKER_INDEX: Optional[SearchIndex] = None
+_WORKER_ENGINE: Optional[str] = None
+
+
+def _build_index(mapping_path: Optional[str]) -> SearchIndex:
+    if mapping_path is None:
+        return get_search_index()
+    return get_search_index(load_mapping(mapping_path))
+
+
+def _init_worker(mapping_path: Optional[str], engine: Optional[str], index: Optional[SearchIndex] = None) -> None:
+    global _WORKER_INDEX, _WORKER_ENGINE
+    # A forked worker receives the parent's preloaded index as-is (no pickling)
+    _WORKER_INDEX = index if index is not None else _build_index(mapping_path)
+    _WORKER_ENGINE = engine
+
+
+def _fork_context() -> Optional[Any]:
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def classify_queries(
+    queries: List[str], top: int, index: Optional[SearchIndex] = None, engine: Optional[str] = None
+) -> List[List[Match]]:
+    """Top `top` matches for each query, as compact tuples."""
+    if index is None:
+        index = _WORKER_INDEX
+        engine = _WORKER_ENGINE
+    responses = buscar_actividades(queries, index=index, top_n=top, engine=engine)
+    return [
+        [(r['codigo_nace'], r['codigo_iaf'], r['nombre_iaf'], r['relevancia']) for r in resp['results']]
+        for resp in responses
+    ]
+
+
+def _detect_format(path: str, explicit: Optional[str]) -> str:
+    if explicit:
+        return explicit
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def read_rows(fh: IO[str], fmt: str, column: Optional[str]) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """Yield (record, query) pairs lazily from a CSV (with header) or JSONL stream."""
+    if fmt == "jsonl":
+        field = column or "query"
+        for lineno, line in enumerate(fh, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise SystemExit(f"Line {lineno}: invalid JSON: {e}") from e
+            if not isinstance(record, dict):
+                raise SystemExit(f"Line {lineno}: not a JSON object ({type(record).__name__})")
+            yield record, str(record.get(field) or "")
+        return
+
+    reader = csv.DictReader(fh)
+    if not reader.fieldnames:
+        return
+    field = column or reader.fieldnames[0]
+    if field not in reader.fieldnames:
+        raise SystemExit(f"Column {field!r} not found in CSV header: {', '.join(reader.fieldnames)}")
+    for record in reader:
+        yield record, record.get(field) or ""
+
+
+def _chunks(rows: Iterable[Tuple[Dict[str, Any], str]], size: int) -> Iterator[List[Tuple[Dict[str, Any], str]]]:
+    chunk: List[Tuple[Dict[str, Any], str]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _result_columns(top: int) -> List[str]:
+    cols = []
+    for i in range(1, top + 1):
+        cols += [f"nace_{i}", f"iaf_{i}", f"score_{i}"]
+    return cols
+
+
+class _Writer:
+    def __init__(self, fh: IO[str], fmt: str, top: int):
+        self.fh = fh
+        self.fmt = fmt
+        self.top = top
+        self._csv: Optional[csv.DictWriter] = None
+
+    def write(self, record: Dict[str, Any], matches: List[Match]) -> None:
+        if self.fmt == "jsonl":
+            out = dict(record)
+            out["resultados"] = [
+                {"codigo_nace": n, "codigo_iaf": i, "nombre_iaf": name, "relevancia": round(s, 2)}
+                for n, i, name, s in matches
+            ]
+            self.fh.write(json.dumps(out, ensure_ascii=False) + "\n")
+            return
+
+        if self._csv is None:
+            fields = list(record) + [c for c in _result_columns(self.top) if c not in record]
+            self._csv = csv.DictWriter(self.fh, fieldnames=fields, extrasaction="ignore")
+            self._csv.writeheader()
+        row = dict(record)
+        for pos, (n, i, _name, s) in enumerate(matches, start=1):
+            row[f"nace_{pos}"] = n
+            row[f"iaf_{pos}"] = i
+            row[f"score_{pos}"] = f"{s:.2f}"
+        self._csv.writerow(row)
+
+
+def classify_file(
+    fin: IO[str],
+    fout: IO[str],
+    in_format: str = "csv",
+    out_format: Optional[str] = None,
+    column: Optional[str] = None,
+    top: int = DEFAULT_TOP,
+    workers: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    mapping_path: Optional[str] = None,
+    engine: Optional[str] = None,
+) -> int:
+    """Classify every row of `fin` and write it to `fout`. Returns the number of rows."""
+    writer = _Writer(fout, out_format or in_format, top)
+    chunks = _chunks(read_rows(fin, in_format, column), chunk_size)
+    total = 0
+
+    if workers <= 1:
+        index = _build_index(mapping_path)
+        for chunk in chunks:
+            matches = classify_queries([q for _, q in chunk], top, index=index, engine=engine)
+            for (record, _), m in zip(chunk, matches, strict=True):
+                writer.write(record, m)
+            total += len(chunk)
+        return total
+
+    # Keep a bounded window of chunks in flight and write them back in order
+    max_in_flight = workers * 2
+    pending: Deque[Tuple[List[Tuple[Dict[str, Any], str]], Future]] = deque()
+    ctx = _fork_context()
+    shared_index = get_search_index(preload(mapping_path, engine)) if ctx is not None else None
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(mapping_path, engine, shared_index)
+    ) as pool:
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(classify_queries, [q for _, q in chunk], top)))
+            while len(pending) >= max_in_flight:
+                total += _drain_one(pending, writer)
+        while pending:
+            total += _drain_one(pending, writer)
+    return total
+
+
+def _drain_one(pending: Deque[Tuple[List[Tuple[Dict[str, Any], str]], Future]], writer: _Writer) -> int:
+    chunk, future = pending.popleft()
+    for (record, _), m in zip(chunk, future.result(), strict=True):
+        writer.write(record, m)
+    return len(chunk)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Bulk IAF–NACE classification of activity descriptions (CSV or JSONL)"
+    )
+    parser.add_argument("input", help="Input file (.csv with header, or .jsonl); '-' for stdin")
+    parser.add_argument("--output", "-o", default="-", help="Output file (default: stdout)")
+    parser.add_argument(
+        "--column", "-c", default=None,
+        help="CSV column / JSONL field with the activity text (default: first CSV column, 'query' in JSONL)",
+    )
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="Input format (default: by extension)")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], default=None, help="Output format (default: input format)")
+    parser.add_argument("--top", "-t", type=int, default=DEFAULT_TOP, help="Number of NACE codes per row")
+    parser.add_argument(
+        "--workers", "-w", type=int, default=os.cpu_count() or 1, help="Worker processes (1 = no pool)"
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per task sent to a worker")
+    parser.add_argument("--mapping", "-m", default=None, help="Path to mapping JSON (defaults to packaged file)")
+    parser.add_argument("--engine", choices=["python", "numpy"], default=None, help="Scoring engine (default: python)")
+    args = parser.parse_args(argv)
+
+    in_format = _detect_format(args.input, args.format)
+    fin = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+    fout = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    start = time.perf_counter()
+    try:
+        total = classify_file(
+            fin, fout,
+            in_format=in_format,
+            out_format=args.output_format,
+            column=args.column,
+            top=args.top,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            mapping_path=args.mapping,
+            engine=args.engine,
+        )
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+    elapsed = time.perf_counter() - start
+    print(f"{total} rows classified in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} rows/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,443 @@
+"""
+Índice de búsqueda precompilado para `buscar_actividad`.
+
+`calcular_relevancia` vuelve a normalizar, separar y tokenizar cada descripción
+NACE en cada consulta. Nada de ese trabajo depende de la consulta, así que el
+índice lo hace una única vez por mapeo y guarda, para cada descripción, el
+título y cuerpo normalizados y los segmentos de la cláusula de exclusión.
+
+Las palabras y bigramas de todas las descripciones forman un vocabulario con
+identificadores enteros. Para cada término, el índice guarda como bitset
+(un `int` de Python cuyo bit i corresponde al documento de ordinal i) los
+documentos que lo contienen en el título y en el cuerpo. Las coincidencias de
+una palabra de consulta (como palabra completa o como subcadena, la semántica
+`palabra in texto` del cálculo original) se resuelven así con OR y AND sobre
+enteros en lugar de comparar cadenas documento a documento; un índice de
+trigramas sobre el vocabulario localiza las palabras que contienen a otra.
+
+Los segmentos de exclusión también tienen identificador, con una lista
+invertida palabra → segmentos: los que penalizan a una consulta se obtienen
+contando, sin recorrer los documentos.
+"""
+
+import copy
+import itertools
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .mapping import _PerMappingCache
+from .text import bigramas, normalizar_texto, palabras_significativas, separar_exclusion, tokenizar
+
+_SEGMENT_SPLIT_RE = re.compile(r'[,;]|\by\b')
+
+# Longitud de los n-gramas de caracteres del índice de subcadenas. Las palabras
+# de consulta tienen siempre más de 2 letras, así que cada una tiene al menos uno.
+NGRAM_SIZE = 3
+_SUBSTRING_CACHE_SIZE = 8192
+
+# Cada índice recibe un número de versión distinto; las cachés de resultados
+# lo incluyen en la clave para no servir resultados de otro mapeo.
+_VERSIONS = itertools.count(1)
+
+
+@dataclass(frozen=True)
+class IndexedDocument:
+    """Datos precalculados de una descripción NACE."""
+
+    ordinal: int
+    codigo_iaf: Any
+    nombre_iaf: str
+    codigo_nace: str
+    descripcion: str
+    nace_div: int
+    title: str
+    body: str
+    # (palabras, texto) de los segmentos de exclusión que pueden penalizar: ya
+    # sin los contenidos en la parte positiva del título (ver `build_document`)
+    exclusion_segments: Tuple[Tuple[FrozenSet[str], str], ...]
+
+
+def _nace_division(codigo_nace: Optional[str]) -> int:
+    # Extraer división NACE (primeros 2 dígitos)
+    try:
+        return int(codigo_nace.split('.')[0])
+    except (AttributeError, ValueError, IndexError):
+        return 0
+
+
+def build_document(
+    ordinal: int,
+    codigo_iaf: Any,
+    nombre_iaf: str,
+    codigo_nace: str,
+    descripcion: str,
+    alias: Sequence[str] = (),
+) -> IndexedDocument:
+    """Precalcula las estructuras de búsqueda de una descripción NACE.
+
+    `alias` son nombres alternativos de la actividad: se indexan como parte
+    del título (el motor "reference", que puntúa `descripcion`, no los ve).
+    """
+    desc_norm, exclusion_text = separar_exclusion(normalizar_texto(descripcion))
+
+    # Separar título (primera línea) del cuerpo
+    parts = desc_norm.split('\n', 1)
+    title = parts[0]
+    body = parts[1] if len(parts) > 1 else ""
+
+    segments: List[Tuple[FrozenSet[str], str]] = []
+    if exclusion_text:
+        # Parte positiva del título (antes de "excepto"). Un segmento contenido
+        # en ella excluye algo que el propio título afirma ser (una refinación,
+        # "...de frutas, excepto frutas confitadas") y nunca penaliza: se descarta
+        # aquí, ya que no depende de la query
+        positive_title_words = frozenset(palabras_significativas(title.split('excepto')[0]))
+        # Segmentos de exclusión separados por comas o 'y'
+        for segmento in _SEGMENT_SPLIT_RE.split(exclusion_text):
+            seg_words = frozenset(map(sys.intern, palabras_significativas(segmento)))
+            if seg_words and not seg_words <= positive_title_words:
+                segments.append((seg_words, segmento.strip()))
+
+    if alias:
+        title = " ".join([title, *(normalizar_texto(a) for a in alias)]).strip()
+
+    return IndexedDocument(
+        ordinal=ordinal,
+        codigo_iaf=codigo_iaf,
+        nombre_iaf=nombre_iaf,
+        codigo_nace=codigo_nace,
+        descripcion=descripcion,
+        nace_div=_nace_division(codigo_nace),
+        title=title,
+        body=body,
+        exclusion_segments=tuple(segments),
+    )
+
+
+class SearchIndex:
+    """Descripciones NACE de un mapeo, preparadas para puntuar consultas.
+
+    Se construye una vez con `SearchIndex(mapping)` (o `get_search_index`) y
+    se reutiliza en todas las búsquedas sobre ese mapeo. Los documentos se
+    guardan en el mismo orden en que aparecen en el mapeo, que es el orden de
+    desempate de resultados con igual relevancia.
+    """
+
+    def __init__(self, mapping: List[Dict[str, Any]]):
+        self.version = next(_VERSIONS)
+        documents: List[IndexedDocument] = []
+        for sector in mapping:
+            codigo_iaf = sector.get('codigo_iaf')
+            nombre_iaf = sector.get('nombre_iaf', '')
+            for desc_obj in sector.get('descripcion_nace', []):
+                documents.append(build_document(
+                    len(documents),
+                    codigo_iaf,
+                    nombre_iaf,
+                    desc_obj.get('codigo'),
+                    desc_obj.get('descripcion', ''),
+                    desc_obj.get('alias', ()),
+                ))
+        self.documents: Tuple[IndexedDocument, ...] = tuple(documents)
+        n_docs = len(documents)
+
+        # Vocabulario de palabras y de bigramas (término → id) y, por id, los
+        # ordinales de los documentos que lo contienen en título y en cuerpo
+        self.vocabulario: Dict[str, int] = {}
+        self.vocabulario_bigramas: Dict[str, int] = {}
+        title_postings: List[List[int]] = []
+        body_postings: List[List[int]] = []
+        title_bigram_postings: List[List[int]] = []
+        body_bigram_postings: List[List[int]] = []
+        for doc in documents:
+            for text, postings, bigram_postings in (
+                (doc.title, title_postings, title_bigram_postings),
+                (doc.body, body_postings, body_bigram_postings),
+            ):
+                tokens, text_bigrams = _terminos(text)
+                for token in tokens:
+                    postings[_term_id(self.vocabulario, token, title_postings, body_postings)].append(doc.ordinal)
+                for bigram in text_bigrams:
+                    ids = self.vocabulario_bigramas
+                    bigram_postings[_term_id(ids, bigram, title_bigram_postings, body_bigram_postings)].append(
+                        doc.ordinal
+                    )
+
+        # Bitsets de documentos por id de término
+        self._title_bits = [bitset(p, n_docs) for p in title_postings]
+        self._body_bits = [bitset(p, n_docs) for p in body_postings]
+        self._title_bigram_bits = [bitset(p, n_docs) for p in title_bigram_postings]
+        self._body_bigram_bits = [bitset(p, n_docs) for p in body_bigram_postings]
+        self.all_bits = (1 << n_docs) - 1
+        # Documentos sin título o sin cuerpo (ese campo puntúa 0)
+        self.empty_title_bits = bitset((d.ordinal for d in documents if not d.title), n_docs)
+        self.empty_body_bits = bitset((d.ordinal for d in documents if not d.body), n_docs)
+
+        # Segmentos de exclusión, numerados en orden de documento y de aparición,
+        # y lista invertida palabra → segmentos
+        self.segment_docs: List[int] = []
+        self.segment_sizes: List[int] = []
+        self.segment_texts: List[str] = []
+        word_segments: Dict[str, List[int]] = {}
+        for doc in documents:
+            for seg_words, seg_text in doc.exclusion_segments:
+                seg_id = len(self.segment_docs)
+                self.segment_docs.append(doc.ordinal)
+                self.segment_sizes.append(len(seg_words))
+                self.segment_texts.append(seg_text)
+                for word in seg_words:
+                    word_segments.setdefault(word, []).append(seg_id)
+        self._word_segments: Dict[str, Tuple[int, ...]] = {w: tuple(s) for w, s in word_segments.items()}
+
+        # Índice de n-gramas de caracteres sobre el vocabulario: n-grama → palabras que lo contienen
+        ngrams: Dict[str, Set[str]] = {}
+        for token in self.vocabulario:
+            for i in range(len(token) - NGRAM_SIZE + 1):
+                ngrams.setdefault(token[i:i + NGRAM_SIZE], set()).add(token)
+        self._ngrams: Dict[str, FrozenSet[str]] = {g: frozenset(t) for g, t in ngrams.items()}
+        self._substring_cache: Dict[str, Tuple[int, int, int, int]] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_substring_cache'] = {}
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        # Un índice cargado (p. ej. de un snapshot) es un índice nuevo para las cachés
+        self.version = next(_VERSIONS)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def tokens_containing(self, palabra: str) -> Set[str]:
+        """Palabras del vocabulario que contienen `palabra` como subcadena."""
+        if len(palabra) < NGRAM_SIZE:
+            return {t for t in self.vocabulario if palabra in t}
+        grams = [palabra[i:i + NGRAM_SIZE] for i in range(len(palabra) - NGRAM_SIZE + 1)]
+        # Empezar por el n-grama más raro para que la intersección sea mínima
+        grams.sort(key=lambda g: len(self._ngrams.get(g, ())))
+        candidates = set(self._ngrams.get(grams[0], ()))
+        for g in grams[1:]:
+            if not candidates:
+                break
+            candidates &= self._ngrams.get(g, frozenset())
+        return {t for t in candidates if palabra in t}
+
+    def word_bits(self, palabra: str) -> Tuple[int, int, int, int]:
+        """Bitsets de documentos de `palabra`: (subcadena del título, palabra del título,
+        subcadena del cuerpo, palabra del cuerpo).
+
+        Una palabra (`\\w+`) aparece como subcadena en un texto si y solo si
+        es subcadena de alguna de sus palabras, así que basta con unir los
+        bitsets de las palabras del vocabulario que la contienen.
+        """
+        cached = self._substring_cache.get(palabra)
+        if cached is not None:
+            return cached
+        title_sub = body_sub = 0
+        for token in self.tokens_containing(palabra):
+            term_id = self.vocabulario[token]
+            title_sub |= self._title_bits[term_id]
+            body_sub |= self._body_bits[term_id]
+        term_id = self.vocabulario.get(palabra)
+        if term_id is None:
+            result = (title_sub, 0, body_sub, 0)
+        else:
+            result = (title_sub, self._title_bits[term_id], body_sub, self._body_bits[term_id])
+        if len(self._substring_cache) >= _SUBSTRING_CACHE_SIZE:
+            self._substring_cache.clear()
+        self._substring_cache[palabra] = result
+        return result
+
+    def term_bits(self, term_id: int) -> int:
+        """Bitset de los documentos con el término `term_id` en el título o el cuerpo."""
+        return self._title_bits[term_id] | self._body_bits[term_id]
+
+    def bigram_bits(self, bigrama: str) -> Tuple[int, int]:
+        """Bitsets de los documentos con el bigrama `bigrama` en el título y en el cuerpo."""
+        term_id = self.vocabulario_bigramas.get(bigrama)
+        if term_id is None:
+            return 0, 0
+        return self._title_bigram_bits[term_id], self._body_bigram_bits[term_id]
+
+    def documents_containing(self, palabra: str) -> FrozenSet[int]:
+        """Ordinales de los documentos cuyo título o cuerpo contiene `palabra`."""
+        title_sub, _, body_sub, _ = self.word_bits(palabra)
+        return frozenset(ordinals(title_sub | body_sub))
+
+    def candidate_bits(self, palabras: Iterable[str]) -> int:
+        """Bitset de los documentos que comparten alguna palabra con la consulta.
+
+        Un documento sin ninguna palabra de la consulta en su título ni en su
+        cuerpo puntúa 0 (o menos), así que nunca entra en los resultados.
+        """
+        bits = 0
+        for palabra in set(palabras):
+            title_sub, _, body_sub, _ = self.word_bits(palabra)
+            bits |= title_sub | body_sub
+        return bits
+
+    def candidates(self, palabras: Iterable[str]) -> List[IndexedDocument]:
+        """Documentos que comparten alguna palabra con la consulta, en orden del mapeo."""
+        return [self.documents[i] for i in ordinals(self.candidate_bits(palabras))]
+
+    def exclusion_hits(self, palabras: Iterable[str]) -> Dict[int, str]:
+        """Ordinal → texto del primer segmento de exclusión del documento cuyas
+        palabras están todas en la consulta (ver `calcular_relevancia`)."""
+        counts: Dict[int, int] = {}
+        for palabra in set(palabras):
+            for seg_id in self._word_segments.get(palabra, ()):
+                counts[seg_id] = counts.get(seg_id, 0) + 1
+        hits: Dict[int, str] = {}
+        sizes = self.segment_sizes
+        for seg_id in sorted(s for s, n in counts.items() if n == sizes[s]):
+            hits.setdefault(self.segment_docs[seg_id], self.segment_texts[seg_id])
+        return hits
+
+    def with_changes(
+        self, documents: Sequence[IndexedDocument] = (), removed: Iterable[int] = ()
+    ) -> "SearchIndex":
+        """Copia del índice con algunos documentos cambiados, sin reconstruirlo.
+
+        Cada documento de `documents` sustituye al del mismo ordinal o, si su
+        ordinal es el siguiente libre, se añade al final (desempata detrás de
+        los demás). Los ordinales de `removed` dejan de aparecer en las
+        búsquedas, aunque conservan su posición para no renumerar el resto.
+
+        Solo se recalculan los bitsets de los términos y los segmentos de
+        exclusión de esos documentos. El índice original no se modifica: las
+        consultas en curso terminan con él y la copia tiene otra versión.
+        """
+        new = copy.copy(self)
+        new.version = next(_VERSIONS)
+        new.vocabulario = dict(self.vocabulario)
+        new.vocabulario_bigramas = dict(self.vocabulario_bigramas)
+        new._title_bits = list(self._title_bits)
+        new._body_bits = list(self._body_bits)
+        new._title_bigram_bits = list(self._title_bigram_bits)
+        new._body_bigram_bits = list(self._body_bigram_bits)
+        new.segment_docs = list(self.segment_docs)
+        new.segment_sizes = list(self.segment_sizes)
+        new.segment_texts = list(self.segment_texts)
+        new._word_segments = dict(self._word_segments)
+        new._ngrams = dict(self._ngrams)
+        new._substring_cache = {}
+
+        docs = list(self.documents)
+        for ordinal in removed:
+            new._unindex(docs[ordinal])
+        for doc in documents:
+            if doc.ordinal < len(docs):
+                new._unindex(docs[doc.ordinal])
+                docs[doc.ordinal] = doc
+            elif doc.ordinal == len(docs):
+                docs.append(doc)
+            else:
+                raise ValueError(f"ordinal {doc.ordinal} fuera de rango (siguiente libre: {len(docs)})")
+            new._index(doc)
+        new.documents = tuple(docs)
+        return new
+
+    def _field_bits(self):
+        return (
+            (self._title_bits, self._title_bigram_bits, 'empty_title_bits'),
+            (self._body_bits, self._body_bigram_bits, 'empty_body_bits'),
+        )
+
+    def _unindex(self, doc: IndexedDocument) -> None:
+        bit = 1 << doc.ordinal
+        if not self.all_bits & bit:
+            return  # ya retirado
+        mask = ~bit
+        for (token_bits, bigram_bits, _), text in zip(self._field_bits(), (doc.title, doc.body), strict=True):
+            tokens, text_bigrams = _terminos(text)
+            for token in tokens:
+                term_id = self.vocabulario[token]
+                token_bits[term_id] &= mask
+            for bigram in text_bigrams:
+                term_id = self.vocabulario_bigramas[bigram]
+                bigram_bits[term_id] &= mask
+        self.empty_title_bits &= mask
+        self.empty_body_bits &= mask
+        self.all_bits &= mask
+        # Un segmento retirado no puede cubrir ninguna consulta
+        for seg_id, seg_doc in enumerate(self.segment_docs):
+            if seg_doc == doc.ordinal:
+                self.segment_sizes[seg_id] = -1
+
+    def _index(self, doc: IndexedDocument) -> None:
+        bit = 1 << doc.ordinal
+        for (token_bits, bigram_bits, empty_attr), text in zip(self._field_bits(), (doc.title, doc.body), strict=True):
+            if not text:
+                setattr(self, empty_attr, getattr(self, empty_attr) | bit)
+            tokens, text_bigrams = _terminos(text)
+            for token in tokens:
+                if token not in self.vocabulario:
+                    for i in range(len(token) - NGRAM_SIZE + 1):
+                        gram = token[i:i + NGRAM_SIZE]
+                        self._ngrams[gram] = self._ngrams.get(gram, frozenset()) | {token}
+                term_id = _term_id(self.vocabulario, token, self._title_bits, self._body_bits, empty=0)
+                token_bits[term_id] |= bit
+            for bigram in text_bigrams:
+                ids = self.vocabulario_bigramas
+                term_id = _term_id(ids, bigram, self._title_bigram_bits, self._body_bigram_bits, empty=0)
+                bigram_bits[term_id] |= bit
+        self.all_bits |= bit
+        for seg_words, seg_text in doc.exclusion_segments:
+            seg_id = len(self.segment_docs)
+            self.segment_docs.append(doc.ordinal)
+            self.segment_sizes.append(len(seg_words))
+            self.segment_texts.append(seg_text)
+            for word in seg_words:
+                self._word_segments[word] = self._word_segments.get(word, ()) + (seg_id,)
+
+
+def _terminos(text: str) -> Tuple[Set[str], FrozenSet[str]]:
+    """Palabras y bigramas de un título o cuerpo normalizado."""
+    return set(tokenizar(text)), bigramas(palabras_significativas(text))
+
+
+def _term_id(ids: Dict[str, int], term: str, *postings: List[Any], empty: Any = None) -> int:
+    """Id de `term`; si es nuevo, lo añade y abre su entrada (`empty`, o una lista) en cada `postings`."""
+    term_id = ids.get(term)
+    if term_id is None:
+        term_id = ids[sys.intern(term)] = len(ids)
+        for p in postings:
+            p.append([] if empty is None else empty)
+    return term_id
+
+
+def bitset(ordinales: Iterable[int], size: int) -> int:
+    """Entero con los bits de `ordinales` a 1."""
+    buf = bytearray((size + 7) // 8)
+    for i in ordinales:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def ordinals(bits: int) -> List[int]:
+    """Posiciones de los bits a 1 de `bits` (ordinales de documento), de menor a mayor."""
+    digits = format(bits, 'b')[::-1]
+    result = []
+    i = digits.find('1')
+    while i >= 0:
+        result.append(i)
+        i = digits.find('1', i + 1)
+    return result
+
+
+# Índices ya construidos, por identidad del mapeo (ver `mapping._PerMappingCache`)
+_INDEXES: _PerMappingCache[SearchIndex] = _PerMappingCache(SearchIndex, "index")
+
+
+def get_search_index(mapping: Optional[List[Dict[str, Any]]] = None) -> SearchIndex:
+    """Devuelve el índice de `mapping`, construyéndolo la primera vez.
+
+    Sin argumentos devuelve el índice del mapeo por defecto del paquete.
+    El índice refleja el mapeo en el momento de construirse: si se modifica
+    la lista in situ hay que construir un `SearchIndex` nuevo.
+    """
+    return _INDEXES.get(mapping)
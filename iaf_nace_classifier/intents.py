@@ -0,0 +1,241 @@
+"""
+Reglas de intención de la búsqueda y su compilación.
+
+Ciertas palabras de la query revelan la intención de la búsqueda
+(fabricación, comercio, software...) y ajustan el score de divisiones NACE
+enteras: "fabricación de X" penaliza el comercio, "desarrollo de software"
+penaliza los sectores físicos, etc. Las reglas están en una tabla
+declarativa (`REGLAS`): palabras clave → efectos por rango de divisiones o
+por código NACE → ajuste.
+
+La tabla se compila una vez:
+  - todas las palabras clave en un único patrón que recorre la query una
+    sola vez y devuelve las intenciones activas (`detectar_intenciones`)
+  - cada combinación de intenciones en una tabla de 100 entradas, una por
+    división, con los ajustes ya resueltos, más las excepciones por código
+    (`ajustes_para`)
+
+Así el bucle por documento solo consulta la tabla, y añadir reglas no
+encarece cada query.
+
+Los ajustes de cada documento se guardan como una secuencia, en el orden en
+que se aplican, y no sumados: todos los motores acumulan el score con las
+mismas operaciones y obtienen exactamente el mismo valor.
+"""
+
+import re
+from functools import cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Número de divisiones NACE (00-99) con entrada en la tabla compilada
+N_DIVISIONES = 100
+
+# Conjunto de intenciones activas en una query (nombres de `REGLAS`)
+Intenciones = FrozenSet[str]
+
+
+class Divisiones(NamedTuple):
+    """Efecto sobre las divisiones de `rangos` (inclusivos; None = sin límite), salvo `excepto`."""
+
+    rangos: Tuple[Tuple[Optional[int], Optional[int]], ...]
+    ajuste: float
+    excepto: Tuple[int, ...] = ()
+
+    def aplica(self, nace_div: int, codigo_nace: str) -> bool:
+        if nace_div in self.excepto:
+            return False
+        return any(
+            (lo is None or lo <= nace_div) and (hi is None or nace_div <= hi) for lo, hi in self.rangos
+        )
+
+
+class Codigos(NamedTuple):
+    """Efecto sobre códigos NACE concretos."""
+
+    codigos: Tuple[str, ...]
+    ajuste: float
+
+    def aplica(self, nace_div: int, codigo_nace: str) -> bool:
+        return codigo_nace in self.codigos
+
+
+class Regla(NamedTuple):
+    """Intención `nombre`: activa si la query normalizada contiene alguna de `palabras`.
+
+    `salvo` lista intenciones que, si están activas, anulan esta (p. ej. el
+    comercio solo cuenta si no hay intención de fabricación).
+    """
+
+    nombre: str
+    palabras: Tuple[str, ...]
+    efectos: Tuple["Divisiones | Codigos", ...]
+    salvo: Tuple[str, ...] = ()
+
+
+REGLAS: Tuple[Regla, ...] = (
+    # Manufactura (Divisiones 10-33): no se da boost global para evitar ruido
+    # (confiamos en los pesos específicos); se penaliza el comercio y, levemente,
+    # la agricultura/minería
+    Regla(
+        "manufactura",
+        ('fabricacion', 'fabricación', 'fabrica', 'fábrica', 'produccion', 'producción', 'manufactura',
+         'elaboracion', 'elaboración', 'confeccion', 'confección'),
+        (Divisiones(((45, 47),), -200.0), Divisiones(((None, 9),), -50.0)),
+    ),
+    # Comercio (Divisiones 45-47): aquí sí tiene sentido ayudar; se penaliza la manufactura
+    Regla(
+        "comercio",
+        ('comercio', 'venta', 'distribucion', 'distribución', 'tienda', 'almacen', 'almacén', 'mayor', 'menor'),
+        (Divisiones(((45, 47),), 50.0), Divisiones(((10, 33),), -200.0)),
+        salvo=("manufactura",),
+    ),
+    # Contexto digital: penalizar sectores puramente FÍSICOS que usan metáforas
+    # 01-03 agricultura ("granja" de servidores), 05-09 minería ("minería" de datos),
+    # 10-33 manufactura salvo 26 (hardware), 41-43 construcción ("arquitectura" de
+    # software), 49-53 transporte ("tráfico" de datos), 56 comidas ("alimentación")
+    Regla(
+        "software",
+        ('software', 'programacion', 'informatica', 'computadora', 'ordenador',
+         'app', 'web', 'digital', 'datos', 'sistema', 'red', 'servidor', 'cloud', 'nube',
+         'virtual', 'internet', 'online', 'ciber', 'tecnologia'),
+        (Divisiones(((1, 3), (5, 9), (10, 33), (41, 43), (49, 53), (56, 56)), -200.0, excepto=(26,)),),
+    ),
+    # Servicios personales (peluquería vs "corte" de piedra/metal)
+    Regla(
+        "personal",
+        ('pelo', 'cabello', 'peluqueria', 'estetica', 'belleza', 'manicura'),
+        (Divisiones(((10, 33), (41, 43)), -200.0),),
+    ),
+    # Contexto médico ("operación" médica vs operaciones financieras): penalizar
+    # financiero/inmobiliario/negocios y la manufactura salvo farmacéutica (21) y
+    # equipos médicos (26, 32)
+    Regla(
+        "medica",
+        ('medico', 'medica', 'cirugia', 'operacion', 'paciente', 'hospital', 'clinica', 'salud', 'enfermeria'),
+        (Divisiones(((64, 70),), -200.0), Divisiones(((10, 33),), -50.0, excepto=(21, 26, 32))),
+    ),
+    # Decoración / Navidad ("esferas" navideñas vs esferas de reloj): penalizar
+    # relojes (26.52) y ayudar a otras industrias manufactureras (32.99), que
+    # incluye artículos de fiesta y regalo
+    Regla(
+        "decoracion",
+        ('navidad', 'navideñas', 'navidenas', 'adornos', 'decoracion', 'fiesta', 'regalo'),
+        (Codigos(('26.52',), -200.0), Codigos(('32.99',), 50.0)),
+    ),
+)
+
+NOMBRES = tuple(regla.nombre for regla in REGLAS)
+
+
+class AjustesIntencion:
+    """Ajustes de score de una combinación de intenciones, resueltos por división y código."""
+
+    __slots__ = ("intenciones", "por_division", "por_codigo", "maximo", "_efectos")
+
+    def __init__(self, intenciones: Intenciones, reglas: Sequence[Regla] = REGLAS):
+        self.intenciones = intenciones
+        self._efectos = [e for r in reglas if r.nombre in intenciones for e in r.efectos]
+        # Códigos con algún efecto propio: su secuencia completa se resuelve aparte
+        codigos = sorted({c for e in self._efectos if isinstance(e, Codigos) for c in e.codigos})
+        self.por_division: Tuple[Tuple[float, ...], ...] = tuple(
+            self._evaluar(div, "") for div in range(N_DIVISIONES)
+        )
+        self.por_codigo: Dict[str, Tuple[float, ...]] = {c: self._evaluar(_division(c), c) for c in codigos}
+        # Cota superior de lo que los ajustes pueden sumar a un documento
+        self.maximo = sum(e.ajuste for e in self._efectos if e.ajuste > 0)
+
+    def _evaluar(self, nace_div: int, codigo_nace: str) -> Tuple[float, ...]:
+        return tuple(e.ajuste for e in self._efectos if e.aplica(nace_div, codigo_nace))
+
+    def para(self, nace_div: int, codigo_nace: str) -> Tuple[float, ...]:
+        """Ajustes del documento, en el orden en que se aplican."""
+        if self.por_codigo:
+            ajustes = self.por_codigo.get(codigo_nace)
+            if ajustes is not None and _division(codigo_nace) == nace_div:
+                return ajustes
+        if 0 <= nace_div < N_DIVISIONES:
+            return self.por_division[nace_div]
+        return self._evaluar(nace_div, codigo_nace)
+
+
+def _division(codigo_nace: str) -> int:
+    try:
+        return int(codigo_nace.split('.')[0])
+    except ValueError:
+        return 0
+
+
+def _patron_trie(palabras: Iterable[str]) -> str:
+    """Expresión regular que reconoce `palabras`, factorizada como un trie (la más larga primero)."""
+    trie: Dict[str, dict] = {}
+    for palabra in palabras:
+        nodo = trie
+        for ch in palabra:
+            nodo = nodo.setdefault(ch, {})
+        nodo[""] = {}
+
+    def emitir(nodo: Dict[str, dict]) -> str:
+        ramas = [re.escape(ch) + emitir(hijo) for ch, hijo in sorted(nodo.items()) if ch]
+        if not ramas:
+            return ""
+        cuerpo = ramas[0] if len(ramas) == 1 else "(?:" + "|".join(ramas) + ")"
+        # Una palabra termina aquí: el resto es opcional (y codicioso, así gana la más larga)
+        return "(?:" + cuerpo + ")?" if "" in nodo else cuerpo
+
+    return emitir(trie)
+
+
+class _Detector:
+    """Patrón único con todas las palabras clave de `reglas`.
+
+    Las palabras se buscan como subcadenas de la query normalizada y pueden
+    solaparse ("fabrica" y "fabricacion"), así que no basta con recorrer las
+    coincidencias sin solapamiento. El patrón es una búsqueda anticipada que,
+    en cada posición, captura la palabra más larga que empieza ahí; cualquier
+    otra palabra que empiece en esa posición es prefijo de ella, de modo que
+    las intenciones de todos sus prefijos se precalculan por palabra.
+
+    Las palabras se escriben en el patrón como un trie ("fabrica(?:ci(?:on|ón))?")
+    en lugar de como una alternativa por palabra: `re` no factoriza los
+    prefijos comunes y así descarta cada posición tras mirar un solo carácter.
+    """
+
+    def __init__(self, reglas: Sequence[Regla]):
+        self.reglas = tuple(reglas)
+        por_palabra: Dict[str, set] = {}
+        for regla in self.reglas:
+            for palabra in regla.palabras:
+                por_palabra.setdefault(palabra, set()).add(regla.nombre)
+        self._activadas: Dict[str, FrozenSet[str]] = {
+            p: frozenset().union(*(por_palabra[q] for q in por_palabra if p.startswith(q))) for p in por_palabra
+        }
+        self._patron = re.compile("(?=(" + _patron_trie(por_palabra) + "))")
+
+    def detectar(self, query_norm: str) -> Intenciones:
+        activas: set = set()
+        for m in self._patron.finditer(query_norm):
+            activas |= self._activadas[m.group(1)]
+        for regla in self.reglas:
+            if regla.nombre in activas and any(n in activas for n in regla.salvo):
+                activas.discard(regla.nombre)
+        return frozenset(activas)
+
+
+_DETECTOR = _Detector(REGLAS)
+
+
+def detectar_intenciones(query_norm: str) -> Intenciones:
+    """Intenciones activas en una query ya normalizada (`text.normalizar_texto`)."""
+    return _DETECTOR.detectar(query_norm)
+
+
+@cache
+def ajustes_para(intenciones: Intenciones) -> AjustesIntencion:
+    """Tabla compilada de ajustes de una combinación de intenciones (se construye una vez)."""
+    return AjustesIntencion(intenciones)
+
+
+def ordenar_intenciones(intenciones: Iterable[str]) -> List[str]:
+    """Intenciones en el orden de `REGLAS` (para serializarlas de forma estable)."""
+    activas = set(intenciones)
+    return [n for n in NOMBRES if n in activas]
@@ -1,8 +1,14 @@
 import importlib.resources
 import json
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from . import metrics
 
 
 def load_mapping(path: Optional[str | Path] = None) -> List[Dict[str, Any]]:
@@ -10,16 +16,57 @@ def load_mapping(path: Optional[str | Path] = None) -> List[Dict[str, Any]]:
 
     If path is None, loads from `iaf_nace_mapeo_expandido.json` packaged with the library.
     Filters out obviously broken records (e.g., missing codigos_nace).
+
+    The cleaned mapping, and the search index and NACE lookup built from it,
+    are cached in an on-disk snapshot keyed by the content of the JSON (see
+    `snapshot`), so repeated loads skip parsing and cleaning. Set
+    IAF_NACE_SNAPSHOT=0 to always parse the JSON.
     """
-    if path:
-        p = Path(path)
-        with p.open("r", encoding="utf-8") as f:
-            data = json.load(f)
+    start = time.perf_counter()
+    raw = read_mapping_source(path)
+    if os.environ.get("IAF_NACE_SNAPSHOT", "1") != "0":
+        from .snapshot import load_snapshot_mapping
+
+        mapping = load_snapshot_mapping(raw)
     else:
-        ref = importlib.resources.files("iaf_nace_classifier") / "data" / "iaf_nace_mapeo_expandido.json"
-        with ref.open("r", encoding="utf-8") as f:
-            data = json.load(f)
+        mapping = clean_mapping(json.loads(raw))
+    metrics.observe_build("mapping", time.perf_counter() - start)
+    return mapping
+
+
+_DEFAULT_MAPPING: Optional[List[Dict[str, Any]]] = None
 
+
+def default_mapping() -> List[Dict[str, Any]]:
+    """The packaged mapping, loaded once and shared by the default index and lookup.
+
+    Unlike `load_mapping()`, every call returns the same list: treat it as read-only.
+    """
+    global _DEFAULT_MAPPING
+    if _DEFAULT_MAPPING is None:
+        _DEFAULT_MAPPING = load_mapping()
+    return _DEFAULT_MAPPING
+
+
+def mapping_source_path(path: Optional[str | Path] = None) -> Optional[Path]:
+    """Filesystem path of the mapping JSON (packaged file if None); None if it is not a plain file."""
+    if path:
+        return Path(path)
+    ref = importlib.resources.files("iaf_nace_classifier") / "data" / "iaf_nace_mapeo_expandido.json"
+    candidate = Path(str(ref))
+    return candidate if candidate.is_file() else None
+
+
+def read_mapping_source(path: Optional[str | Path] = None) -> bytes:
+    """Raw bytes of the mapping JSON at `path` (packaged file if None)."""
+    if path:
+        return Path(path).read_bytes()
+    ref = importlib.resources.files("iaf_nace_classifier") / "data" / "iaf_nace_mapeo_expandido.json"
+    return ref.read_bytes()
+
+
+def clean_mapping(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop broken records and append inherited parent exclusions to descriptions."""
     cleaned: List[Dict[str, Any]] = []
     
     # First pass: Collect all NACE descriptions for lookup
@@ -52,6 +99,25 @@ def load_mapping(path: Optional[str | Path] = None) -> List[Dict[str, Any]]:
             return parts[0]
         return None
 
+    # Inherited exclusion suffix of each code (nearest parent first), memoized:
+    # sibling codes share their ancestors, so each parent is parsed only once
+    inherited_cache: Dict[str, str] = {}
+
+    def _inherited_exclusions(code: str) -> str:
+        parent = _get_parent_code(code)
+        if not parent:
+            return ""
+        suffix = inherited_cache.get(parent)
+        if suffix is None:
+            suffix = ""
+            if parent in nace_lookup:
+                parent_exclusions = _extract_exclusions(nace_lookup[parent])
+                if parent_exclusions:
+                    suffix = f"\n{parent_exclusions}"
+            suffix += _inherited_exclusions(parent)
+            inherited_cache[parent] = suffix
+        return suffix
+
     # Second pass: Build cleaned list and propagate exclusions
     for rec in data:
         codigos = [c.strip() for c in rec.get("codigos_nace", []) if str(c).strip()]
@@ -64,16 +130,9 @@ def load_mapping(path: Optional[str | Path] = None) -> List[Dict[str, Any]]:
             code = nace_item.get("codigo", "").strip()
             desc = nace_item.get("descripcion", "")
             
-            # Propagate from parent
-            parent = _get_parent_code(code)
-            while parent:
-                if parent in nace_lookup:
-                    parent_exclusions = _extract_exclusions(nace_lookup[parent])
-                    if parent_exclusions:
-                        # Append inherited exclusions to description so search.py picks them up
-                        desc += f"\n{parent_exclusions}"
-                    
-                parent = _get_parent_code(parent)
+            # Propagate from parent: append inherited exclusions to the description
+            # so the search index picks them up
+            desc += _inherited_exclusions(code)
             
             processed_descriptions.append({
                 "codigo": code,
@@ -100,64 +159,168 @@ def _normalize_nace(code: str) -> str:
     return m.group(0) if m else code
 
 
-def _is_excluded(code: str, exclusions: Iterable[str]) -> bool:
-    code_norm = _normalize_nace(code)
-    for ex in exclusions:
-        ex_norm = _normalize_nace(ex)
-        if code_norm.startswith(ex_norm):
-            return True
-    return False
+class NaceLookup:
+    """Precompiled NACE code → IAF classification table for one mapping.
 
+    Built once per mapping: every pattern and exclusion is normalized up front,
+    and the result of every well-formed NACE code (`dd`, `dd.d`, `dd.dd`) is
+    resolved in advance, applying exclusions and most-specific-pattern rules
+    exactly as `classify_nace` always has. Classifying a code is then a dict
+    lookup; other inputs fall back to a longest-prefix walk.
+    """
 
-def _match_specificity(nace: str, pattern: str) -> Optional[int]:
-    """Return specificity score if `nace` matches `pattern`, else None.
+    def __init__(self, mapping: List[Dict[str, Any]]):
+        # Normalized pattern -> candidate records, in mapping (and pattern) order
+        self._patterns: Dict[str, List[Tuple[Dict[str, Any], Tuple[str, ...]]]] = {}
+        for rec in mapping:
+            exclusions = tuple(_normalize_nace(e) for e in rec.get("exclusiones", []))
+            for pat in rec.get("codigos_nace", []):
+                p = _normalize_nace(pat)
+                if p:
+                    self._patterns.setdefault(p, []).append((rec, exclusions))
 
-    Higher score means more specific match. Use pattern length as proxy.
-    Matching rules:
-    - If pattern has dot (e.g., 74.3), match by prefix (e.g., 74.31 matches 74.3)
-    - If pattern is 2 digits (e.g., 24), match by major section prefix
-    """
-    n = _normalize_nace(nace)
-    p = _normalize_nace(pattern)
-    if not p:
+        self._table: Dict[str, Optional[Dict[str, Any]]] = {}
+        for major in range(100):
+            code = f"{major:02d}"
+            self._table[code] = self._resolve(code)
+            for minor in range(10):
+                code = f"{major:02d}.{minor}"
+                self._table[code] = self._resolve(code)
+            for minor in range(100):
+                code = f"{major:02d}.{minor:02d}"
+                self._table[code] = self._resolve(code)
+
+    def _resolve(self, code_norm: str) -> Optional[Dict[str, Any]]:
+        # The longest pattern that prefixes the code is the most specific match;
+        # among records with that same pattern, the first non-excluded one wins.
+        for k in range(len(code_norm), 0, -1):
+            pat = code_norm[:k]
+            for rec, exclusions in self._patterns.get(pat, ()):
+                if any(code_norm.startswith(ex) for ex in exclusions):
+                    continue
+                return {
+                    "codigo_iaf": rec.get("codigo_iaf"),
+                    "nombre_iaf": rec.get("nombre_iaf"),
+                    "matched_pattern": pat,
+                    "nace_code": code_norm,
+                }
         return None
-    if n.startswith(p):
-        return len(p)
-    # Also allow 2-digit pattern to match 2-digit nace even if not dotted
-    if len(p) == 2 and n[:2] == p:
-        return 2
-    return None
+
+    def classify(self, code: str) -> Optional[Dict[str, Any]]:
+        """Classify a NACE code (same result as `classify_nace`)."""
+        res = self._table.get(code, _MISSING)
+        if res is _MISSING:
+            code_norm = _normalize_nace(code)
+            res = self._table.get(code_norm, _MISSING)
+            if res is _MISSING:
+                res = self._resolve(code_norm)
+        return dict(res) if res is not None else None
+
+    def classify_many(self, codes: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+        """Classify many NACE codes at once, preserving order."""
+        return [self.classify(c) for c in codes]
+
+
+_MISSING: Any = object()
+
+T = TypeVar("T")
+
+
+class _PerMappingCache(Generic[T]):
+    """Structures derived from a mapping, cached by mapping identity.
+
+    A reference to the mapping is kept alongside so its id() cannot be reused
+    while the entry exists. Structures reflect the mapping at build time: if a
+    mapping list is modified in place, build a new structure explicitly.
+    """
+
+    def __init__(self, factory: Callable[[List[Dict[str, Any]]], T], name: str, size: int = 4):
+        self._factory = factory
+        self._name = name
+        self._size = size
+        self._entries: OrderedDict[int, Tuple[List[Dict[str, Any]], T]] = OrderedDict()
+        self._loaders: OrderedDict[int, Tuple[List[Dict[str, Any]], Callable[[], T]]] = OrderedDict()
+        self._default: Optional[T] = None
+        # Guards the two dicts; structures are built outside it, so two threads
+        # may build the same one and the last to finish keeps its copy
+        self._lock = threading.Lock()
+
+    def register(self, mapping: List[Dict[str, Any]], loader: Callable[[], T]) -> None:
+        """Use `loader()` instead of the factory the first time `mapping` is requested.
+
+        Lets a prebuilt structure (e.g. from a snapshot) be attached to a
+        mapping without loading it until it is actually needed.
+        """
+        with self._lock:
+            self._loaders[id(mapping)] = (mapping, loader)
+            while len(self._loaders) > self._size:
+                self._loaders.popitem(last=False)
+
+    def get(self, mapping: Optional[List[Dict[str, Any]]] = None) -> T:
+        """Structure for `mapping`, or for the packaged mapping if None."""
+        if mapping is None:
+            if self._default is None:
+                self._default = self.get(default_mapping())
+            return self._default
+
+        key = id(mapping)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] is mapping:
+                self._entries.move_to_end(key)
+                return cached[1]
+            # Kept until the structure is stored, so a concurrent caller uses it too
+            pending = self._loaders.get(key)
+
+        start = time.perf_counter()
+        if pending is not None and pending[0] is mapping:
+            value = pending[1]()
+        else:
+            value = self._factory(mapping)
+        metrics.observe_build(self._name, time.perf_counter() - start)
+        with self._lock:
+            if pending is not None and self._loaders.get(key) is pending:
+                del self._loaders[key]
+            self._entries[key] = (mapping, value)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        return value
+
+
+_LOOKUPS: _PerMappingCache[NaceLookup] = _PerMappingCache(NaceLookup, "lookup")
+
+
+def get_nace_lookup(mapping: Optional[List[Dict[str, Any]]] = None) -> NaceLookup:
+    """Return the compiled lookup table for `mapping` (packaged mapping if None)."""
+    return _LOOKUPS.get(mapping)
 
 
 def classify_nace(code: str, mapping: Optional[List[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
     """Classify a NACE code into an IAF sector.
 
     Returns a dict with keys: codigo_iaf, nombre_iaf, matched_pattern
-    or None if no match.
+    or None if no match. Uses the mapping's precompiled `NaceLookup`,
+    built on first use.
     """
-    if mapping is None:
-        mapping = load_mapping()
+    return get_nace_lookup(mapping).classify(code)
 
-    code_norm = _normalize_nace(code)
-    best: Tuple[int, Dict[str, Any], str] | None = None  # (score, record, pattern)
 
-    for rec in mapping:
-        if _is_excluded(code_norm, rec.get("exclusiones", [])):
-            continue
-        for pat in rec.get("codigos_nace", []):
-            score = _match_specificity(code_norm, pat)
-            if score is None:
-                continue
-            if best is None or score > best[0]:
-                best = (score, rec, _normalize_nace(pat))
-
-    if not best:
-        return None
+def classify_nace_many(
+    codes: Iterable[str], mapping: Optional[List[Dict[str, Any]]] = None
+) -> List[Optional[Dict[str, Any]]]:
+    """Classify many NACE codes with one table lookup each; results keep input order."""
+    return get_nace_lookup(mapping).classify_many(codes)
+
 
-    _, rec, pat = best
-    return {
-        "codigo_iaf": rec.get("codigo_iaf"),
-        "nombre_iaf": rec.get("nombre_iaf"),
-        "matched_pattern": pat,
-        "nace_code": code_norm,
-    }
+def iter_classify_nace(
+    codes: Iterable[str], mapping: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[Optional[Dict[str, Any]]]:
+    """Lazily classify a stream of NACE codes, yielding one result per code.
+
+    The lookup table is built once (if needed) and neither the input nor the
+    output is materialized, so this can be chained from a file reader to a
+    writer in constant memory.
+    """
+    lookup = get_nace_lookup(mapping)
+    for code in codes:
+        yield lookup.classify(code)
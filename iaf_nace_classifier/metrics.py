@@ -0,0 +1,249 @@
+"""
+Métricas internas de la búsqueda en formato Prometheus.
+
+La instrumentación está desactivada por defecto y entonces no cuesta casi
+nada: `reloj()` devuelve un cronómetro nulo cuyos métodos no hacen nada y los
+contadores de `search._buscar_consulta` no se actualizan. Se activa con
+IAF_NACE_METRICS=1 o `enable()`.
+
+Con la instrumentación activa se registran, por consulta:
+  - histograma de tiempo por etapa (normalización, sinónimos, intención,
+    candidatos, puntuación, exclusiones, selección)
+  - contadores de documentos puntuados, resultados sobre el umbral y
+    exclusiones aplicadas
+
+Los tiempos de carga del mapeo y de construcción del índice y de la tabla de
+clasificación se registran siempre (ocurren una vez por proceso).
+
+Las búsquedas que puntúa un pool de procesos se miden en sus workers: cada
+tarea devuelve lo que ha registrado (`extraer()`) y el proceso principal lo
+suma a sus métricas (`fusionar()`), de modo que /metrics las incluye.
+
+`render()` devuelve todo en el formato de texto de Prometheus; la API lo
+publica en GET /metrics.
+"""
+
+import bisect
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+ENABLED = os.environ.get("IAF_NACE_METRICS") == "1"
+
+# Límites (en segundos) de los histogramas de tiempo
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def enable(flag: bool = True) -> None:
+    """Activa (o desactiva) la instrumentación de la búsqueda."""
+    global ENABLED
+    ENABLED = flag
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def _key(labels: Optional[Dict[str, str]]) -> Labels:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def _extraer(self) -> Dict[Labels, Any]:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def _sumar(self, values: Dict[Labels, Any]) -> None:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _sumar(self, values: Dict[Labels, float]) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def _samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_fmt_labels(labels)} {value:g}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self._values[_key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = buckets
+        # labels -> [cuentas por bucket (no acumuladas) + +Inf, suma]
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        key = _key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][i] += 1
+            entry[1][0] += value
+
+    def _sumar(self, values: Dict[Labels, Tuple[List[int], List[float]]]) -> None:
+        with self._lock:
+            for key, (counts, total) in values.items():
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+                for i, n in enumerate(counts):
+                    entry[0][i] += n
+                entry[1][0] += total[0]
+
+    def _samples(self) -> Iterable[str]:
+        for labels, (counts, total) in sorted(self._values.items()):
+            acc = 0
+            for bound, n in zip(self.buckets, counts[:-1], strict=True):
+                acc += n
+                yield f"{self.name}_bucket{_fmt_labels(labels, ('le', f'{bound:g}'))} {acc}"
+            acc += counts[-1]
+            yield f"{self.name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {acc}"
+            yield f"{self.name}_sum{_fmt_labels(labels)} {total[0]:.9g}"
+            yield f"{self.name}_count{_fmt_labels(labels)} {acc}"
+
+
+_REGISTRY: Dict[str, _Metric] = {}
+
+
+def _register(metric: _Metric) -> _Metric:
+    return _REGISTRY.setdefault(metric.name, metric)
+
+
+def counter(name: str, help: str) -> Counter:
+    """Contador registrado con `name` (lo crea la primera vez)."""
+    return _register(Counter(name, help))  # type: ignore[return-value]
+
+
+def gauge(name: str, help: str) -> Gauge:
+    return _register(Gauge(name, help))  # type: ignore[return-value]
+
+
+def histogram(name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, buckets))  # type: ignore[return-value]
+
+
+STAGE_SECONDS = histogram("iaf_nace_search_stage_seconds", "Tiempo de cada etapa de buscar_actividad")
+QUERIES = counter("iaf_nace_search_queries_total", "Consultas puntuadas (sin contar aciertos de caché)")
+DOCUMENTS_SCORED = counter("iaf_nace_search_documents_scored_total", "Descripciones NACE puntuadas")
+RESULTS_ABOVE_THRESHOLD = counter(
+    "iaf_nace_search_results_above_threshold_total", "Resultados que superan el umbral dinámico"
+)
+EXCLUSIONS = counter("iaf_nace_search_exclusions_total", "Penalizaciones por cláusula de exclusión aplicadas")
+BUILD_SECONDS = gauge(
+    "iaf_nace_build_seconds", "Duración de la última carga del mapeo o construcción de índice/tabla"
+)
+
+
+class _Reloj:
+    """Cronómetro de etapas: cada `etapa()` registra el tiempo desde la anterior."""
+
+    __slots__ = ("_t",)
+
+    def __init__(self) -> None:
+        self._t = time.perf_counter()
+
+    def etapa(self, nombre: str) -> None:
+        """Registra la etapa `nombre`."""
+        ahora = time.perf_counter()
+        STAGE_SECONDS.observe(ahora - self._t, {"stage": nombre})
+        self._t = ahora
+
+
+class _RelojNulo:
+    __slots__ = ()
+
+    def etapa(self, nombre: str) -> None:
+        pass
+
+
+_RELOJ_NULO = _RelojNulo()
+
+
+def reloj() -> "_Reloj | _RelojNulo":
+    """Cronómetro de etapas nuevo, o uno nulo si la instrumentación está desactivada."""
+    return _Reloj() if ENABLED else _RELOJ_NULO
+
+
+def observe_build(component: str, seconds: float) -> None:
+    """Registra la duración de una carga/construcción ("mapping", "index", "lookup", "numpy_engine")."""
+    BUILD_SECONDS.set(seconds, {"component": component})
+
+
+def extraer() -> Dict[str, Dict[Labels, Any]]:
+    """Valores de los contadores e histogramas de este proceso, que vuelven a cero.
+
+    Los gauges no se incluyen: describen el estado de cada proceso.
+    """
+    valores = {}
+    for name, metric in _REGISTRY.items():
+        if metric.kind != "gauge":
+            values = metric._extraer()
+            if values:
+                valores[name] = values
+    return valores
+
+
+def fusionar(valores: Dict[str, Dict[Labels, Any]]) -> None:
+    """Suma a las métricas de este proceso las que `extraer()` devolvió en otro."""
+    for name, values in valores.items():
+        metric = _REGISTRY.get(name)
+        if metric is not None:
+            metric._sumar(values)
+
+
+def render() -> str:
+    """Todas las métricas registradas, en formato de texto de Prometheus."""
+    lines: List[str] = []
+    for metric in _REGISTRY.values():
+        with metric._lock:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,302 @@
+"""
+Correcciones en caliente sobre el mapeo: descripciones y alias propios.
+
+Un `Overlay` guarda, por código NACE, cambios sobre las entradas
+`descripcion_nace` del mapeo base:
+  - una descripción nueva que sustituye a la del código (o se añade, si el
+    mapeo no tiene ese código)
+  - la retirada del código de la búsqueda
+  - alias: nombres alternativos de la actividad, que se indexan como parte
+    del título. El código necesita una descripción, del mapeo base o del
+    propio overlay
+
+`aplicar(base)` devuelve un mapeo nuevo con los cambios y deja registrado
+su índice, obtenido del índice del mapeo base con `SearchIndex.with_changes`:
+solo se recalculan los términos de las descripciones afectadas, sin
+reconstruir el índice. El mapeo y el índice base no se modifican, así que las
+búsquedas en curso terminan con ellos. La tabla de clasificación no depende
+de las descripciones y se comparte con el mapeo base.
+
+Las descripciones añadidas desempatan detrás de las del mapeo base.
+
+El overlay se guarda como JSON (`guardar`, escritura atómica) y se vuelve a
+cargar con `cargar`; la API lo gestiona en /overlay (ver `api`).
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .index import _INDEXES, IndexedDocument, build_document, get_search_index
+from .mapping import _LOOKUPS, get_nace_lookup
+
+FORMATO = 1
+
+_CODIGO_RE = re.compile(r"^\d{2}(?:\.\d{1,2})?$")
+
+
+def _validar_codigo(codigo: str) -> str:
+    codigo = (codigo or "").strip()
+    if not _CODIGO_RE.match(codigo):
+        raise ValueError(f"Código NACE no válido: {codigo!r}")
+    return codigo
+
+
+class Overlay:
+    """Cambios por código NACE sobre las descripciones del mapeo base."""
+
+    def __init__(self, path: Optional[str | Path] = None):
+        self.path = Path(path) if path is not None else None
+        # código → {"descripcion": str, "codigo_iaf": ...}, o None si se retira
+        self.descripciones: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.alias: Dict[str, List[str]] = {}
+        self.version = 0
+        self._lock = threading.RLock()
+        self._aplicado: Optional[Tuple[List[Dict[str, Any]], int, List[Dict[str, Any]]]] = None
+        self._estado: Optional[Tuple[int, Optional[Tuple[str, bytes]]]] = None
+
+    # --- Cambios -------------------------------------------------------------
+
+    def poner_descripcion(self, codigo: str, descripcion: str, codigo_iaf: Any = None) -> None:
+        """Sustituye la descripción de `codigo` (o la añade; `codigo_iaf` elige el sector)."""
+        codigo = _validar_codigo(codigo)
+        if not isinstance(descripcion, str) or not descripcion.strip():
+            raise ValueError("La descripción no puede estar vacía")
+        entrada: Dict[str, Any] = {"descripcion": descripcion}
+        if codigo_iaf is not None:
+            entrada["codigo_iaf"] = codigo_iaf
+        with self._lock:
+            self.descripciones[codigo] = entrada
+            self._cambiado()
+
+    def retirar(self, codigo: str) -> None:
+        """Deja de devolver `codigo` en las búsquedas."""
+        codigo = _validar_codigo(codigo)
+        with self._lock:
+            self.descripciones[codigo] = None
+            self._cambiado()
+
+    def agregar_alias(self, codigo: str, alias: str) -> None:
+        codigo = _validar_codigo(codigo)
+        alias = (alias or "").strip()
+        if not alias:
+            raise ValueError("El alias no puede estar vacío")
+        with self._lock:
+            existentes = self.alias.setdefault(codigo, [])
+            if alias not in existentes:
+                existentes.append(alias)
+                self._cambiado()
+
+    def quitar_alias(self, codigo: str, alias: str) -> bool:
+        """Quita un alias; False si no existía."""
+        codigo = _validar_codigo(codigo)
+        with self._lock:
+            existentes = self.alias.get(codigo, [])
+            if alias not in existentes:
+                return False
+            existentes.remove(alias)
+            if not existentes:
+                del self.alias[codigo]
+            self._cambiado()
+            return True
+
+    def restaurar(self, codigo: str) -> bool:
+        """Descarta todos los cambios de `codigo` (vuelve a la entrada del mapeo base)."""
+        codigo = _validar_codigo(codigo)
+        with self._lock:
+            habia = self.descripciones.pop(codigo, _NADA) is not _NADA
+            habia = self.alias.pop(codigo, None) is not None or habia
+            if habia:
+                self._cambiado()
+            return habia
+
+    def copia(self) -> "Overlay":
+        """Copia independiente, sin archivo (para probar cambios antes de adoptarlos)."""
+        copia = Overlay.from_dict(self.to_dict())
+        copia.version = self.version
+        return copia
+
+    def _cambiado(self) -> None:
+        self.version += 1
+        if self.path is not None:
+            self.guardar()
+
+    def __len__(self) -> int:
+        return len(set(self.descripciones) | set(self.alias))
+
+    # --- Aplicación ----------------------------------------------------------
+
+    def aplicar(self, base: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Mapeo `base` con los cambios aplicados, con su índice ya registrado.
+
+        Sin cambios devuelve `base` tal cual. Lanza ValueError si una
+        descripción nueva no tiene sector (ni `codigo_iaf` ni clasificación)
+        o si hay alias de un código sin descripción.
+        """
+        with self._lock:
+            descripciones = dict(self.descripciones)
+            alias = {c: tuple(a) for c, a in self.alias.items()}
+        if not descripciones and not alias:
+            return base
+
+        index = get_search_index(base)
+        ordinales: Dict[str, List[int]] = {}
+        for doc in index.documents:
+            ordinales.setdefault(doc.codigo_nace, []).append(doc.ordinal)
+
+        mapping = [dict(sector) for sector in base]
+        por_iaf = {sector.get('codigo_iaf'): sector for sector in mapping}
+        cambiados: List[IndexedDocument] = []
+        retirados: List[int] = []
+        siguiente = len(index.documents)
+        for codigo in sorted(set(descripciones) | set(alias)):
+            entrada = descripciones.get(codigo, _NADA)
+            alias_codigo = alias.get(codigo, ())
+            existentes = ordinales.get(codigo, [])
+            if entrada is None:
+                retirados.extend(existentes)
+                continue
+            if not existentes and entrada is _NADA:
+                raise ValueError(f"{codigo}: el código no está en el mapeo; añade antes su descripción")
+            for ordinal in existentes:
+                doc = index.documents[ordinal]
+                descripcion = doc.descripcion if entrada is _NADA else entrada["descripcion"]
+                cambiados.append(build_document(
+                    ordinal, doc.codigo_iaf, doc.nombre_iaf, codigo, descripcion, alias_codigo
+                ))
+            if not existentes and entrada is not _NADA:
+                sector = por_iaf.get(self._codigo_iaf(codigo, entrada, base))
+                if sector is None:
+                    raise ValueError(f"{codigo}: el sector IAF indicado no existe en el mapeo")
+                cambiados.append(build_document(
+                    siguiente, sector.get('codigo_iaf'), sector.get('nombre_iaf', ''), codigo,
+                    entrada["descripcion"], alias_codigo,
+                ))
+                siguiente += 1
+
+        # Entradas `descripcion_nace` del mapeo nuevo, en el mismo orden que el índice
+        por_ordinal = {doc.ordinal: doc for doc in cambiados}
+        retirados_set = set(retirados)
+        ordinal = 0
+        for sector in mapping:
+            entradas = []
+            for desc_obj in sector.get('descripcion_nace', []):
+                doc = por_ordinal.get(ordinal)
+                if doc is not None:
+                    desc_obj = _entrada(desc_obj.get('codigo'), doc.descripcion, alias.get(doc.codigo_nace, ()))
+                if ordinal not in retirados_set:
+                    entradas.append(desc_obj)
+                ordinal += 1
+            sector['descripcion_nace'] = entradas
+        for doc in cambiados:
+            if doc.ordinal >= len(index.documents):
+                sector = por_iaf[doc.codigo_iaf]
+                sector['descripcion_nace'] = sector['descripcion_nace'] + [
+                    _entrada(doc.codigo_nace, doc.descripcion, alias.get(doc.codigo_nace, ()))
+                ]
+
+        nuevo = index.with_changes(cambiados, retirados)
+        _INDEXES.register(mapping, lambda: nuevo)
+        lookup = get_nace_lookup(base)
+        _LOOKUPS.register(mapping, lambda: lookup)
+        return mapping
+
+    def _codigo_iaf(self, codigo: str, entrada: Dict[str, Any], base: List[Dict[str, Any]]) -> Any:
+        if "codigo_iaf" in entrada:
+            return entrada["codigo_iaf"]
+        clasificado = get_nace_lookup(base).classify(codigo)
+        if clasificado is None:
+            raise ValueError(f"{codigo}: no se puede clasificar; indica codigo_iaf")
+        return clasificado["codigo_iaf"]
+
+    def aplicado(self, base: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """`aplicar(base)`, calculado una vez por versión del overlay y mapeo base."""
+        with self._lock:
+            cached = self._aplicado
+            if cached is not None and cached[0] is base and cached[1] == self.version:
+                return cached[2]
+            version = self.version
+            mapping = self.aplicar(base)
+            self._aplicado = (base, version, mapping)
+            return mapping
+
+    def estado(self) -> Optional[Tuple[str, bytes]]:
+        """(huella, JSON) del overlay para enviarlo a otros procesos; None si está vacío."""
+        with self._lock:
+            if self._estado is None or self._estado[0] != self.version:
+                if len(self):
+                    datos = json.dumps(self.to_dict(), ensure_ascii=False, sort_keys=True).encode()
+                    self._estado = (self.version, (hashlib.sha1(datos).hexdigest(), datos))
+                else:
+                    self._estado = (self.version, None)
+            return self._estado[1]
+
+    # --- Persistencia --------------------------------------------------------
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "formato": FORMATO,
+                "descripciones": {c: (dict(e) if e is not None else None) for c, e in self.descripciones.items()},
+                "alias": {c: list(a) for c, a in self.alias.items()},
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], path: Optional[str | Path] = None) -> "Overlay":
+        overlay = cls(path)
+        if data.get("formato", FORMATO) != FORMATO:
+            raise ValueError(f"Formato de overlay no soportado: {data.get('formato')!r}")
+        for codigo, entrada in data.get("descripciones", {}).items():
+            if entrada is not None and not isinstance(entrada.get("descripcion"), str):
+                raise ValueError(f"{codigo}: falta la descripción")
+            overlay.descripciones[_validar_codigo(codigo)] = dict(entrada) if entrada is not None else None
+        for codigo, lista in data.get("alias", {}).items():
+            if not isinstance(lista, list) or not all(isinstance(a, str) for a in lista):
+                raise ValueError(f"{codigo}: los alias deben ser una lista de textos")
+            overlay.alias[_validar_codigo(codigo)] = list(lista)
+        overlay.version = 1
+        return overlay
+
+    def guardar(self, path: Optional[str | Path] = None) -> None:
+        """Escribe el overlay en `path` (o en el suyo) de forma atómica."""
+        path = Path(path) if path is not None else self.path
+        if path is None:
+            raise ValueError("El overlay no tiene archivo")
+        datos = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(datos)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def _entrada(codigo: str, descripcion: str, alias: Tuple[str, ...]) -> Dict[str, Any]:
+    entrada: Dict[str, Any] = {"codigo": codigo, "descripcion": descripcion}
+    if alias:
+        entrada["alias"] = list(alias)
+    return entrada
+
+
+_NADA: Any = object()
+
+
+def cargar(path: str | Path) -> Overlay:
+    """Overlay guardado en `path`; uno vacío (que se guardará ahí) si el archivo no existe."""
+    path = Path(path)
+    if not path.exists():
+        return Overlay(path)
+    return Overlay.from_dict(json.loads(path.read_text(encoding="utf-8")), path)
+
+
+def desde_estado(estado: Optional[Tuple[str, bytes]]) -> Overlay:
+    """Overlay recibido de otro proceso (ver `Overlay.estado`)."""
+    return Overlay() if estado is None else Overlay.from_dict(json.loads(estado[1]))
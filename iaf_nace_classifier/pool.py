@@ -0,0 +1,345 @@
+"""
+Pool de puntuación para el servicio HTTP.
+
+`buscar_actividad` es CPU puro: en los manejadores síncronos de FastAPI todas
+las peticiones compiten por el GIL en el mismo proceso y una ráfaga de
+consultas largas bloquea al resto. `ScoringPool` envía la puntuación a un
+pool de procesos y la espera de forma asíncrona, de modo que un único proceso
+uvicorn reparte la carga entre todos los núcleos.
+
+Los procesos se arrancan con forkserver (no heredan los hilos del servidor).
+El forkserver importa `_forkserver` al arrancar, que carga una vez el mapeo
+de IAF_NACE_MAPPING, su índice y la tabla de clasificación y congela el GC
+(ver `preload`); cada worker es un fork suyo y comparte esas páginas por
+copia en escritura en lugar de deserializar su propia copia. Solo se separan
+las páginas cuyos objetos toca (contadores de referencias), unos pocos MB por
+worker. Si el archivo de mapeo cambia después (recarga), los workers nuevos
+cargan cada uno el mapeo nuevo y vuelven a ocupar una copia completa cada
+uno, como ocurre siempre en plataformas sin forkserver (spawn).
+
+Con varios procesos de gunicorn, cada uno tiene su pool y su forkserver: la
+memoria es la de un mapeo por proceso de gunicorn más la parte privada de
+cada worker. Ajusta IAF_NACE_POOL_WORKERS para que procesos × workers no
+supere los núcleos (p. ej. `-w 4` con IAF_NACE_POOL_WORKERS=2 en 8 núcleos),
+o usa IAF_NACE_POOL_WORKERS=0 y deja el paralelismo a gunicorn.
+
+En un intérprete sin GIL (free-threaded, 3.13t+) usa un pool de hilos, que
+comparte el índice del proceso sin copiarlo.
+
+`reiniciar()` sustituye los workers por otros nuevos (p. ej. tras recargar el
+mapeo, ver `preload.Warmup.reload`) sin cancelar las tareas en curso: el
+pool anterior termina lo que tiene pendiente y se cierra.
+
+Con la instrumentación activa (`metrics`), cada tarea de un pool de procesos
+devuelve las métricas que ha registrado el worker y se suman a las de este
+proceso; los hilos de un pool de hilos ya registran en él.
+
+El número de tareas pendientes está acotado: si el pool está saturado,
+`PoolSaturado` permite responder 503 con Retry-After en lugar de encolar sin
+límite. La caché de resultados se consulta en el proceso principal antes de
+enviar nada al pool.
+
+Configuración por entorno:
+  IAF_NACE_POOL_WORKERS  procesos/hilos (por defecto, núcleos disponibles; 0 desactiva el pool)
+  IAF_NACE_POOL_QUEUE    tareas pendientes como máximo (por defecto, 8 por worker)
+  IAF_NACE_POOL_KIND     "process", "thread" o "auto" (hilos solo sin GIL)
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from . import metrics
+from .mapping import mapping_source_path
+from .overlay import desde_estado
+from .preload import preload
+from .search import buscar_actividad, buscar_actividades, buscar_en_cache, guardar_en_cache
+
+# (ruta, firma del archivo, mapeo) cargado en el forkserver por `precargar_forkserver`
+_PRECARGA: Optional[Tuple[Optional[str], Optional[Tuple[int, int]], List[Dict[str, Any]]]] = None
+# Mapeo del worker, cargado una vez por `_init_worker`
+_WORKER_MAPPING: Optional[List[Dict[str, Any]]] = None
+# (huella del overlay, mapeo con el overlay aplicado) del worker (ver `_mapeo_worker`)
+_WORKER_OVERLAY: Tuple[Optional[str], Optional[List[Dict[str, Any]]]] = (None, None)
+
+
+# Segundos como máximo para que todos los workers nuevos terminen de cargar
+CALENTAMIENTO_TIMEOUT = 120.0
+
+
+class PoolSaturado(RuntimeError):
+    """El pool tiene ya el máximo de tareas pendientes."""
+
+
+def _firma(mapping_path: Optional[str | Path]) -> Optional[Tuple[int, int]]:
+    """(mtime, tamaño) del archivo de mapeo (el del paquete si es None)."""
+    ruta = mapping_source_path(mapping_path)
+    try:
+        st = os.stat(ruta) if ruta is not None else None
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size) if st is not None else None
+
+
+def precargar_forkserver() -> None:
+    """Carga el mapeo de IAF_NACE_MAPPING en el proceso forkserver (ver el módulo)."""
+    global _PRECARGA
+    ruta = os.environ.get("IAF_NACE_MAPPING") or None
+    firma = _firma(ruta)
+    _PRECARGA = (ruta, firma, preload(ruta))
+
+
+def _precargado(mapping_path: Optional[str | Path]) -> Optional[List[Dict[str, Any]]]:
+    """Mapeo heredado del forkserver, si es el de `mapping_path` y el archivo no ha cambiado."""
+    if _PRECARGA is None:
+        return None
+    ruta, firma, mapping = _PRECARGA
+    if (str(mapping_path) if mapping_path else None) != ruta or _firma(ruta) != firma:
+        return None
+    return mapping
+
+
+def _init_worker(
+    mapping_path: Optional[str | Path], engine: Optional[str], mapping: Optional[List[Dict[str, Any]]] = None
+) -> None:
+    global _WORKER_MAPPING, _WORKER_OVERLAY
+    # Un pool de hilos recibe directamente el mapeo del proceso; un worker de
+    # un forkserver precargado, el heredado de él
+    if mapping is None:
+        mapping = _precargado(mapping_path)
+    _WORKER_MAPPING = mapping if mapping is not None else preload(mapping_path, engine)
+    _WORKER_OVERLAY = (None, _WORKER_MAPPING)
+
+
+def _mapeo_worker(overlay: Optional[Tuple[str, bytes]]) -> Optional[List[Dict[str, Any]]]:
+    """Mapeo del worker con el overlay del proceso principal (`Overlay.estado()`).
+
+    Cada tarea lleva la huella del overlay en uso; el worker solo lo vuelve a
+    aplicar, de forma incremental, cuando cambia.
+    """
+    global _WORKER_OVERLAY
+    huella = overlay[0] if overlay is not None else None
+    actual = _WORKER_OVERLAY
+    if actual[0] != huella:
+        actual = (huella, desde_estado(overlay).aplicar(_WORKER_MAPPING))
+        _WORKER_OVERLAY = actual
+    return actual[1]
+
+
+def _calentar(espera: float) -> Tuple[int, int]:
+    """Identifica al worker que la ejecuta, ya inicializado (con el índice cargado).
+
+    La espera lo retiene un momento para que las demás tareas de la ronda
+    vayan a otros workers.
+    """
+    time.sleep(espera)
+    return os.getpid(), threading.get_ident()
+
+
+def _buscar(
+    query: str, top_n: int, overlay: Optional[Tuple[str, bytes]] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    # La caché se consulta en el proceso principal; la del worker sería redundante
+    return buscar_actividad(query, mapping=_mapeo_worker(overlay), top_n=top_n, use_cache=False)
+
+
+def _buscar_lote(
+    queries: List[str], top_n: int, overlay: Optional[Tuple[str, bytes]] = None
+) -> List[Dict[str, List[Dict[str, Any]]]]:
+    return buscar_actividades(queries, mapping=_mapeo_worker(overlay), top_n=top_n)
+
+
+def _medir(activo: bool, fn: Callable[..., Any], *args: Any) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """Ejecuta `fn` en un worker de procesos y devuelve su resultado y, si `activo`,
+    las métricas que ha registrado (`metrics.extraer()`).
+
+    `activo` es `metrics.ENABLED` del proceso principal, que se aplica también al
+    worker (puede haberse activado con `metrics.enable()` tras arrancarlo).
+    """
+    metrics.enable(activo)
+    resultado = fn(*args)
+    return resultado, metrics.extraer() if activo else None
+
+
+def gil_habilitado() -> bool:
+    """False en un intérprete free-threaded con el GIL desactivado."""
+    check = getattr(sys, "_is_gil_enabled", None)
+    return check() if check is not None else True
+
+
+class ScoringPool:
+    """Pool (de procesos o de hilos) con cola acotada para puntuar consultas."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        kind: str = "auto",
+        mapping_path: Optional[str | Path] = None,
+        engine: Optional[str] = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 8
+        if kind == "auto":
+            kind = "process" if gil_habilitado() else "thread"
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Tipo de pool desconocido: {kind!r}")
+        self.kind = kind
+        self.mapping_path = mapping_path
+        self.engine = engine
+        # Mapeo ya cargado para los workers de un pool de hilos (None: lo cargan ellos)
+        self.mapping: Optional[List[Dict[str, Any]]] = None
+        self.pending = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, mapping_path: Optional[str | Path] = None) -> Optional["ScoringPool"]:
+        """Pool configurado con las variables IAF_NACE_POOL_*; None si IAF_NACE_POOL_WORKERS=0."""
+        workers = int(os.environ.get("IAF_NACE_POOL_WORKERS", os.cpu_count() or 1))
+        if workers <= 0:
+            return None
+        queue = int(os.environ.get("IAF_NACE_POOL_QUEUE", "0")) or None
+        return cls(workers, queue, kind=os.environ.get("IAF_NACE_POOL_KIND", "auto"), mapping_path=mapping_path)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._nuevo_executor()
+
+    def _nuevo_executor(self) -> Executor:
+        if self.kind == "thread":
+            initargs = (self.mapping_path, self.engine, self.mapping)
+            return ThreadPoolExecutor(
+                self.workers, thread_name_prefix="iaf-nace-score", initializer=_init_worker, initargs=initargs
+            )
+        # forkserver/spawn: los workers no heredan los hilos del servidor (fork con
+        # hilos activos puede bloquearse). El forkserver precarga el mapeo para
+        # que lo compartan (solo surte efecto si aún no está en marcha); con
+        # spawn cada uno lo carga desde el snapshot
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload([f"{__package__}._forkserver"])
+        else:
+            ctx = multiprocessing.get_context("spawn")
+        return ProcessPoolExecutor(
+            self.workers, mp_context=ctx, initializer=_init_worker, initargs=(self.mapping_path, self.engine)
+        )
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def reiniciar(self, mapping: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Sustituye los workers por otros que cargan el mapeo de nuevo (o usan `mapping`).
+
+        Las tareas nuevas van al pool nuevo; las ya enviadas terminan en el
+        anterior, que se cierra después sin cancelarlas.
+        """
+        with self._lock:
+            self.mapping = mapping if self.kind == "thread" else None
+            if self._executor is None:
+                return
+            nuevo = self._nuevo_executor()
+        # Los workers nuevos cargan el índice antes de recibir peticiones
+        try:
+            self._esperar_workers(nuevo)
+        except BaseException:
+            nuevo.shutdown(wait=False, cancel_futures=True)
+            raise
+        with self._lock:
+            anterior, self._executor = self._executor, nuevo
+            self.restarts += 1
+        if anterior is not None:
+            anterior.shutdown(wait=False)
+
+    def _esperar_workers(self, executor: Executor, timeout: float = CALENTAMIENTO_TIMEOUT) -> None:
+        """Espera a que respondan `workers` workers distintos de `executor`.
+
+        Un worker termina de inicializarse antes de ejecutar su primera tarea;
+        como un worker ya listo puede adelantarse y tomar varias tareas de una
+        ronda, se envían rondas hasta haber visto a todos.
+        """
+        vistos: Set[Tuple[int, int]] = set()
+        limite = time.monotonic() + timeout
+        while len(vistos) < self.workers:
+            if time.monotonic() > limite:
+                raise TimeoutError(f"{len(vistos)} de {self.workers} workers listos tras {timeout:.0f} s")
+            ronda = [executor.submit(_calentar, 0.05) for _ in range(self.workers)]
+            vistos.update(futuro.result() for futuro in ronda)
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.kind == "thread":
+            return await self._ejecutar(fn, *args)
+        resultado, muestras = await self._ejecutar(_medir, metrics.ENABLED, fn, *args)
+        if muestras:
+            metrics.fusionar(muestras)
+        return resultado
+
+    async def _ejecutar(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturado(f"{self.pending} tareas pendientes (máximo {self.max_pending})")
+        self.start()
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        self.pending += 1
+        try:
+            try:
+                return await loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # Un worker murió (p. ej. por OOM): se recrea el pool (si otra tarea
+                # no lo ha hecho ya) y se reintenta una vez
+                if self._executor is executor:
+                    self.shutdown()
+                self.start()
+                return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def buscar(
+        self,
+        query: str,
+        top_n: int = 10,
+        mapping: Optional[List[Dict[str, Any]]] = None,
+        overlay: Optional[Tuple[str, bytes]] = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """`buscar_actividad` en el pool, con la caché de este proceso delante.
+
+        `mapping` es el mapeo de este proceso (con el overlay aplicado), para
+        la clave de caché; `overlay` es `Overlay.estado()`, que los workers
+        aplican sobre su mapeo.
+        """
+        key, respuesta = buscar_en_cache(query, mapping=mapping, top_n=top_n)
+        if respuesta is not None:
+            return respuesta
+        respuesta = await self._run(_buscar, query, top_n, overlay)
+        guardar_en_cache(key, respuesta)
+        return respuesta
+
+    async def buscar_lote(
+        self, queries: List[str], top_n: int = 10, overlay: Optional[Tuple[str, bytes]] = None
+    ) -> List[Dict[str, List[Dict[str, Any]]]]:
+        """`buscar_actividades` en el pool, como una sola tarea."""
+        return await self._run(_buscar_lote, queries, top_n, overlay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
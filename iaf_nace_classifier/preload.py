@@ -0,0 +1,232 @@
+"""
+Fork-friendly preloading of the mapping and search structures.
+
+A multi-process server or bulk job normally builds the mapping, search index
+and lookup table once per worker. Calling `preload()` in the parent process
+before forking builds them once; forked workers then inherit the same memory
+pages instead of each holding a private copy.
+
+After building, `preload()` runs a full collection and calls `gc.freeze()`,
+which moves every existing object to the permanent generation. The cyclic
+garbage collector then never traverses (and so never writes to) those
+objects in the workers, which would otherwise dirty and copy most shared
+pages on the first collection. Reference-count updates on objects a worker
+actually touches still copy those pages, so sharing is partial, but the bulk
+of the descriptions and postings stays shared.
+
+Usage with gunicorn (with IAF_NACE_PRELOAD=1 the app module preloads at import):
+
+  IAF_NACE_PRELOAD=1 gunicorn --preload -w 16 -k uvicorn.workers.UvicornWorker iaf_nace_classifier.api:app
+
+`uvicorn --workers` spawns fresh interpreters rather than forking, so it
+cannot share anything; use gunicorn with --preload for that.
+
+`Warmup` runs the same preload on a background thread, so a server can start
+answering liveness checks immediately and report readiness once it is done.
+
+`Warmup.reload()` picks up a changed mapping file without a restart: it
+builds a fresh mapping, index, lookup and engine off the request path, runs
+the reload hooks (e.g. to restart worker pools) and only then publishes the
+new mapping with a new version number. Requests that already hold the old
+mapping finish on it, and result-cache entries of the old index are dropped.
+A failed reload keeps serving the current version. `Warmup.watch()` polls
+the mapping file and reloads when it changes.
+"""
+
+import gc
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .index import get_search_index
+from .mapping import default_mapping, get_nace_lookup, load_mapping, mapping_source_path
+
+
+def preload(
+    mapping_path: Optional[str | Path] = None,
+    engine: Optional[str] = None,
+    fresh: bool = False,
+    freeze: bool = True,
+) -> List[Dict[str, Any]]:
+    """Build the mapping, search index, lookup table and (optionally) NumPy engine, then freeze them.
+
+    Args:
+        mapping_path: Mapping JSON to load (packaged mapping if None)
+        engine: Scoring engine the workers will use; the NumPy engine is
+            only built for "numpy" (None means "python", like `buscar_actividades`)
+        fresh: Read the packaged mapping again instead of reusing `default_mapping()`
+        freeze: Collect and `gc.freeze()` afterwards (only useful before forking)
+
+    Returns:
+        The loaded mapping; pass it (or nothing, for the packaged mapping) to
+        the search and classification functions so they reuse what was built.
+    """
+    mapping = default_mapping() if mapping_path is None and not fresh else load_mapping(mapping_path)
+    index = get_search_index(mapping)
+    get_nace_lookup(mapping)
+
+    if engine == "numpy":
+        from .vectorized import get_vector_engine
+
+        get_vector_engine(index)
+
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    return mapping
+
+
+class ReloadInProgress(RuntimeError):
+    """Another reload is already building the new version."""
+
+
+def _mtime(path: Optional[Path]) -> Optional[float]:
+    try:
+        return path.stat().st_mtime if path is not None else None
+    except OSError:
+        return None
+
+
+class Warmup:
+    """Runs `preload()` once, in the background or inline, and tracks its state.
+
+    `wait()` blocks until the structures are ready and returns the mapping;
+    `status()` reports progress for readiness endpoints.
+    """
+
+    def __init__(self, mapping_path: Optional[str | Path] = None, engine: Optional[str] = None):
+        self.mapping_path = mapping_path
+        self.engine = engine
+        self.mapping: Optional[List[Dict[str, Any]]] = None
+        self.error: Optional[BaseException] = None
+        self.seconds: Optional[float] = None
+        self.version = 0
+        self.reloads = 0
+        self.reload_error: Optional[str] = None
+        # Called with the new mapping after it is built and before it is published
+        self.reload_hooks: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._source = mapping_source_path(mapping_path)
+        self._source_mtime: Optional[float] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._started = False
+        self._watching = False
+
+    def _claim(self) -> bool:
+        with self._lock:
+            if self._started:
+                return False
+            self._started = True
+            return True
+
+    def run(self) -> None:
+        """Preload in the calling thread (no-op if already started elsewhere)."""
+        if not self._claim():
+            return
+        start = time.perf_counter()
+        try:
+            self._source_mtime = _mtime(self._source)
+            self.mapping = preload(self.mapping_path, self.engine)
+            self.version = 1
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - start
+            self._done.set()
+
+    def start(self) -> None:
+        """Preload on a daemon thread (no-op if already started)."""
+        if self._started:
+            return
+        threading.Thread(target=self.run, name="iaf-nace-warmup", daemon=True).start()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set() and self.error is None
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """Mapping once warm-up has finished; None on timeout. Raises RuntimeError if warm-up failed."""
+        self.start()
+        if not self._done.wait(timeout):
+            return None
+        if self.error is not None:
+            raise RuntimeError("warm-up failed") from self.error
+        return self.mapping
+
+    def reload(self) -> Dict[str, Any]:
+        """Rebuild everything from the mapping file and publish it as a new version.
+
+        Raises ReloadInProgress if another reload (or the initial warm-up) is
+        running, and whatever loading raised if the new mapping is invalid;
+        either way the current version keeps serving.
+        """
+        if not self._done.is_set():
+            raise ReloadInProgress("the initial warm-up has not finished")
+        if not self._reload_lock.acquire(blocking=False):
+            raise ReloadInProgress("a reload is already in progress")
+        try:
+            start = time.perf_counter()
+            mtime = _mtime(self._source)
+            try:
+                mapping = preload(self.mapping_path, self.engine, fresh=True, freeze=False)
+                for hook in self.reload_hooks:
+                    hook(mapping)
+            except Exception as e:
+                self.reload_error = f"{type(e).__name__}: {e}"
+                raise
+            # Publish: a single reference assignment, so readers see either version whole
+            self.mapping = mapping
+            self.version += 1
+            self.reloads += 1
+            self.reload_error = None
+            self._source_mtime = mtime
+            self.error = None
+            self._done.set()
+            # Results of the previous index can no longer be hit (the cache key
+            # includes the index version); free them now
+            from .search import clear_cache
+
+            clear_cache(plans=False)
+            return {"version": self.version, "seconds": round(time.perf_counter() - start, 3)}
+        finally:
+            self._reload_lock.release()
+
+    def watch(self, interval: float) -> None:
+        """Poll the mapping file every `interval` seconds on a daemon thread and reload when it changes."""
+        if self._watching or interval <= 0 or self._source is None:
+            return
+        self._watching = True
+
+        def loop() -> None:
+            while True:
+                time.sleep(interval)
+                if not self.ready:
+                    continue
+                mtime = _mtime(self._source)
+                if mtime is None or mtime == self._source_mtime:
+                    continue
+                try:
+                    self.reload()
+                except Exception:
+                    # Recorded in reload_error; retried only once the file changes again
+                    self._source_mtime = mtime
+
+        threading.Thread(target=loop, name="iaf-nace-watch", daemon=True).start()
+
+    def status(self) -> Dict[str, Any]:
+        if not self._started:
+            state = "pending"
+        elif not self._done.is_set():
+            state = "warming_up"
+        else:
+            state = "error" if self.error is not None else "ready"
+        return {
+            "status": state,
+            "version": self.version,
+            "seconds": round(self.seconds, 3) if self.seconds is not None else None,
+            "error": repr(self.error) if self.error is not None else None,
+            "reloads": self.reloads,
+            "reload_error": self.reload_error,
+        }
@@ -5,37 +5,28 @@ Este módulo permite buscar códigos NACE y sectores IAF a partir de
 descripciones de actividades empresariales usando búsqueda por relevancia.
 """
 
+import heapq
 import json
+import os
 import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-
-from .mapping import load_mapping
-
-
-def normalizar_texto(texto: str) -> str:
-    """Normaliza texto para búsqueda: minúsculas, sin acentos.
-
-    Args:
-        texto: Texto a normalizar
-
-    Returns:
-        Texto normalizado en minúsculas y sin acentos
-    """
-    texto = texto.lower()
-    # Quitar acentos comunes
-    replacements = {
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
-        'à': 'a', 'è': 'e', 'ì': 'i', 'ò': 'o', 'ù': 'u',
-        'ä': 'a', 'ë': 'e', 'ï': 'i', 'ö': 'o', 'ü': 'u',
-        'ñ': 'n'
-    }
-    for old, new in replacements.items():
-        texto = texto.replace(old, new)
-    return texto
-
-
-def calcular_relevancia(query: str, descripcion: str) -> float:
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from . import metrics, synonyms
+from .cache import LRUCache
+from .index import IndexedDocument, SearchIndex, get_search_index, ordinals
+from .intents import AjustesIntencion, ajustes_para, detectar_intenciones, ordenar_intenciones
+from .synonyms import TablaSinonimos
+from .text import (
+    GENERIC_TERMS,
+    STOPWORDS,
+    normalizar_texto,
+    palabras_significativas,
+    separar_exclusion,
+)
+
+
+def calcular_relevancia(query: "str | QueryPlan", descripcion: str) -> Tuple[float, float, Optional[str]]:
     """Calcula un score de relevancia entre la query y la descripción.
 
     El score se basa en:
@@ -43,43 +34,28 @@ def calcular_relevancia(query: str, descripcion: str) -> float:
     - Palabras clave individuales: +5 a +10 puntos cada una
     - Densidad de coincidencias: +0 a +20 puntos
 
+    Es la implementación de referencia: `buscar_actividad` usa un índice
+    precompilado (`SearchIndex`) que produce los mismos scores.
+
     Args:
-        query: Texto de búsqueda
+        query: Texto de búsqueda, o un `QueryPlan` ya compilado (al puntuar
+            muchas descripciones con la misma query, así no se vuelve a
+            analizar en cada llamada)
         descripcion: Descripción NACE donde buscar
 
     Returns:
-        Score de relevancia (mayor = más relevante)
+        (score, score sin la penalización por exclusión, segmento de exclusión
+        que penaliza o None); mayor score = más relevante
     """
-    # Normalizar texto
-    desc_norm = normalizar_texto(descripcion)
-    query_norm = normalizar_texto(query)
-    
+    # Normalizar texto y extraer palabras clave (ignorar palabras comunes)
+    plan = query if isinstance(query, QueryPlan) else QueryPlan(palabras_significativas(normalizar_texto(query)))
+
     # Detectar exclusiones explícitas
     # Solo usamos frases que indican claramente el inicio de una sección de exclusión.
     # Evitamos "excepto" o "excluye" porque pueden aparecer en medio de frases descriptivas.
-    exclusion_phrases = [
-        'esta clase no comprende', 
-        'este grupo no comprende', 
-        'esta división no comprende', 
-        'esta division no comprende',
-        'no comprende'
-    ]
-    exclusion_text = ""
-    
-    for phrase in exclusion_phrases:
-        if phrase in desc_norm:
-            parts = desc_norm.split(phrase, 1)
-            desc_norm = parts[0] # El texto principal es lo que hay ANTES de la exclusión
-            exclusion_text = parts[1] # El texto de exclusión es lo que hay DESPUÉS
-            break
+    desc_norm, exclusion_text = separar_exclusion(normalizar_texto(descripcion))
 
-    # Extraer palabras clave (ignorar palabras comunes)
-    stopwords = {
-        'el', 'la', 'los', 'las', 'de', 'del', 'y', 'o', 'a', 'en', 'con', 'por', 'para',
-        'que', 'esta', 'este', 'esta', 'un', 'una', 'unos', 'unas', 'se', 'su', 'sus',
-        'excepto', 'no', 'comprende', 'clase', 'vease', 'incluye', 'excluye'
-    }
-    palabras_query = [p for p in re.findall(r'\w+', query_norm) if len(p) > 2 and p not in stopwords]
+    palabras_query = plan.palabras
 
     if not palabras_query:
         return 0.0, 0.0, None
@@ -89,63 +65,42 @@ def calcular_relevancia(query: str, descripcion: str) -> float:
     title_norm = parts[0]
     body_norm = parts[1] if len(parts) > 1 else ""
 
-    # Palabras genéricas que aportan poca información específica
-    GENERIC_TERMS = {
-        'fabricacion', 'produccion', 'manufactura', 'elaboracion', 'confeccion',
-        'comercio', 'venta', 'distribucion', 'tienda', 'almacen', 'mayor', 'menor',
-        'reparacion', 'mantenimiento', 'instalacion',
-        'servicios', 'actividades', 'construccion', 'trabajos',
-        'productos', 'articulos', 'bienes', 'materiales', 'equipos', 'maquinas', 'sistemas'
-    }
-
     def _calc_score(text_norm, weight=1.0):
         if not text_norm:
             return 0.0
             
         local_score = 0.0
         
-        # Palabras clave
-        for palabra in palabras_query:
+        # Palabras clave: 15 puntos las específicas, 2 las genéricas; la mitad
+        # si solo aparecen como subcadena (el plan trae los patrones \b...\b compilados)
+        palabras_encontradas = 0
+        for (palabra, base_points, half_points), matcher in zip(plan.terminos, plan.matchers, strict=True):
             if palabra in text_norm:
-                base_points = 15.0  # Puntos base aumentados para palabras específicas
-                
-                if palabra in GENERIC_TERMS:
-                    base_points = 2.0  # Puntos reducidos para palabras genéricas
-                
-                if re.search(r'\b' + re.escape(palabra) + r'\b', text_norm):
+                palabras_encontradas += 1
+                if matcher.search(text_norm):
                     local_score += base_points
                 else:
-                    local_score += base_points * 0.5
+                    local_score += half_points
 
         # Densidad
-        palabras_encontradas = sum(1 for p in palabras_query if p in text_norm)
-        if len(palabras_query) > 0:
-            densidad = palabras_encontradas / len(palabras_query)
-            local_score += densidad * 20.0
+        densidad = palabras_encontradas / len(palabras_query)
+        local_score += densidad * 20.0
 
         # Frases (bigramas)
         # Generar bigramas solo de palabras significativas (sin stopwords)
         # Esto evita que "fabricación de" sume puntos, pero permite que "fabricación muebles" sí lo haga.
         
         # Palabras significativas del texto (normalizado)
-        text_words = [p for p in re.findall(r'\w+', text_norm) if len(p) > 2 and p not in stopwords]
+        text_words = [p for p in re.findall(r'\w+', text_norm) if len(p) > 2 and p not in STOPWORDS]
         text_bigrams = set()
         if len(text_words) > 1:
             for i in range(len(text_words) - 1):
                 text_bigrams.add(f"{text_words[i]} {text_words[i+1]}")
 
-        # Palabras significativas de la query (ya las tenemos en palabras_query)
-        if len(palabras_query) > 1:
-            for i in range(len(palabras_query) - 1):
-                bigram = f"{palabras_query[i]} {palabras_query[i+1]}"
-                
-                if bigram in text_bigrams:
-                    # Verificar si el bigram está compuesto solo por términos genéricos
-                    w1, w2 = bigram.split()
-                    if w1 in GENERIC_TERMS and w2 in GENERIC_TERMS:
-                         local_score += 5.0 # Muy poco valor si ambos son genéricos
-                    else:
-                         local_score += 30.0  # Bonus alto para frases específicas
+        # Bigramas de la query, con su bonus: 5 si ambos términos son genéricos, 30 si no
+        for bigram, bonus in plan.bigramas:
+            if bigram in text_bigrams:
+                local_score += bonus
         
         return local_score * weight
 
@@ -157,15 +112,12 @@ def calcular_relevancia(query: str, descripcion: str) -> float:
     # Penalización por exclusiones
     # Si una palabra clave aparece en la sección de exclusión, penalizar fuertemente
     if exclusion_text:
-        # Analizar palabras de la exclusión
-        exclusion_words = [p for p in re.findall(r'\w+', exclusion_text) if len(p) > 2 and p not in stopwords]
-        
         # Crear segmentos de exclusión (separados por comas o 'y')
         # Esto es una aproximación. Lo ideal sería un análisis sintáctico más profundo.
         segmentos = re.split(r'[,;]|\by\b', exclusion_text)
         
         for segmento in segmentos:
-            seg_words = [p for p in re.findall(r'\w+', segmento) if len(p) > 2 and p not in stopwords]
+            seg_words = [p for p in re.findall(r'\w+', segmento) if len(p) > 2 and p not in STOPWORDS]
             if not seg_words:
                 continue
                 
@@ -174,7 +126,7 @@ def calcular_relevancia(query: str, descripcion: str) -> float:
             # Si query es solo "muebles", NO penalizar (porque podría ser muebles de metal).
             # PERO: Si el segmento es solo una palabra "excepto muebles", entonces sí penalizar.
             
-            query_words_set = set(palabras_query)
+            query_words_set = plan.palabras_set
             
             # HEURÍSTICA DE CONTRADICCIÓN:
             # Si el segmento de exclusión está contenido completamente en la parte "positiva" del título,
@@ -184,7 +136,7 @@ def calcular_relevancia(query: str, descripcion: str) -> float:
             # 1. Obtener parte positiva del título (antes de "excepto")
             # Nota: title_norm ya está normalizado
             positive_title = title_norm.split('excepto')[0]
-            positive_title_words = set(p for p in re.findall(r'\w+', positive_title) if len(p) > 2 and p not in stopwords)
+            positive_title_words = set(p for p in re.findall(r'\w+', positive_title) if len(p) > 2 and p not in STOPWORDS)
             
             # 2. Verificar si el segmento de exclusión es un subset del título positivo
             # Si seg_words es subset de positive_title_words, significa que estamos excluyendo
@@ -211,11 +163,442 @@ def calcular_relevancia(query: str, descripcion: str) -> float:
     return score, base_score, exclusion_hit
 
 
+def _rasgos_consulta(plan: "QueryPlan", index: SearchIndex) -> Tuple[int, List[int]]:
+    """Bitsets de documentos que determinan la puntuación base de `plan`.
+
+    Devuelve los candidatos (documentos con alguna palabra de la query como
+    subcadena del título o del cuerpo) y la lista de rasgos: por cada palabra
+    distinta de la query, en el orden de `plan.terminos`, (subcadena del
+    título, palabra del título, subcadena del cuerpo, palabra del cuerpo); por
+    cada bigrama, (título, cuerpo); y al final los documentos sin título y sin
+    cuerpo. Dos documentos con los mismos rasgos tienen la misma puntuación base.
+    """
+    rasgos: List[int] = []
+    candidatos = 0
+    for palabra in dict.fromkeys(plan.palabras):
+        bits = index.word_bits(palabra)
+        rasgos.extend(bits)
+        candidatos |= bits[0] | bits[2]
+    for bigram, _ in plan.bigramas:
+        rasgos.extend(index.bigram_bits(bigram))
+    rasgos.append(index.empty_title_bits)
+    rasgos.append(index.empty_body_bits)
+    return candidatos, rasgos
+
+
+def _calc_score_patron(
+    plan: "QueryPlan",
+    patron: int,
+    terminos: Sequence[Tuple[int, float, float]],
+    bigramas: Sequence[Tuple[int, float]],
+    campo: int,
+    bit_vacio: int,
+    weight: float,
+) -> float:
+    """Equivalente a `_calc_score` de `calcular_relevancia` para los documentos con
+    los rasgos `patron` (bit k = rasgo k de `_rasgos_consulta`) en el campo
+    `campo` (0 título, 1 cuerpo).
+
+    Las operaciones de coma flotante son las mismas y en el mismo orden, así
+    que el resultado es idéntico.
+    """
+    if patron >> bit_vacio & 1:
+        return 0.0
+
+    local_score = 0.0
+
+    # Palabras clave
+    palabras_encontradas = 0
+    for pos, base_points, half_points in terminos:
+        if patron >> (pos + 2 * campo) & 1:
+            palabras_encontradas += 1
+            if patron >> (pos + 2 * campo + 1) & 1:
+                local_score += base_points
+            else:
+                local_score += half_points
+
+    # Densidad
+    densidad = palabras_encontradas / plan.n_palabras
+    local_score += densidad * 20.0
+
+    # Frases (bigramas)
+    for pos, bonus in bigramas:
+        if patron >> (pos + campo) & 1:
+            local_score += bonus
+
+    return local_score * weight
+
+
+def _grupos_base(plan: "QueryPlan", documentos: int, rasgos: Sequence[int]) -> List[Tuple[int, float]]:
+    """Documentos del bitset `documentos` repartidos en grupos con los mismos
+    rasgos, con su puntuación base (título x2 + cuerpo x1): [(bitset, base)].
+
+    Los grupos se forman con AND/XOR de bitsets, sin recorrer los documentos,
+    y la puntuación se calcula una vez por grupo.
+    """
+    grupos = [(documentos, 0)] if documentos else []
+    for k, rasgo in enumerate(rasgos):
+        if not rasgo:
+            continue
+        bit = 1 << k
+        divididos = []
+        for bits, patron in grupos:
+            dentro = bits & rasgo
+            if not dentro:
+                divididos.append((bits, patron))
+            elif dentro == bits:
+                divididos.append((bits, patron | bit))
+            else:
+                divididos.append((dentro, patron | bit))
+                divididos.append((bits ^ dentro, patron))
+        grupos = divididos
+
+    # Posición de los rasgos de cada término y bigrama dentro del patrón
+    posiciones = {p: 4 * i for i, p in enumerate(dict.fromkeys(plan.palabras))}
+    terminos = [(posiciones[p], base, half) for p, base, half in plan.terminos]
+    inicio_bigramas = 4 * len(posiciones)
+    bigramas = [(inicio_bigramas + 2 * i, bonus) for i, (_, bonus) in enumerate(plan.bigramas)]
+    bit_vacio = inicio_bigramas + 2 * len(bigramas)
+
+    return [
+        (
+            bits,
+            _calc_score_patron(plan, patron, terminos, bigramas, 0, bit_vacio, 2.0)
+            + _calc_score_patron(plan, patron, terminos, bigramas, 1, bit_vacio + 1, 1.0),
+        )
+        for bits, patron in grupos
+    ]
+
+
+MIN_SCORE_THRESHOLD = 20.0  # Umbral mínimo para considerar un resultado válido
+
+ENGINES = ("python", "numpy", "reference")
+
+# Caché de resultados por query canónica. Tamaño y TTL (segundos) configurables
+# con IAF_NACE_CACHE_SIZE (0 la desactiva) e IAF_NACE_CACHE_TTL, o con `configure_cache`.
+_RESULT_CACHE = LRUCache(
+    maxsize=int(os.environ.get("IAF_NACE_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("IAF_NACE_CACHE_TTL", "0")) or None,
+)
+
+
+# Planes compilados por texto de query (ver `planificar_consulta`). Tamaño
+# configurable con IAF_NACE_PLAN_CACHE_SIZE (0 la desactiva).
+_PLAN_CACHE = LRUCache(maxsize=int(os.environ.get("IAF_NACE_PLAN_CACHE_SIZE", "4096")))
+
+
+class QueryPlan:
+    """Parte de la búsqueda que solo depende de la query, compilada una vez.
+
+    Contiene todo lo que el cálculo de relevancia necesita de la query, de
+    modo que puntuar cada documento solo evalúa el plan contra los datos
+    precalculados del documento:
+
+    - `palabras`: palabras clave de la query expandida con sinónimos, en orden
+      y con repeticiones (cada repetición puntúa)
+    - `terminos`: (palabra, puntos por palabra completa, puntos por subcadena),
+      con el peso de las palabras genéricas (`GENERIC_TERMS`) ya aplicado
+    - `bigramas`: (bigrama, bonus) de palabras consecutivas, en orden
+    - `palabras_set`: para las cláusulas de exclusión
+    - `intenciones`: intenciones detectadas en la query original, y
+      `ajustes`, su tabla compilada de ajustes por división (ver `intents`)
+    - `matchers`: patrones `\\b...\\b` compilados, para `calcular_relevancia`
+
+    Es inmutable: los planes se comparten entre hilos y se guardan en caché.
+    `to_dict`/`from_dict` lo serializan (p. ej. para enviarlo a otro proceso);
+    los campos derivados se recalculan al reconstruirlo.
+    """
+
+    __slots__ = (
+        "query", "expanded_query", "palabras", "intenciones", "ajustes", "clave",
+        "n_palabras", "palabras_set", "terminos", "bigramas", "_matchers",
+    )
+
+    def __init__(
+        self,
+        palabras: Sequence[str],
+        intenciones: Iterable[str] = (),
+        expanded_query: str = "",
+        query: str = "",
+    ):
+        palabras = tuple(palabras)
+        intenciones = frozenset(intenciones)
+        self.query = query
+        self.expanded_query = expanded_query
+        self.palabras = palabras
+        self.intenciones = intenciones
+        self.ajustes = ajustes_para(intenciones)
+        # Dos planes con la misma clave producen exactamente el mismo resultado
+        self.clave = (palabras, intenciones)
+        self.n_palabras = len(palabras)
+        self.palabras_set = frozenset(palabras)
+        terminos = []
+        for palabra in palabras:
+            base_points = 2.0 if palabra in GENERIC_TERMS else 15.0
+            terminos.append((palabra, base_points, base_points * 0.5))
+        self.terminos = tuple(terminos)
+        bigramas = []
+        for w1, w2 in zip(palabras, palabras[1:], strict=False):
+            bonus = 5.0 if (w1 in GENERIC_TERMS and w2 in GENERIC_TERMS) else 30.0
+            bigramas.append((f"{w1} {w2}", bonus))
+        self.bigramas = tuple(bigramas)
+        self._matchers: Optional[Tuple[re.Pattern, ...]] = None
+
+    @classmethod
+    def compilar(cls, query: str, sinonimos: Optional[TablaSinonimos] = None) -> "QueryPlan":
+        """Normaliza la query, detecta su intención y la expande con sinónimos.
+
+        `sinonimos` es la tabla a usar (por defecto, la en uso; ver `synonyms`).
+        """
+        reloj = metrics.reloj()
+        # Detectar intención de la búsqueda
+        # Usar texto normalizado para coincidir con las keywords (que no tienen acentos)
+        query_norm_intent = normalizar_texto(query)
+        reloj.etapa("normalizacion")
+
+        intenciones = detectar_intenciones(query_norm_intent)
+        reloj.etapa("intencion")
+
+        # Expansión de consulta con sinónimos (palabras y frases de varias palabras)
+        if sinonimos is None:
+            sinonimos = synonyms.tabla()
+        expanded_query_words = sinonimos.expandir(query_norm_intent.split())
+
+        # Reconstruir query expandida para el cálculo de relevancia
+        # Nota: No reemplazamos, agregamos. Así "reparación de computadoras" se convierte
+        # efectivamente en "reparación de computadoras ordenadores", haciendo match con ambos.
+        expanded_query = " ".join(expanded_query_words)
+
+        # Palabras clave de la query expandida, comunes a todos los documentos
+        palabras = palabras_significativas(normalizar_texto(expanded_query))
+        reloj.etapa("sinonimos")
+        return cls(palabras, intenciones, expanded_query, query)
+
+    @property
+    def matchers(self) -> Tuple[re.Pattern, ...]:
+        """Patrón de palabra completa de cada término (solo lo usa el motor de referencia)."""
+        if self._matchers is None:
+            self._matchers = tuple(re.compile(r'\b' + re.escape(p) + r'\b') for p in self.palabras)
+        return self._matchers
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "query": self.query,
+            "expanded_query": self.expanded_query,
+            "palabras": list(self.palabras),
+            "intenciones": ordenar_intenciones(self.intenciones),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QueryPlan":
+        return cls(
+            data["palabras"],
+            data.get("intenciones", ()),
+            data.get("expanded_query", ""),
+            data.get("query", ""),
+        )
+
+    def __reduce__(self):
+        # Sin los patrones compilados ni los campos derivados
+        return (QueryPlan.from_dict, (self.to_dict(),))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, QueryPlan) and self.clave == other.clave
+
+    def __hash__(self) -> int:
+        return hash(self.clave)
+
+    def __repr__(self) -> str:
+        return f"QueryPlan({self.query!r}, palabras={list(self.palabras)!r})"
+
+
+def planificar_consulta(query: str) -> QueryPlan:
+    """`QueryPlan` de `query`, reutilizando el de una llamada anterior con el mismo texto.
+
+    La clave incluye la versión de la tabla de sinónimos: al recargarla, los
+    planes anteriores dejan de usarse.
+    """
+    sinonimos = synonyms.tabla()
+    key = (sinonimos.version, query)
+    plan = _PLAN_CACHE.get(key)
+    if plan is None:
+        plan = QueryPlan.compilar(query, sinonimos)
+        _PLAN_CACHE.put(key, plan)
+    return plan
+
+
+# (relevancia, documento, razón de exclusión)
+Candidato = Tuple[float, IndexedDocument, Optional[str]]
+
+
+def _construir_resultado(
+    doc: IndexedDocument, relevancia: float, razon_exclusion: Optional[str] = None
+) -> Dict[str, Any]:
+    descripcion = doc.descripcion
+    resultado = {
+        'codigo_nace': doc.codigo_nace,
+        'descripcion_nace': descripcion[:300] + '...' if len(descripcion) > 300 else descripcion,
+        'descripcion_completa': descripcion,
+        'codigo_iaf': doc.codigo_iaf,
+        'nombre_iaf': doc.nombre_iaf,
+        'relevancia': relevancia
+    }
+    if razon_exclusion is not None:
+        resultado['razon_exclusion'] = razon_exclusion
+    return resultado
+
+
+def _seleccionar(
+    resultados: List[Candidato], excluidos: List[Candidato], top_n: int
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Ordena, aplica el umbral dinámico y construye la respuesta de `buscar_actividad`.
+
+    Las listas deben llegar en el orden del mapeo: el ordenamiento es estable,
+    así que ese es el orden de desempate.
+    """
+    # Ordenar por relevancia (mayor a menor)
+    resultados.sort(key=lambda x: x[0], reverse=True)
+    excluidos.sort(key=lambda x: x[0], reverse=True)
+
+    # Filtrado Dinámico (Dynamic Thresholding) y Mínimo Absoluto
+    if resultados:
+        max_score = resultados[0][0]
+
+        # Si el mejor resultado es muy pobre, no devolver nada
+        if max_score < MIN_SCORE_THRESHOLD:
+            resultados = []
+        else:
+            threshold = max_score * 0.5
+            resultados = [r for r in resultados if r[0] >= threshold]
+
+    if metrics.ENABLED:
+        metrics.RESULTS_ABOVE_THRESHOLD.inc(len(resultados))
+
+    return {
+        'results': [_construir_resultado(doc, score) for score, doc, _ in resultados[:top_n]],
+        # Solo mostrar los top 3 excluidos para no saturar
+        'excluded': [_construir_resultado(doc, score, razon) for score, doc, razon in excluidos[:3]]
+    }
+
+
+def _clasificar_puntuacion(
+    doc: IndexedDocument,
+    ajustes: AjustesIntencion,
+    score: float,
+    base_score: float,
+    exclusion_hit: Optional[str],
+    resultados: List[Candidato],
+    excluidos: List[Candidato],
+) -> None:
+    """Aplica los ajustes por intención y envía el documento a resultados o excluidos."""
+    if score > 0 or (base_score > 50 and exclusion_hit):
+        for ajuste in ajustes.para(doc.nace_div, doc.codigo_nace):
+            score += ajuste
+
+        if score > 0:
+            resultados.append((score, doc, None))
+        elif base_score > 100 and exclusion_hit:
+            # Si tenía buena puntuación base pero fue excluido por una cláusula específica.
+            # Guardamos el score base para mostrar qué tan relevante era
+            excluidos.append((base_score, doc, exclusion_hit))
+
+
+# Margen de las cotas superiores frente a errores de redondeo: la puntuación
+# final suma los ajustes uno a uno y la cota los suma de golpe
+_HOLGURA = 1e-6
+
+
+def _mejores_candidatos(
+    consulta: "QueryPlan",
+    index: SearchIndex,
+    grupos: Sequence[Tuple[int, float]],
+    exclusiones: Dict[int, str],
+    top_n: int,
+) -> Tuple[List[Candidato], List[Candidato], int]:
+    """Los `top_n` mejores resultados y los candidatos excluidos de una consulta.
+
+    Devuelve ambas listas ya ordenadas como las deja `_seleccionar` (relevancia
+    descendente, desempate por orden del mapeo) y el número de documentos
+    evaluados.
+
+    Los documentos penalizados por una exclusión (pocos) se evalúan todos. El
+    resto se recorre por grupos, de mayor a menor puntuación base, con un
+    montículo de los `top_n` mejores: la relevancia final de un documento no
+    supera su base más la suma de los ajustes positivos de intención
+    (`AjustesIntencion.maximo`), así que en cuanto esa cota queda por debajo
+    del peor resultado del montículo o de la mitad del mejor (umbral dinámico)
+    ningún documento restante puede entrar en la respuesta y no se evalúa.
+    Los documentos que la intención deja en 0 o menos se descartan sin entrar
+    en el montículo.
+    """
+    ajustes = consulta.ajustes
+    documentos = index.documents
+    capacidad = max(top_n, 1)
+    monticulo: List[Tuple[float, int, IndexedDocument]] = []  # (relevancia, -ordinal, doc)
+    excluidos: List[Candidato] = []
+    evaluados = 0
+
+    def proponer(score: float, doc: IndexedDocument) -> None:
+        entrada = (score, -doc.ordinal, doc)
+        if len(monticulo) < capacidad:
+            heapq.heappush(monticulo, entrada)
+        elif entrada[:2] > monticulo[0][:2]:
+            heapq.heapreplace(monticulo, entrada)
+
+    # Documentos con exclusión, en orden del mapeo
+    penalizados = 0
+    for ordinal in exclusiones:
+        penalizados |= 1 << ordinal
+    base_penalizados: Dict[int, float] = {}
+    for bits, base in grupos:
+        for ordinal in ordinals(bits & penalizados):
+            base_penalizados[ordinal] = base
+    for ordinal in sorted(base_penalizados):
+        doc = documentos[ordinal]
+        base_score = base_penalizados[ordinal]
+        resultados: List[Candidato] = []
+        _clasificar_puntuacion(
+            doc, ajustes, base_score - 200.0, base_score, exclusiones[ordinal], resultados, excluidos
+        )
+        for score, _, _ in resultados:
+            proponer(score, doc)
+    evaluados += len(base_penalizados)
+
+    # Resto de documentos, por cota superior decreciente
+    mejor = max((e[0] for e in monticulo), default=None)
+    for bits, base_score in sorted(grupos, key=lambda g: g[1], reverse=True):
+        if base_score <= 0:
+            break
+        cota = base_score + ajustes.maximo + _HOLGURA
+        if len(monticulo) == capacidad and cota < monticulo[0][0]:
+            break
+        if mejor is not None and cota < mejor * 0.5:
+            break
+        for ordinal in ordinals(bits & ~penalizados):
+            doc = documentos[ordinal]
+            score = base_score
+            for ajuste in ajustes.para(doc.nace_div, doc.codigo_nace):
+                score += ajuste
+            evaluados += 1
+            if score > 0:
+                proponer(score, doc)
+                if mejor is None or score > mejor:
+                    mejor = score
+
+    monticulo.sort(key=lambda e: (-e[0], -e[1]))
+    excluidos.sort(key=lambda x: x[0], reverse=True)
+    return [(score, doc, None) for score, _, doc in monticulo], excluidos, evaluados
+
+
 def buscar_actividad(
     query: str,
     mapping: Optional[List[Dict[str, Any]]] = None,
     mapping_path: Optional[str | Path] = None,
-    top_n: int = 10
+    top_n: int = 10,
+    index: Optional[SearchIndex] = None,
+    full_scan: bool = False,
+    engine: str = "python",
+    use_cache: bool = True,
 ) -> Dict[str, List[Dict[str, Any]]]:
     """Busca códigos NACE y sectores IAF que coincidan con una descripción de actividad.
 
@@ -224,6 +607,17 @@ def buscar_actividad(
         mapping: Lista de sectores IAF cargada. Si None, se carga desde mapping_path
         mapping_path: Ruta al JSON de mapeo. Si None, usa el archivo por defecto
         top_n: Número máximo de resultados a retornar
+        index: Índice precompilado (`SearchIndex`) a usar. Si None, se obtiene
+            el índice del mapeo con `get_search_index` (se construye una sola vez)
+        full_scan: Si True, puntúa todas las descripciones en lugar de solo las
+            que comparten alguna palabra con la consulta (índice invertido).
+            Los resultados son los mismos; sirve para comparar rankings
+        engine: Motor de puntuación: "python" (índice, por defecto), "numpy"
+            (matricial, requiere numpy; ver `iaf_nace_classifier.vectorized`) o
+            "reference" (recorrido completo con `calcular_relevancia`)
+        use_cache: Si True (por defecto), reutiliza el resultado de una query
+            canónicamente equivalente ya calculada (ver `cache_info`). Los
+            motores "reference" y `full_scan=True` nunca usan la caché
 
     Returns:
         Diccionario con dos listas: 'results' (resultados principales) y 'excluded' (candidatos excluidos).
@@ -243,383 +637,272 @@ def buscar_actividad(
         ...     mejor = resultados['results'][0]
         ...     print(f"NACE: {mejor['codigo_nace']}, IAF: {mejor['codigo_iaf']}")
     """
-    # Cargar mapeo si no se proporciona
-    if mapping is None:
-        if mapping_path is None:
-            # Usar el archivo por defecto del paquete
-            mapping = load_mapping()
-        else:
-            # Cargar desde archivo JSON directamente
-            with open(mapping_path, 'r', encoding='utf-8') as f:
-                mapping = json.load(f)
+    if engine not in ENGINES:
+        raise ValueError(f"Motor desconocido: {engine!r}. Opciones: {', '.join(ENGINES)}")
 
-    resultados = []
-    excluidos = []  # Candidatos relevantes pero excluidos
+    index = _resolver_indice(mapping, mapping_path, index)
+    consulta = planificar_consulta(query)
+    if engine == "reference" or full_scan or not use_cache or not consulta.palabras:
+        return _buscar_preparadas([consulta], index, top_n, full_scan, engine)[0]
 
-    # Detectar intención de la búsqueda
-    # Usar texto normalizado para coincidir con las keywords (que no tienen acentos)
-    query_norm_intent = normalizar_texto(query)
-    
-    intent_manufacturing = any(w in query_norm_intent for w in ['fabricacion', 'fabricación', 'fabrica', 'fábrica', 'produccion', 'producción', 'manufactura', 'elaboracion', 'elaboración', 'confeccion', 'confección'])
-    intent_trade = any(w in query_norm_intent for w in ['comercio', 'venta', 'distribucion', 'distribución', 'tienda', 'almacen', 'almacén', 'mayor', 'menor'])
-
-    # Diccionario de sinónimos para expansión de consulta
-    SYNONYMS = {
-        'computadora': 'ordenador',
-        'computadoras': 'ordenadores',
-        'laptop': 'ordenador',
-        'laptops': 'ordenadores',
-        'pc': 'ordenador',
-        'celular': 'telefono',
-        'celulares': 'telefonos',
-        'movil': 'telefono',
-        'moviles': 'telefonos',
-        'carro': 'vehiculo',
-        'carros': 'vehiculos',
-        'auto': 'vehiculo',
-        'autos': 'vehiculos',
-        'coche': 'vehiculo',
-        'coches': 'vehiculos',
-        'camion': 'vehiculo',
-        'camiones': 'vehiculos',
-        'software': 'informatica',
-        'app': 'informatica',
-        'apps': 'informatica',
-        'web': 'informatica',
-        'internet': 'informatica',
-        'consultoria': 'consultores',
-        'asesoria': 'consultores',
-        'tienda': 'comercio',
-        'almacen': 'comercio',
-        'bodega': 'almacenamiento',
-        'basura': 'desechos',
-        'basuras': 'desechos',
-        'residuos': 'desechos',
-        'hospital': 'asistencia',
-        'clinica': 'asistencia',
-        'medico': 'asistencia',
-        'salud': 'asistencia',
-        'educacion': 'enseñanza',
-        'escuela': 'enseñanza',
-        'colegio': 'enseñanza',
-        'universidad': 'enseñanza',
-        'restaurante': 'comidas',
-        'bar': 'bebidas',
-        'cafeteria': 'bebidas',
-        'hotel': 'alojamiento',
-        'hostal': 'alojamiento',
-        'turismo': 'agencias',
-        'viajes': 'agencias',
-        'reciclaje': 'valorizacion', # NACE usa "valorización" para reciclaje
-        'reciclar': 'valorizacion',
-        'chatarra': 'desechos',
-        'desperdicios': 'desechos',
-        'barco': 'buque',
-        'barcos': 'buques',
-        'embarcacion': 'buque',
-        'embarcaciones': 'buques',
-        'joyas': 'joyeria',
-        'joya': 'joyeria',
-        'digital': 'graficas',
-    'sorting': 'clasificacion',
-    'scrap': 'chatarra',
-    'waste': 'residuos',
-    'aparthoteles': 'hoteles',
-    'cervecerias': 'bares', # Para asociar impresión digital con artes gráficas (IAF 9)
-    'notaria': 'notarios',
-    'notario': 'notarios',
-    'abogado': 'juridicas',
-    'abogados': 'juridicas',
-    'bufete': 'juridicas',
-    'maquinados': 'mecanica',
-    'maquinado': 'mecanica',
-    'mecanizado': 'mecanica',
-    
-    # IT / Digital
-    'saas': 'informatica',
-    'cloud': 'informatica',
-    'ecommerce': 'internet', # Maps to 47.91 via 'internet' (usually) or trade logic
-    'ciberseguridad': 'informatica',
-    'blockchain': 'informatica',
-    'bigdata': 'datos',
-    'desarrollador': 'programacion',
-    'programador': 'programacion',
-    
-    # Marketing
-    'seo': 'publicidad',
-    'sem': 'publicidad',
-    'community': 'publicidad', # Community manager
-    
-    # Logística
-    'picking': 'almacenamiento',
-    'packing': 'envasado',
-    'delivery': 'correos', # 53.20 "actividades postales y de correos"
-    'rider': 'correos',
-    'paqueteria': 'postal',
-    'envios': 'postal',
-    
-    # Construcción
-    'pladur': 'revocamiento',
-    'drywall': 'revocamiento',
-    'albañileria': 'construccion',
-    'reformas': 'construccion',
-    
-    # Energía
-    'fotovoltaica': 'electrica',
-    'solar': 'electrica',
-    'eolica': 'electrica',
-    'biomasa': 'electrica',
-    'renovables': 'electrica',
-    
-    # Servicios
-    'callcenter': 'llamadas',
-    'contactcenter': 'llamadas',
-    'coworking': 'inmobiliarias', # 68.20
-    
-    # Nuevos Sinónimos Globales (Auditoría Completa)
-    # IAF 1-3 (Primario/Alimentación)
-    'agrotech': 'agricultura',
-    'hidroponia': 'cultivos',
-    'mineria': 'extraccion',
-    'excavacion': 'extraccion',
-    'aridos': 'grava',
-    'snacks': 'alimenticios',
-    'vegan': 'alimenticios',
-    'gourmet': 'alimenticios',
-    
-    # IAF 4-9 (Manufactura Ligera / Papel / Media)
-    'moda': 'confeccion',
-    'fashion': 'confeccion',
-    'ebanisteria': 'muebles',
-    'aserradero': 'aserrado',
-    'packaging': 'envases',
-    'periodismo': 'agencias', # 63.91 Agencias de noticias
-    'rotulacion': 'impresion',
-    '3d': 'impresion',
-    
-    # IAF 10-16 (Química / Plástico / Minerales)
-    'cosmetica': 'perfumes',
-    'perfumeria': 'perfumes',
-    'biotech': 'investigacion', # 72.11
-    'laboratorio': 'ensayos', # 71.20
-    'polimeros': 'plasticos',
-    'prefabricados': 'hormigon',
-    
-    # IAF 17-23 (Metal / Maquinaria / Transporte)
-    'cnc': 'mecanica',
-    'torneria': 'mecanica',
-    'caldereria': 'estructuras',
-    'robotica': 'maquinaria',
-    'automatizacion': 'maquinaria',
-    'chips': 'componentes',
-    'sensores': 'instrumentos',
-    'astillero': 'barcos',
-    'yates': 'barcos',
-    'drones': 'aeronautica', # 30.30
-    'trenes': 'ferroviario',
-    
-    # IAF 24-27 (Reciclaje / Energía / Agua)
-    'chatarreria': 'residuos', # 38
-    'biogas': 'gas',
-    'depuradora': 'alcantarillado',
-    
-    # IAF 28-32 (Construcción / Comercio / Transporte / Finanzas)
-    'electricista': 'instalaciones',
-    'retail': 'menor', # Comercio al por menor (47)
-    'concesionario': 'vehiculos',
-    'taller': 'mantenimiento',
-    'hosteleria': 'restaurantes',
-    'turismo': 'agencias', # Agencias de viaje
-    'mudanzas': 'transporte',
-    'fintech': 'financieros',
-    
-    # IAF 33-39 (Servicios Profesionales / Públicos / Sociales)
-    'devops': 'informatica',
-    'agile': 'consultoria',
-    'project': 'consultoria', # Project management
-    'facility': 'limpieza', # Facility management (often cleaning/maintenance)
-    'ayuntamiento': 'publica',
-    'elearning': 'educacion', # 85
-    'bootcamp': 'educacion',
-    'master': 'educacion',
-    'fisioterapia': 'sanitarias',
-    'estetica': 'belleza',
-    'wellness': 'fisico', # 96.04 Bienestar físico
-    'ong': 'asociativas', # 94
-    'fundacion': 'asociativas',
-    'voluntariado': 'social',
-    
-    # Decoración / Navidad
-    'navidad': 'regalo',
-    'navideñas': 'regalo',
-    'navidenas': 'regalo',
-    'adornos': 'regalo',
-    'decoracion': 'regalo',
-    
-    # Ambigüedad / Otros
-    'dolor': 'medicina',
-    'universitaria': 'educacion',
-    }
+    key = clave_cache(consulta, index, top_n)
+    respuesta = _RESULT_CACHE.get(key)
+    if respuesta is None:
+        respuesta = _buscar_preparadas([consulta], index, top_n, full_scan, engine)[0]
+        _RESULT_CACHE.put(key, respuesta)
+    # La respuesta guardada en caché nunca se entrega: el llamador puede modificar la suya
+    return _copiar_respuesta(respuesta)
 
-    # Expansión de consulta con sinónimos
-    query_words = query_norm_intent.split()
-    expanded_query_words = []
-    for word in query_words:
-        expanded_query_words.append(word)
-        if word in SYNONYMS:
-            expanded_query_words.append(SYNONYMS[word])
-    
-    # Reconstruir query expandida para el cálculo de relevancia
-    # Nota: No reemplazamos, agregamos. Así "reparación de computadoras" se convierte 
-    # efectivamente en "reparación de computadoras ordenadores", haciendo match con ambos.
-    expanded_query = " ".join(expanded_query_words)
-
-    # Buscar en todas las descripciones NACE
-    for sector in mapping:
-        codigo_iaf = sector.get('codigo_iaf')
-        nombre_iaf = sector.get('nombre_iaf', '')
-
-        for desc_obj in sector.get('descripcion_nace', []):
-            codigo_nace = desc_obj.get('codigo')
-            descripcion = desc_obj.get('descripcion', '')
-
-            # Usar la query expandida para el cálculo
-            score, base_score, exclusion_hit = calcular_relevancia(expanded_query, descripcion)
-            
-            if score > 0 or (base_score > 50 and exclusion_hit):
-                # Ajuste por intención
-                # Extraer división NACE (primeros 2 dígitos)
-                try:
-                    nace_div = int(codigo_nace.split('.')[0])
-                except (ValueError, IndexError):
-                    nace_div = 0
-
-                # Lógica de Manufactura (Divisiones 10-33)
-                if intent_manufacturing:
-                    if 10 <= nace_div <= 33:
-                        pass  # No boost global para evitar ruido (confiamos en los pesos específicos)
-                    elif 45 <= nace_div <= 47:
-                        score -= 200.0  # Penalización fuerte a comercio
-                    elif nace_div < 10:
-                        score -= 50.0 # Penalización leve a agricultura/minería si se busca fabricación
-
-                # Lógica de Comercio (Divisiones 45-47)
-                elif intent_trade:
-                    if 45 <= nace_div <= 47:
-                        score += 50.0  # Boost comercio (aquí sí tiene sentido ayudar)
-                    elif 10 <= nace_div <= 33:
-                        score -= 200.0  # Penalización fuerte a manufactura
-
-                # PROTECCIÓN DE CONTEXTO DIGITAL (Global)
-                # Si la query tiene intención digital clara, penalizar sectores físicos que usan metáforas
-                # Palabras que cambian el contexto físico a digital
-                software_keywords = [
-                    'software', 'programacion', 'informatica', 'computadora', 'ordenador', 
-                    'app', 'web', 'digital', 'datos', 'sistema', 'red', 'servidor', 'cloud', 'nube',
-                    'virtual', 'internet', 'online', 'ciber', 'tecnologia'
-                ]
-                intent_software = any(w in query_norm_intent for w in software_keywords)
-                
-                if intent_software:
-                    # Si es software, penalizar sectores puramente FÍSICOS que usan terminología similar
-                    # 01-03: Agricultura/Pesca (ej: "granja" de servidores)
-                    # 05-09: Minería (ej: "minería" de datos)
-                    # 10-33: Manufactura (ej: "fábrica" de software, "alimentación" de datos) -> Excepto 26 (Hardware)
-                    # 41-43: Construcción (ej: "construcción" de sitios web, "arquitectura" de software)
-                    # 49-53: Transporte (ej: "navegación" web, "tráfico" de datos)
-                    # 56: Servicios de comidas (ej: "alimentación")
-                    
-                    is_physical_sector = (
-                        (1 <= nace_div <= 3) or
-                        (5 <= nace_div <= 9) or
-                        (10 <= nace_div <= 33 and nace_div != 26) or
-                        (41 <= nace_div <= 43) or
-                        (49 <= nace_div <= 53) or
-                        (nace_div == 56)
-                    )
-                    
-                if intent_software:
-                    # ... (existing software logic) ...
-                    is_physical_sector = (
-                        (1 <= nace_div <= 3) or
-                        (5 <= nace_div <= 9) or
-                        (10 <= nace_div <= 33 and nace_div != 26) or
-                        (41 <= nace_div <= 43) or
-                        (49 <= nace_div <= 53) or
-                        (nace_div == 56)
-                    )
-                    
-                    if is_physical_sector:
-                        score -= 200.0
-
-                # PROTECCIÓN DE SERVICIOS PERSONALES (Peluquería vs Corte de piedra/metal)
-                intent_personal = any(w in query_norm_intent for w in ['pelo', 'cabello', 'peluqueria', 'estetica', 'belleza', 'manicura'])
-                if intent_personal:
-                    # Penalizar manufactura y construcción (ej: "corte" de piedra)
-                    if (10 <= nace_div <= 33) or (41 <= nace_div <= 43):
-                        score -= 200.0
-
-                # PROTECCIÓN MÉDICA (Operación médica vs Operaciones financieras/negocios)
-                intent_medical = any(w in query_norm_intent for w in ['medico', 'medica', 'cirugia', 'operacion', 'paciente', 'hospital', 'clinica', 'salud', 'enfermeria'])
-                if intent_medical:
-                    # Si es contexto médico, penalizar financiero/inmobiliario/negocios (64-70)
-                    # "Operación" es muy común en negocios.
-                    if 64 <= nace_div <= 70:
-                        score -= 200.0
-                    # Penalizar también manufactura (salvo farmacéutica 21 y equipos médicos 26/32)
-                    if 10 <= nace_div <= 33 and nace_div not in [21, 26, 32]:
-                        score -= 50.0
-
-                # PROTECCIÓN DECORACIÓN / NAVIDAD (Esferas navideñas vs Esferas de reloj)
-                intent_decoration = any(w in query_norm_intent for w in ['navidad', 'navideñas', 'navidenas', 'adornos', 'decoracion', 'fiesta', 'regalo'])
-                if intent_decoration:
-                    # Penalizar relojes (26.52) porque "esferas" es un componente de reloj
-                    if codigo_nace == '26.52':
-                        score -= 200.0
-                    # Boost a Otras industrias manufactureras (32.99) que incluye artículos de fiesta/regalo
-                    if codigo_nace == '32.99':
-                        score += 50.0
-
-                if score > 0:
-                    resultados.append({
-                        'codigo_nace': codigo_nace,
-                        'descripcion_nace': descripcion[:300] + '...' if len(descripcion) > 300 else descripcion,
-                        'descripcion_completa': descripcion,
-                        'codigo_iaf': codigo_iaf,
-                        'nombre_iaf': nombre_iaf,
-                        'relevancia': score
-                    })
-                elif base_score > 100 and exclusion_hit:
-                    # Si tenía buena puntuación base pero fue excluido por una cláusula específica
-                    excluidos.append({
-                        'codigo_nace': codigo_nace,
-                        'descripcion_nace': descripcion[:300] + '...' if len(descripcion) > 300 else descripcion,
-                        'descripcion_completa': descripcion,
-                        'codigo_iaf': codigo_iaf,
-                        'nombre_iaf': nombre_iaf,
-                        'relevancia': base_score, # Guardamos el score base para mostrar qué tan relevante era
-                        'razon_exclusion': exclusion_hit
-                    })
 
-    # Ordenar por relevancia (mayor a menor)
-    resultados.sort(key=lambda x: x['relevancia'], reverse=True)
-    excluidos.sort(key=lambda x: x['relevancia'], reverse=True)
+def clave_cache(consulta: QueryPlan, index: SearchIndex, top_n: int) -> Hashable:
+    """Clave de caché de una consulta: su forma canónica más `top_n` y la versión del índice.
 
-    # Filtrado Dinámico (Dynamic Thresholding) y Mínimo Absoluto
-    # Filtrado Dinámico (Dynamic Thresholding) y Mínimo Absoluto
-    MIN_SCORE_THRESHOLD = 20.0  # Umbral mínimo para considerar un resultado válido
-    
-    if resultados:
-        max_score = resultados[0]['relevancia']
-        
-        # Si el mejor resultado es muy pobre, no devolver nada
-        if max_score < MIN_SCORE_THRESHOLD:
-            resultados = []
+    La forma canónica son las palabras clave tras normalizar, quitar stopwords
+    y expandir sinónimos. Se añaden las intenciones detectadas porque se
+    evalúan sobre el texto original y también afectan al resultado.
+    """
+    return (index.version, consulta.clave, top_n)
+
+
+def buscar_en_cache(
+    query: str,
+    mapping: Optional[List[Dict[str, Any]]] = None,
+    top_n: int = 10,
+    index: Optional[SearchIndex] = None,
+) -> Tuple[Optional[Hashable], Optional[Dict[str, List[Dict[str, Any]]]]]:
+    """Consulta la caché sin buscar: devuelve (clave, copia de la respuesta o None).
+
+    Para quien calcula la búsqueda en otro sitio (p. ej. un pool de procesos)
+    y quiere reutilizar la caché de este proceso: si la respuesta no está,
+    se calcula fuera y se guarda con `guardar_en_cache(clave, respuesta)`.
+    La clave es None si la query no tiene palabras y no se cachea.
+    """
+    index = _resolver_indice(mapping, None, index)
+    consulta = planificar_consulta(query)
+    if not consulta.palabras:
+        return None, None
+    key = clave_cache(consulta, index, top_n)
+    respuesta = _RESULT_CACHE.get(key)
+    return key, _copiar_respuesta(respuesta) if respuesta is not None else None
+
+
+def guardar_en_cache(key: Optional[Hashable], respuesta: Dict[str, List[Dict[str, Any]]]) -> None:
+    """Guarda una copia de `respuesta` con una clave de `buscar_en_cache` (None: no hace nada)."""
+    if key is not None:
+        _RESULT_CACHE.put(key, _copiar_respuesta(respuesta))
+
+
+def cache_info() -> Dict[str, Any]:
+    """Contadores de la caché de resultados (aciertos, fallos, expulsiones, tamaño)."""
+    return _RESULT_CACHE.info()
+
+
+def clear_cache(plans: bool = True) -> None:
+    """Vacía la caché de resultados y (si `plans`) la de planes de consulta."""
+    _RESULT_CACHE.clear()
+    if plans:
+        _PLAN_CACHE.clear()
+
+
+def configure_cache(maxsize: Optional[int] = None, ttl: Optional[float] = None) -> None:
+    """Cambia el tamaño máximo (0 desactiva la caché) y/o el TTL en segundos."""
+    _RESULT_CACHE.configure(maxsize=maxsize, ttl=ttl)
+
+
+def _buscar_preparadas(
+    consultas: Sequence[QueryPlan],
+    index: SearchIndex,
+    top_n: int,
+    full_scan: bool = False,
+    engine: str = "python",
+) -> List[Dict[str, List[Dict[str, Any]]]]:
+    """Puntúa consultas ya preparadas con el motor indicado."""
+    if engine == "numpy":
+        from .vectorized import get_vector_engine
+
+        reloj = metrics.reloj()
+        respuestas = get_vector_engine(index).buscar_preparadas(consultas, top_n=top_n)
+        if metrics.ENABLED:
+            # El motor vectorizado puntúa el lote entero de una vez: una sola observación
+            reloj.etapa("puntuacion_lote")
+            # Como en los otros motores, las consultas sin palabras no se puntúan ni se cuentan
+            metrics.QUERIES.inc(sum(1 for c in consultas if c.palabras), labels={"engine": "numpy"})
+        return respuestas
+    return [_buscar_consulta(c, index, top_n, full_scan, engine) for c in consultas]
+
+
+def _resolver_indice(
+    mapping: Optional[List[Dict[str, Any]]],
+    mapping_path: Optional[str | Path],
+    index: Optional[SearchIndex],
+) -> SearchIndex:
+    """Índice a usar según los argumentos de `buscar_actividad`."""
+    if index is not None:
+        return index
+    if mapping is None and mapping_path is not None:
+        # Cargar desde archivo JSON directamente
+        with open(mapping_path, encoding='utf-8') as f:
+            return SearchIndex(json.load(f))
+    # Sin mapeo se usa el índice del archivo por defecto del paquete
+    return get_search_index(mapping)
+
+
+def _buscar_consulta(
+    consulta: QueryPlan,
+    index: SearchIndex,
+    top_n: int,
+    full_scan: bool = False,
+    engine: str = "python",
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Puntúa una consulta ya preparada con el motor "python" o "reference"."""
+    if not consulta.palabras:
+        return {'results': [], 'excluded': []}
+
+    reloj = metrics.reloj()
+    if engine == "reference":
+        # Recorrido completo con el cálculo original, sin usar el índice
+        resultados: List[Candidato] = []
+        excluidos: List[Candidato] = []  # Candidatos relevantes pero excluidos
+        evaluados = penalizados = 0
+        for ordinal in ordinals(index.all_bits):
+            doc = index.documents[ordinal]
+            score, base_score, exclusion_hit = calcular_relevancia(consulta, doc.descripcion)
+            _clasificar_puntuacion(doc, consulta.ajustes, score, base_score, exclusion_hit, resultados, excluidos)
+            evaluados += 1
+            penalizados += exclusion_hit is not None
+        reloj.etapa("puntuacion")
+        respuesta = _seleccionar(resultados, excluidos, top_n)
+        reloj.etapa("seleccion")
+        if metrics.ENABLED:
+            metrics.QUERIES.inc(labels={"engine": "reference"})
+            metrics.DOCUMENTS_SCORED.inc(evaluados)
+            metrics.EXCLUSIONS.inc(penalizados)
+        return respuesta
+
+    # Buscar en las descripciones NACE que contienen alguna palabra de la query
+    candidatos, rasgos = _rasgos_consulta(consulta, index)
+    reloj.etapa("candidatos")
+    documentos = index.all_bits if full_scan else candidatos
+    grupos = _grupos_base(consulta, documentos, rasgos)
+    reloj.etapa("puntuacion")
+    # Penalización por exclusiones
+    exclusiones = index.exclusion_hits(consulta.palabras)
+    reloj.etapa("exclusiones")
+    resultados, excluidos, evaluados = _mejores_candidatos(consulta, index, grupos, exclusiones, top_n)
+    respuesta = _seleccionar(resultados, excluidos, top_n)
+    reloj.etapa("seleccion")
+    if metrics.ENABLED:
+        metrics.QUERIES.inc(labels={"engine": "python"})
+        metrics.DOCUMENTS_SCORED.inc(evaluados)
+        metrics.EXCLUSIONS.inc(sum(1 for ordinal in exclusiones if documentos >> ordinal & 1))
+    return respuesta
+
+
+def _copiar_respuesta(respuesta: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    return {k: [dict(r) for r in v] for k, v in respuesta.items()}
+
+
+def buscar_actividades(
+    queries: Sequence[str],
+    mapping: Optional[List[Dict[str, Any]]] = None,
+    mapping_path: Optional[str | Path] = None,
+    top_n: int = 10,
+    index: Optional[SearchIndex] = None,
+    engine: Optional[str] = None,
+    use_cache: bool = True,
+) -> List[Dict[str, List[Dict[str, Any]]]]:
+    """Busca varias actividades en una sola pasada.
+
+    Equivale a llamar a `buscar_actividad` para cada query, pero el índice se
+    resuelve una vez, cada query distinta se normaliza y expande una sola vez y
+    las queries equivalentes (mismas palabras clave e intención) se puntúan una
+    única vez para todo el lote.
+
+    Args:
+        queries: Descripciones de actividades a buscar
+        mapping, mapping_path, top_n, index, use_cache: Como en `buscar_actividad`
+        engine: "python" (por defecto), "numpy" o "reference". El motor
+            "numpy" da los mismos resultados pero, con el índice de bitsets y
+            la selección top-K, es más lento que "python" también en lotes
+            (ver `scripts/benchmark.py`, sección "batch")
+
+    Returns:
+        Una respuesta por query, en el mismo orden, con el formato de `buscar_actividad`.
+    """
+    if engine is None:
+        engine = "python"
+    if engine not in ENGINES:
+        raise ValueError(f"Motor desconocido: {engine!r}. Opciones: {', '.join(ENGINES)}")
+
+    index = _resolver_indice(mapping, mapping_path, index)
+
+    # Preparar cada query distinta una sola vez y agrupar las equivalentes
+    preparadas: Dict[str, QueryPlan] = {}
+    unicas: Dict[Hashable, QueryPlan] = {}
+    for query in queries:
+        if query not in preparadas:
+            consulta = planificar_consulta(query)
+            preparadas[query] = consulta
+            unicas.setdefault(consulta.clave, consulta)
+
+    # Consultar la caché y puntuar en bloque solo las que faltan
+    cacheable = use_cache and engine != "reference"
+    por_clave: Dict[Hashable, Dict[str, List[Dict[str, Any]]]] = {}
+    pendientes = []
+    for clave, consulta in unicas.items():
+        respuesta = _RESULT_CACHE.get(clave_cache(consulta, index, top_n)) if cacheable and consulta.palabras else None
+        if respuesta is None:
+            pendientes.append(clave)
         else:
-            threshold = max_score * 0.5
-            resultados = [r for r in resultados if r['relevancia'] >= threshold]
+            por_clave[clave] = respuesta
+    respuestas = _buscar_preparadas([unicas[k] for k in pendientes], index, top_n, engine=engine)
+    for clave, respuesta in zip(pendientes, respuestas, strict=True):
+        por_clave[clave] = respuesta
+        if cacheable and unicas[clave].palabras:
+            _RESULT_CACHE.put(clave_cache(unicas[clave], index, top_n), respuesta)
+
+    # Cada posición recibe su propia copia: la respuesta puede repetirse en el
+    # lote o estar guardada en la caché
+    salida = []
+    for query in queries:
+        salida.append(_copiar_respuesta(por_clave[preparadas[query].clave]))
+    return salida
+
+
+def iter_buscar_actividad(
+    queries: Iterable[str],
+    mapping: Optional[List[Dict[str, Any]]] = None,
+    mapping_path: Optional[str | Path] = None,
+    top_n: int = 10,
+    index: Optional[SearchIndex] = None,
+    engine: Optional[str] = None,
+    batch_size: int = 64,
+) -> Iterator[Dict[str, List[Dict[str, Any]]]]:
+    """Versión perezosa de `buscar_actividades`: produce las respuestas de una en una.
+
+    Consume `queries` a medida que se piden resultados (en bloques de
+    `batch_size`, que se puntúan juntos) y nunca construye la lista completa
+    de entradas ni de salidas, así que puede encadenarse de un lector de
+    archivos a un escritor con memoria constante:
+
+        >>> with open("actividades.txt") as fin, open("salida.jsonl", "w") as fout:
+        ...     for resp in iter_buscar_actividad(line.strip() for line in fin):
+        ...         fout.write(json.dumps(resp, ensure_ascii=False) + "\\n")
 
-    return {
-        'results': resultados[:top_n],
-        'excluded': excluidos[:3] # Solo mostrar los top 3 excluidos para no saturar
-    }
+    Args:
+        queries: Iterable (p. ej. un generador) de descripciones de actividad
+        mapping, mapping_path, top_n, index, engine: Como en `buscar_actividades`
+        batch_size: Número de queries que se puntúan juntas
+
+    Yields:
+        Una respuesta por query, en orden, con el formato de `buscar_actividad`.
+    """
+    index = _resolver_indice(mapping, mapping_path, index)
+    batch: List[str] = []
+    for query in queries:
+        batch.append(query)
+        if len(batch) >= batch_size:
+            yield from buscar_actividades(batch, index=index, top_n=top_n, engine=engine)
+            batch = []
+    if batch:
+        yield from buscar_actividades(batch, index=index, top_n=top_n, engine=engine)
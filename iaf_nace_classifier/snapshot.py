@@ -0,0 +1,246 @@
+"""
+On-disk compiled snapshots of a mapping and the structures built from it.
+
+`load_mapping` parses and cleans the mapping JSON, and the search index and
+NACE lookup table are then built from the result. None of that depends on
+anything but the JSON bytes and this package's code, so each piece is
+written to a snapshot file the first time it is built and later loads (in
+this or any other process) unpickle it instead:
+
+  <cache dir>/<key>.mapping.pickle   cleaned mapping (`load_mapping`)
+  <cache dir>/<key>.index.pickle     `SearchIndex` (`get_search_index`)
+  <cache dir>/<key>.lookup.pickle    `NaceLookup` (`classify_nace`)
+
+The key is a hash of the JSON, of the modules that build the structures and
+of SNAPSHOT_FORMAT, so a changed mapping or an upgraded package never reads
+a stale snapshot: it misses and a fresh one is written. Each section is only
+loaded when first needed. Unreadable snapshots are rebuilt, and an
+unwritable cache directory just means nothing is kept.
+
+The cache directory is $IAF_NACE_CACHE_DIR, or iaf_nace_classifier under
+$XDG_CACHE_HOME (default ~/.cache). Snapshots are pickles, so the directory
+must only be writable by trusted users.
+
+Prebuilt artifacts: `build_snapshot` writes all three sections for a JSON
+ahead of time, plus a `<key>.manifest.json` recording the format, the
+SHA-256 of the JSON and of each section file. The extractor runs it after
+regenerating the mapping and writes to `data/snapshots/` inside the
+package, which is searched before the cache directory; a section is only
+used if its checksum matches the manifest. This also works from the command
+line without the PDF toolchain:
+
+    python -m iaf_nace_classifier.snapshot [mapping.json] [--out DIR]
+"""
+
+import argparse
+import hashlib
+import importlib.resources
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .index import _INDEXES, SearchIndex
+from .mapping import _LOOKUPS, NaceLookup, clean_mapping, read_mapping_source
+
+# Bump when the layout of the pickled structures changes in a way the module
+# hash below would not catch (e.g. a change in a dependency's pickling).
+SNAPSHOT_FORMAT = 1
+
+# Modules whose code determines the content of a snapshot
+_SOURCE_MODULES = ("mapping.py", "text.py", "index.py", "snapshot.py")
+
+# Sections of a snapshot, in build order
+SECTIONS = ("mapping", "index", "lookup")
+
+T = TypeVar("T")
+
+_CODE_DIGEST: Optional[bytes] = None
+# Manifests of prebuilt artifacts already read: key -> section checksums (None if absent)
+_MANIFESTS: Dict[str, Optional[Dict[str, str]]] = {}
+
+
+def cache_dir() -> Path:
+    """Directory where snapshots are stored."""
+    explicit = os.environ.get("IAF_NACE_CACHE_DIR")
+    if explicit:
+        return Path(explicit)
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "iaf_nace_classifier"
+
+
+def prebuilt_dir() -> Path:
+    """Directory of the artifacts shipped with the package (see `build_snapshot`)."""
+    return Path(str(importlib.resources.files("iaf_nace_classifier") / "data" / "snapshots"))
+
+
+def _code_digest() -> bytes:
+    global _CODE_DIGEST
+    if _CODE_DIGEST is None:
+        h = hashlib.sha256(f"format={SNAPSHOT_FORMAT}".encode())
+        package = importlib.resources.files("iaf_nace_classifier")
+        for name in _SOURCE_MODULES:
+            try:
+                h.update((package / name).read_bytes())
+            except OSError:
+                h.update(name.encode())
+        _CODE_DIGEST = h.digest()
+    return _CODE_DIGEST
+
+
+def snapshot_key(raw: bytes) -> str:
+    """Snapshot key for the mapping JSON bytes `raw`."""
+    return hashlib.sha256(_code_digest() + raw).hexdigest()[:32]
+
+
+def _read(path: Path) -> Any:
+    try:
+        with path.open("rb") as f:
+            return pickle.load(f)
+    except Exception:
+        # Missing, corrupt, truncated or written by an incompatible version: rebuild it
+        return None
+
+
+def _write_bytes(path: Path, data: bytes, mode: Optional[int] = None) -> None:
+    # Write to a temporary file and rename it so readers never see a partial snapshot
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _write(path: Path, obj: Any) -> None:
+    try:
+        _write_bytes(path, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        pass
+
+
+def _manifest(key: str) -> Optional[Dict[str, str]]:
+    if key not in _MANIFESTS:
+        sections = None
+        try:
+            manifest = json.loads((prebuilt_dir() / f"{key}.manifest.json").read_bytes())
+            if manifest.get("format") == SNAPSHOT_FORMAT and manifest.get("key") == key:
+                sections = manifest["sections"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+        _MANIFESTS[key] = sections
+    return _MANIFESTS[key]
+
+
+def _read_prebuilt(key: str, name: str) -> Any:
+    """Section `name` of the prebuilt artifacts for `key`, if present and intact."""
+    sections = _manifest(key)
+    if not sections or name not in sections:
+        return None
+    try:
+        data = (prebuilt_dir() / f"{key}.{name}.pickle").read_bytes()
+        if hashlib.sha256(data).hexdigest() != sections[name]:
+            return None
+        return pickle.loads(data)
+    except Exception:
+        return None
+
+
+def load_section(key: str, name: str, build: Callable[[], T]) -> T:
+    """Load section `name` of snapshot `key`, or build it with `build()` and save it.
+
+    Prebuilt artifacts are tried first, then the cache directory.
+    """
+    value = _read_prebuilt(key, name)
+    if value is not None:
+        return value
+    path = cache_dir() / f"{key}.{name}.pickle"
+    value = _read(path)
+    if value is None:
+        value = build()
+        _write(path, value)
+    return value
+
+
+def load_snapshot_mapping(raw: bytes) -> List[Dict[str, Any]]:
+    """Cleaned mapping for the JSON bytes `raw`, from its snapshot when available.
+
+    The search index and lookup table of the returned mapping are attached
+    lazily: `get_search_index(mapping)` and `classify_nace(code, mapping)`
+    load them from the same snapshot instead of building them.
+    """
+    key = snapshot_key(raw)
+    mapping = load_section(key, "mapping", lambda: clean_mapping(json.loads(raw)))
+    _INDEXES.register(mapping, lambda: load_section(key, "index", lambda: SearchIndex(mapping)))
+    _LOOKUPS.register(mapping, lambda: load_section(key, "lookup", lambda: NaceLookup(mapping)))
+    return mapping
+
+
+def build_snapshot(raw: bytes, directory: Optional[Path] = None) -> Dict[str, Any]:
+    """Build every section for the JSON bytes `raw` and write them to `directory`.
+
+    `directory` defaults to `prebuilt_dir()`. Artifacts of any other key
+    there are removed, since they can no longer match. Returns the manifest,
+    which is written last so a partial build is never used. Raises OSError if
+    the directory is not writable.
+    """
+    directory = Path(directory) if directory is not None else prebuilt_dir()
+    key = snapshot_key(raw)
+    mapping = clean_mapping(json.loads(raw))
+    built: List[Tuple[str, Any]] = [
+        ("mapping", mapping),
+        ("index", SearchIndex(mapping)),
+        ("lookup", NaceLookup(mapping)),
+    ]
+    sections: Dict[str, str] = {}
+    for name, obj in built:
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        # Shipped with the package: readable by everyone (mkstemp creates 0600 files)
+        _write_bytes(directory / f"{key}.{name}.pickle", data, 0o644)
+        sections[name] = hashlib.sha256(data).hexdigest()
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "key": key,
+        "mapping_sha256": hashlib.sha256(raw).hexdigest(),
+        "sections": sections,
+    }
+    _write_bytes(directory / f"{key}.manifest.json", json.dumps(manifest, indent=2).encode() + b"\n", 0o644)
+    for path in directory.iterdir():
+        if path.name.endswith((".pickle", ".manifest.json")) and not path.name.startswith(key + "."):
+            path.unlink()
+    _MANIFESTS.pop(key, None)
+    return manifest
+
+
+def clear_snapshots() -> int:
+    """Delete every snapshot in the cache directory. Returns the number of files removed."""
+    removed = 0
+    for path in cache_dir().glob("*.pickle"):
+        try:
+            path.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build prebuilt snapshot artifacts for a mapping JSON")
+    parser.add_argument("mapping", nargs="?", default=None, help="Path to mapping JSON (defaults to packaged file)")
+    parser.add_argument("--out", default=None, help=f"Output directory (defaults to {prebuilt_dir()})")
+    args = parser.parse_args(argv)
+
+    manifest = build_snapshot(read_mapping_source(args.mapping), Path(args.out) if args.out else None)
+    print(json.dumps(manifest, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,182 @@
+"""
+Autocompletado para el buscador.
+
+Completar lo que el usuario está escribiendo no necesita puntuar nada: basta
+con buscar por prefijo en listas ordenadas con `bisect`. `Sugerencias` se
+construye una vez por índice de búsqueda y tabla de sinónimos y guarda:
+
+  - las palabras del vocabulario del índice (con la forma con tildes más
+    frecuente en las descripciones) y las claves de la tabla de sinónimos,
+    con el número de documentos en que aparecen como peso
+  - los títulos de las actividades NACE, por su código y por cada sufijo del
+    título que empieza en una palabra significativa ("prendas de vestir" y
+    "vestir" llevan a "Comercio al por menor de prendas de vestir...")
+
+`sugerir()` completa la última palabra de la query (o las últimas, para los
+sinónimos de varias palabras) y devuelve las actividades cuyo título o
+código empieza por la query. Cada consulta es una búsqueda binaria y un
+recorrido del rango de coincidencias, sin tocar los documentos.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .index import SearchIndex, get_search_index, ordinals
+from .synonyms import TablaSinonimos
+from .synonyms import tabla as tabla_sinonimos
+from .text import STOPWORDS, normalizar_texto, tokenizar
+
+_PALABRA_RE = re.compile(r'\w+')
+
+# Código NACE al principio de la primera línea de una descripción
+_CODIGO_RE = re.compile(r'^\s*\d{2}(?:\.\d+)*\s+')
+
+# Sugerencias construidas como máximo (una por índice y versión de sinónimos)
+_CACHE_SIZE = 4
+
+
+class Sugerencias:
+    """Vocabulario y títulos de un índice, ordenados para buscar por prefijo."""
+
+    def __init__(self, index: SearchIndex, sinonimos: Optional[TablaSinonimos] = None):
+        activos = index.all_bits
+
+        # Forma más frecuente de cada palabra normalizada ("fabricacion" → "fabricación")
+        formas: Dict[str, Tuple[str, int]] = {}
+        texto = "\n".join(index.documents[i].descripcion for i in ordinals(activos)).lower()
+        for forma, n in Counter(tokenizar(texto)).items():
+            clave = normalizar_texto(forma)
+            actual = formas.get(clave)
+            if actual is None or n > actual[1]:
+                formas[clave] = (forma, n)
+
+        # Palabras: (clave, texto mostrado, documentos, tipo)
+        palabras: Dict[str, Tuple[str, str, int, str]] = {}
+        documentos: Dict[str, int] = {}
+        for palabra, term_id in index.vocabulario.items():
+            if len(palabra) <= 2 or palabra in STOPWORDS or palabra.isdigit():
+                continue
+            n = (index.term_bits(term_id) & activos).bit_count()
+            if n:
+                documentos[palabra] = n
+                palabras[palabra] = (palabra, formas.get(palabra, (palabra,))[0], n, "palabra")
+        if sinonimos is not None:
+            for frase, sinonimo in sinonimos.frases.items():
+                clave = " ".join(frase)
+                n = documentos.get(sinonimo, 0)
+                if clave not in palabras and n:
+                    palabras[clave] = (clave, clave, n, "sinonimo")
+        self._palabras = sorted(palabras.values())
+        self._claves = [p[0] for p in self._palabras]
+        # Palabras de la frase más larga: cuántas palabras finales de la query se prueban
+        self._max_palabras = max((p[0].count(" ") + 1 for p in self._palabras), default=1)
+
+        # Actividades: (clave, posición del sufijo, longitud, ordinal). La clave es
+        # el código (posición -1: va antes que los títulos, de menor a mayor) o un sufijo del título
+        actividades: List[Tuple[str, int, int, int]] = []
+        self._titulos: Dict[int, str] = {}
+        for ordinal in ordinals(activos):
+            doc = index.documents[ordinal]
+            titulo = _CODIGO_RE.sub("", doc.descripcion.split("\n", 1)[0]).strip()
+            if not titulo:
+                continue
+            self._titulos[ordinal] = titulo
+            actividades.append((doc.codigo_nace, -1, len(doc.codigo_nace), ordinal))
+            norm = normalizar_texto(titulo)
+            for posicion, m in enumerate(_PALABRA_RE.finditer(norm)):
+                if posicion == 0 or (len(m.group()) > 2 and m.group() not in STOPWORDS):
+                    actividades.append((norm[m.start():], posicion, len(titulo), ordinal))
+        actividades.sort()
+        self._actividades = actividades
+        self._claves_actividades = [a[0] for a in actividades]
+        self._documentos = index.documents
+
+    def completar(self, query: str, limite: int = 8) -> List[Dict[str, Any]]:
+        """Queries completas que terminan con una palabra (o sinónimo) que empieza como la query."""
+        palabras = query.split()
+        if not palabras or query[-1:].isspace():
+            return []
+        normalizadas = normalizar_texto(query).split()
+        # texto → (palabras de la query completadas, palabra o frase, documentos, tipo)
+        encontradas: Dict[str, Tuple[int, str, int, str]] = {}
+        for n in range(1, min(self._max_palabras, len(palabras)) + 1):
+            prefijo = " ".join(normalizadas[-n:])
+            if len(prefijo) < 2:
+                continue
+            cabeza = " ".join(palabras[:-n])
+            i = bisect.bisect_left(self._claves, prefijo)
+            while i < len(self._claves) and self._claves[i].startswith(prefijo):
+                _, forma, docs, tipo = self._palabras[i]
+                # Con n mayor, la frase que completa varias palabras sustituye a la de una
+                encontradas[f"{cabeza} {forma}" if cabeza else forma] = (n, forma, docs, tipo)
+                i += 1
+        # Primero las frases que completan más palabras; después, las palabras más frecuentes
+        mejores = heapq.nsmallest(
+            limite, encontradas.items(), key=lambda e: (-e[1][0], -e[1][2], len(e[1][1]), e[0])
+        )
+        return [
+            {"texto": texto, "palabra": forma, "documentos": docs, "tipo": tipo}
+            for texto, (_, forma, docs, tipo) in mejores
+        ]
+
+    def actividades(self, query: str, limite: int = 8) -> List[Dict[str, Any]]:
+        """Actividades cuyo código o título (o un sufijo del título) empieza por la query."""
+        prefijo = " ".join(normalizar_texto(query).split())
+        if len(prefijo) < 2:
+            return []
+        claves = self._claves_actividades
+        mejores: Dict[int, Tuple[int, int, int]] = {}
+        i = bisect.bisect_left(claves, prefijo)
+        while i < len(claves) and claves[i].startswith(prefijo):
+            _, posicion, longitud, ordinal = self._actividades[i]
+            orden = (posicion, longitud, ordinal)
+            if ordinal not in mejores or orden < mejores[ordinal]:
+                mejores[ordinal] = orden
+            i += 1
+        resultado = []
+        for _, _, ordinal in heapq.nsmallest(limite, mejores.values()):
+            doc = self._documentos[ordinal]
+            resultado.append({
+                "codigo_nace": doc.codigo_nace,
+                "codigo_iaf": doc.codigo_iaf,
+                "titulo": self._titulos[ordinal],
+            })
+        return resultado
+
+    def sugerir(self, query: str, limite: int = 8) -> Dict[str, List[Dict[str, Any]]]:
+        return {"completions": self.completar(query, limite), "activities": self.actividades(query, limite)}
+
+
+_SUGERENCIAS: Dict[Tuple[int, int], Sugerencias] = {}
+_LOCK = threading.Lock()
+
+
+def get_sugerencias(mapping: Optional[List[Dict[str, Any]]] = None) -> Sugerencias:
+    """Sugerencias del índice de `mapping` (o del mapeo por defecto) con la tabla de sinónimos en uso.
+
+    Se construyen la primera vez y se reutilizan mientras no cambien el
+    índice ni los sinónimos.
+    """
+    index = get_search_index(mapping)
+    sinonimos = tabla_sinonimos()
+    clave = (index.version, sinonimos.version)
+    sugerencias = _SUGERENCIAS.get(clave)
+    if sugerencias is None:
+        sugerencias = Sugerencias(index, sinonimos)
+        with _LOCK:
+            if len(_SUGERENCIAS) >= _CACHE_SIZE:
+                _SUGERENCIAS.pop(next(iter(_SUGERENCIAS)))
+            _SUGERENCIAS[clave] = sugerencias
+    return sugerencias
+
+
+def sugerir(
+    query: str, mapping: Optional[List[Dict[str, Any]]] = None, limite: int = 8
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Completados de la query y actividades que empiezan por ella (ver el módulo)."""
+    return get_sugerencias(mapping).sugerir(query, limite)
+
@@ -0,0 +1,166 @@
+"""
+Tabla de sinónimos para la expansión de consultas.
+
+Los sinónimos están en `data/sinonimos.json` (o en el archivo que indique
+IAF_NACE_SYNONYMS) y no en el código: se cargan una vez por proceso y se
+compilan en una `TablaSinonimos`. Cada entrada puede ser una palabra
+("computadora" → "ordenador") o una frase de varias palabras
+("call center" → "llamadas"); las claves se normalizan al cargar.
+
+La expansión recorre las palabras de la query una sola vez: tras cada
+palabra se añaden los sinónimos de las entradas que terminan en ella,
+primero la de una palabra y después las frases, de la más corta a la más
+larga. Las palabras originales se conservan ("reparación de computadoras"
+→ "reparación de computadoras ordenadores").
+
+Recarga en caliente: `tabla()` comprueba, como mucho una vez cada
+IAF_NACE_SYNONYMS_CHECK segundos (2 por defecto; 0 lo desactiva), si el
+archivo ha cambiado y, en ese caso, lo vuelve a cargar. Así cada proceso
+(también los workers de un pool) toma la tabla nueva sin reiniciarse. Si el
+archivo nuevo no es válido se sigue usando la tabla anterior y el error
+queda en `info()`. `recargar()` fuerza la recarga y sí lanza el error.
+
+Cada tabla tiene un número de versión distinto: los planes de consulta
+guardados en caché (`search.planificar_consulta`) lo incluyen en su clave.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .text import normalizar_texto
+
+DEFAULT_PATH = Path(__file__).parent / "data" / "sinonimos.json"
+
+_VERSIONES = itertools.count(1)
+
+
+class TablaSinonimos:
+    """Sinónimos compilados: frase (tupla de palabras normalizadas) → palabra añadida."""
+
+    __slots__ = ("version", "fuente", "mtime", "frases", "_longitudes")
+
+    def __init__(self, sinonimos: Dict[str, str], fuente: Optional[Path] = None, mtime: Optional[float] = None):
+        self.version = next(_VERSIONES)
+        self.fuente = fuente
+        self.mtime = mtime
+        frases: Dict[Tuple[str, ...], str] = {}
+        for clave, valor in sinonimos.items():
+            palabras = tuple(normalizar_texto(clave).split())
+            if palabras:
+                frases[palabras] = valor
+        self.frases = frases
+        # Longitudes de frase distintas, de menor a mayor (la de una palabra primero)
+        self._longitudes = tuple(sorted({len(f) for f in frases}))
+
+    def expandir(self, palabras: Sequence[str]) -> List[str]:
+        """Palabras de la query con los sinónimos intercalados tras la entrada que los activa."""
+        frases = self.frases
+        expandidas: List[str] = []
+        if self._longitudes == (1,):
+            # Solo entradas de una palabra: una búsqueda por palabra
+            for palabra in palabras:
+                expandidas.append(palabra)
+                sinonimo = frases.get((palabra,))
+                if sinonimo is not None:
+                    expandidas.append(sinonimo)
+            return expandidas
+
+        for i, palabra in enumerate(palabras):
+            expandidas.append(palabra)
+            for n in self._longitudes:
+                if n > i + 1:
+                    break
+                sinonimo = frases.get(tuple(palabras[i + 1 - n:i + 1]))
+                if sinonimo is not None:
+                    expandidas.append(sinonimo)
+        return expandidas
+
+    def __len__(self) -> int:
+        return len(self.frases)
+
+    def __contains__(self, frase: str) -> bool:
+        return tuple(normalizar_texto(frase).split()) in self.frases
+
+    def get(self, frase: str, default: Optional[str] = None) -> Optional[str]:
+        return self.frases.get(tuple(normalizar_texto(frase).split()), default)
+
+
+def ruta() -> Path:
+    """Archivo de sinónimos en uso (IAF_NACE_SYNONYMS o el del paquete)."""
+    return Path(os.environ.get("IAF_NACE_SYNONYMS") or DEFAULT_PATH)
+
+
+def cargar(path: Optional[str | Path] = None) -> TablaSinonimos:
+    """Lee y compila un archivo de sinónimos (`{"sinonimos": {...}, "frases": {...}}`)."""
+    path = Path(path) if path is not None else ruta()
+    mtime = path.stat().st_mtime
+    data = json.loads(path.read_bytes())
+    sinonimos: Dict[str, str] = {}
+    for seccion in ("sinonimos", "frases"):
+        entradas = data.get(seccion, {})
+        if not isinstance(entradas, dict) or not all(
+            isinstance(k, str) and isinstance(v, str) for k, v in entradas.items()
+        ):
+            raise ValueError(f"{path}: la sección {seccion!r} debe ser un objeto de texto → texto")
+        sinonimos.update(entradas)
+    return TablaSinonimos(sinonimos, fuente=path, mtime=mtime)
+
+
+_TABLA: Optional[TablaSinonimos] = None
+_LOCK = threading.Lock()
+_INTERVALO = float(os.environ.get("IAF_NACE_SYNONYMS_CHECK", "2"))
+_proxima_comprobacion = 0.0
+_ultimo_error: Optional[str] = None
+
+
+def tabla() -> TablaSinonimos:
+    """Tabla de sinónimos en uso; la recarga si el archivo ha cambiado (ver el módulo)."""
+    global _proxima_comprobacion
+    actual = _TABLA
+    if actual is None:
+        return recargar()
+    if _INTERVALO > 0:
+        ahora = time.monotonic()
+        if ahora >= _proxima_comprobacion:
+            _proxima_comprobacion = ahora + _INTERVALO
+            return _recargar_si_cambio(actual)
+    return actual
+
+
+def _recargar_si_cambio(actual: TablaSinonimos) -> TablaSinonimos:
+    global _ultimo_error
+    path = ruta()
+    try:
+        if path == actual.fuente and path.stat().st_mtime == actual.mtime:
+            return actual
+        return recargar(path)
+    except (OSError, ValueError) as e:
+        _ultimo_error = f"{type(e).__name__}: {e}"
+        return actual
+
+
+def recargar(path: Optional[str | Path] = None) -> TablaSinonimos:
+    """Carga de nuevo el archivo de sinónimos y pasa a usar la tabla nueva."""
+    global _TABLA, _ultimo_error
+    nueva = cargar(path)
+    with _LOCK:
+        _TABLA = nueva
+        _ultimo_error = None
+    return nueva
+
+
+def info() -> Dict[str, Any]:
+    """Versión, origen y tamaño de la tabla en uso, y el último error de recarga."""
+    actual = tabla()
+    return {
+        "version": actual.version,
+        "source": str(actual.fuente) if actual.fuente is not None else None,
+        "entries": len(actual),
+        "phrases": sum(1 for f in actual.frases if len(f) > 1),
+        "last_error": _ultimo_error,
+    }
@@ -0,0 +1,86 @@
+"""
+Utilidades de texto compartidas por la búsqueda y el índice.
+
+Reúne la normalización y las listas de palabras que usa el cálculo de
+relevancia, para que el índice precompilado y el cálculo de referencia
+(`calcular_relevancia`) partan exactamente de las mismas reglas.
+"""
+
+import re
+from typing import FrozenSet, Iterable, List, Tuple
+
+_ACCENT_TABLE = str.maketrans({
+    'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
+    'à': 'a', 'è': 'e', 'ì': 'i', 'ò': 'o', 'ù': 'u',
+    'ä': 'a', 'ë': 'e', 'ï': 'i', 'ö': 'o', 'ü': 'u',
+    'ñ': 'n'
+})
+
+_WORD_RE = re.compile(r'\w+')
+
+# Frases que indican claramente el inicio de una sección de exclusión.
+# Evitamos "excepto" o "excluye" porque pueden aparecer en medio de frases descriptivas.
+# El orden importa: se usa la primera frase de la lista que aparezca en el texto.
+EXCLUSION_PHRASES = (
+    'esta clase no comprende',
+    'este grupo no comprende',
+    'esta división no comprende',
+    'esta division no comprende',
+    'no comprende'
+)
+
+STOPWORDS: FrozenSet[str] = frozenset({
+    'el', 'la', 'los', 'las', 'de', 'del', 'y', 'o', 'a', 'en', 'con', 'por', 'para',
+    'que', 'esta', 'este', 'un', 'una', 'unos', 'unas', 'se', 'su', 'sus',
+    'excepto', 'no', 'comprende', 'clase', 'vease', 'incluye', 'excluye'
+})
+
+# Palabras genéricas que aportan poca información específica
+GENERIC_TERMS: FrozenSet[str] = frozenset({
+    'fabricacion', 'produccion', 'manufactura', 'elaboracion', 'confeccion',
+    'comercio', 'venta', 'distribucion', 'tienda', 'almacen', 'mayor', 'menor',
+    'reparacion', 'mantenimiento', 'instalacion',
+    'servicios', 'actividades', 'construccion', 'trabajos',
+    'productos', 'articulos', 'bienes', 'materiales', 'equipos', 'maquinas', 'sistemas'
+})
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza texto para búsqueda: minúsculas, sin acentos.
+
+    Args:
+        texto: Texto a normalizar
+
+    Returns:
+        Texto normalizado en minúsculas y sin acentos
+    """
+    return texto.lower().translate(_ACCENT_TABLE)
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Devuelve todas las palabras (`\\w+`) del texto, en orden."""
+    return _WORD_RE.findall(texto)
+
+
+def palabras_significativas(texto: str) -> List[str]:
+    """Palabras de más de 2 letras que no son stopwords, en orden de aparición."""
+    return [p for p in _WORD_RE.findall(texto) if len(p) > 2 and p not in STOPWORDS]
+
+
+def bigramas(palabras: Iterable[str]) -> FrozenSet[str]:
+    """Conjunto de bigramas "w1 w2" formados por palabras consecutivas."""
+    palabras = list(palabras)
+    return frozenset(f"{palabras[i]} {palabras[i + 1]}" for i in range(len(palabras) - 1))
+
+
+def separar_exclusion(texto_norm: str) -> Tuple[str, str]:
+    """Separa un texto normalizado en (parte principal, texto de exclusión).
+
+    El texto principal es lo que hay ANTES de la primera frase de exclusión
+    encontrada y el texto de exclusión lo que hay DESPUÉS.
+    """
+    for phrase in EXCLUSION_PHRASES:
+        if phrase in texto_norm:
+            principal, exclusion = texto_norm.split(phrase, 1)
+            return principal, exclusion
+    return texto_norm, ""
@@ -0,0 +1,292 @@
+"""
+Motor de puntuación vectorizado (NumPy) para la búsqueda de actividades.
+
+Representa las descripciones de un `SearchIndex` como matrices de incidencia
+palabra × documento y bigrama × documento (título y cuerpo por separado) y
+calcula los puntos por palabra clave, la densidad y los bonus por bigrama de
+todos los documentos, y de muchas queries a la vez, con productos de matrices.
+
+No es el motor por defecto: puntúa todos los documentos, mientras que el
+motor en Python puro solo puntúa los candidatos de los bitsets del índice y
+poda con la selección top-K, y resulta más rápido también en lotes grandes
+(ver la sección "batch" de `scripts/benchmark.py`).
+
+Produce los mismos resultados que el motor en Python puro, aunque los
+productos de matrices suman los puntos por palabra clave en otro orden: esos
+puntos son enteros pequeños o mitades, que en coma flotante se suman sin
+redondeo en cualquier orden, y la densidad (el único término inexacto) se
+calcula con las mismas operaciones y se añade en el mismo punto. Con pesos
+que no sean fracciones binarias exactas los scores podrían diferir en los
+últimos bits; `check_parity` compara ambos motores sobre una lista de
+queries con una tolerancia de 1e-9 en los scores.
+
+Requiere numpy:
+  pip install "iaf-nace-classifier[numpy]"
+
+Uso:
+  >>> from iaf_nace_classifier.vectorized import get_vector_engine
+  >>> engine = get_vector_engine()
+  >>> engine.buscar_actividades(["fabricación de muebles", "venta de ropa"], top_n=3)
+"""
+
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import metrics
+from .index import SearchIndex, get_search_index
+from .intents import AjustesIntencion, Intenciones
+from .search import (
+    Candidato,
+    QueryPlan,
+    _seleccionar,
+    buscar_actividad,
+    planificar_consulta,
+)
+
+DEFAULT_CHUNK_SIZE = 256
+_WORD_CACHE_SIZE = 16384
+
+
+def _bits_to_vector(bits: int, size: int) -> np.ndarray:
+    """Bitset de documentos del índice (bit i = ordinal i) → vector 0/1."""
+    raw = np.frombuffer(bits.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(raw, count=size, bitorder='little').astype(np.float64)
+
+
+class VectorEngine:
+    """Matrices de incidencia de un `SearchIndex` y puntuación por lotes."""
+
+    def __init__(self, index: SearchIndex):
+        self.index = index
+        docs = index.documents
+        n_docs = len(docs)
+        self._n_docs = n_docs
+        self._title_empty = np.array([not d.title for d in docs], dtype=bool)
+        self._body_empty = np.array([not d.body for d in docs], dtype=bool)
+
+        # Palabras, bigramas y segmentos de exclusión salen de los bitsets y
+        # listas invertidas del índice
+        self._word_cache: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._intent_cache: Dict[Intenciones, np.ndarray] = {}
+
+    def _word_vectors(self, palabra: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(subcadena en título, palabra del título, subcadena en cuerpo, palabra del cuerpo)."""
+        cached = self._word_cache.get(palabra)
+        if cached is not None:
+            return cached
+        n = self._n_docs
+        vectors = tuple(_bits_to_vector(bits, n) for bits in self.index.word_bits(palabra))
+        if len(self._word_cache) >= _WORD_CACHE_SIZE:
+            self._word_cache.clear()
+        self._word_cache[palabra] = vectors
+        return vectors
+
+    def _intent_deltas(self, ajustes: AjustesIntencion) -> np.ndarray:
+        """Matriz documentos × pasos con los ajustes por intención, en orden de aplicación."""
+        cached = self._intent_cache.get(ajustes.intenciones)
+        if cached is not None:
+            return cached
+        per_doc = [ajustes.para(d.nace_div, d.codigo_nace) for d in self.index.documents]
+        steps = max((len(a) for a in per_doc), default=0)
+        deltas = np.zeros((self._n_docs, steps), dtype=np.float64)
+        for i, pasos in enumerate(per_doc):
+            deltas[i, :len(pasos)] = pasos
+        self._intent_cache[ajustes.intenciones] = deltas
+        return deltas
+
+    def _score_text(
+        self,
+        consultas: Sequence[QueryPlan],
+        q_half: np.ndarray,
+        q_count: np.ndarray,
+        n_words: np.ndarray,
+        sub: np.ndarray,
+        tok: np.ndarray,
+        campo: int,
+        empty: np.ndarray,
+        weight: float,
+    ) -> np.ndarray:
+        """Equivalente matricial de `_calc_score` para un campo (título o cuerpo)."""
+        # Palabras clave: base si es palabra completa, base * 0.5 si solo es subcadena
+        local = q_half @ sub + q_half @ tok
+
+        # Densidad
+        found = q_count @ sub
+        local = local + found / n_words[:, None] * 20.0
+
+        # Frases (bigramas), sumadas posición a posición como en el cálculo original
+        max_bigrams = max(len(c.bigramas) for c in consultas)
+        for j in range(max_bigrams):
+            bonus = np.zeros_like(local)
+            for qi, c in enumerate(consultas):
+                if j >= len(c.bigramas):
+                    continue
+                bigram, points = c.bigramas[j]
+                docs = self.index.bigram_bits(bigram)[campo]
+                if docs:
+                    bonus[qi, _bits_to_vector(docs, self._n_docs) > 0] = points
+            local = local + bonus
+
+        local[:, empty] = 0.0
+        return local * weight
+
+    def _score_chunk(
+        self, consultas: Sequence[QueryPlan], top_n: int
+    ) -> List[Dict[str, List[Dict[str, Any]]]]:
+        words = sorted({p for c in consultas for p in c.palabras})
+        col = {w: i for i, w in enumerate(words)}
+        n_q, n_w = len(consultas), len(words)
+
+        # Pesos de la query por palabra (con repeticiones, como en el cálculo original)
+        q_half = np.zeros((n_q, n_w), dtype=np.float64)
+        q_count = np.zeros((n_q, n_w), dtype=np.float64)
+        for qi, c in enumerate(consultas):
+            for p, _, half_points in c.terminos:
+                q_half[qi, col[p]] += half_points
+                q_count[qi, col[p]] += 1.0
+        n_words = np.array([len(c.palabras) for c in consultas], dtype=np.float64)
+
+        vectors = [self._word_vectors(w) for w in words]
+        title_sub = np.array([v[0] for v in vectors])
+        title_tok = np.array([v[1] for v in vectors])
+        body_sub = np.array([v[2] for v in vectors])
+        body_tok = np.array([v[3] for v in vectors])
+
+        # Calcular score total: Título (x2) + Cuerpo (x1)
+        score = self._score_text(
+            consultas, q_half, q_count, n_words, title_sub, title_tok,
+            0, self._title_empty, 2.0,
+        ) + self._score_text(
+            consultas, q_half, q_count, n_words, body_sub, body_tok,
+            1, self._body_empty, 1.0,
+        )
+        base = score.copy()
+
+        # Penalización por exclusiones: un segmento penaliza si todas sus palabras
+        # están en la query. Cada documento usa el primero de sus segmentos que lo haga.
+        hits: List[Dict[int, str]] = []
+        has_hit = np.zeros_like(score, dtype=bool)
+        for qi, c in enumerate(consultas):
+            doc_hits = self.index.exclusion_hits(c.palabras_set)
+            if doc_hits:
+                hit_docs = np.fromiter(doc_hits, dtype=np.int64, count=len(doc_hits))
+                score[qi, hit_docs] -= 200.0
+                has_hit[qi, hit_docs] = True
+            hits.append(doc_hits)
+
+        eligible = (score > 0) | ((base > 50) & has_hit)
+
+        # Ajuste por intención, agrupando las queries con la misma intención
+        groups: Dict[Intenciones, List[int]] = {}
+        for qi, c in enumerate(consultas):
+            groups.setdefault(c.intenciones, []).append(qi)
+        for rows in groups.values():
+            deltas = self._intent_deltas(consultas[rows[0]].ajustes)
+            for k in range(deltas.shape[1]):
+                score[rows] += deltas[:, k]
+
+        positive = score > 0
+        is_result = eligible & positive
+        is_excluded = eligible & ~positive & (base > 100) & has_hit
+
+        documents = self.index.documents
+        responses = []
+        for qi in range(n_q):
+            res_ids = np.nonzero(is_result[qi])[0]
+            res_ids = res_ids[np.argsort(-score[qi, res_ids], kind='stable')][:top_n]
+            exc_ids = np.nonzero(is_excluded[qi])[0]
+            exc_ids = exc_ids[np.argsort(-base[qi, exc_ids], kind='stable')][:3]
+
+            resultados: List[Candidato] = [
+                (float(score[qi, d]), documents[d], None) for d in res_ids
+            ]
+            excluidos: List[Candidato] = [
+                (float(base[qi, d]), documents[d], hits[qi][int(d)]) for d in exc_ids
+            ]
+            responses.append(_seleccionar(resultados, excluidos, top_n))
+        return responses
+
+    def buscar_actividades(
+        self,
+        queries: Sequence[str],
+        top_n: int = 10,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> List[Dict[str, List[Dict[str, Any]]]]:
+        """Busca varias actividades a la vez. Devuelve una respuesta por query, en orden.
+
+        Cada respuesta tiene el mismo formato que `buscar_actividad`.
+        """
+        return self.buscar_preparadas([planificar_consulta(q) for q in queries], top_n, chunk_size)
+
+    def buscar_preparadas(
+        self,
+        consultas: Sequence[QueryPlan],
+        top_n: int = 10,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> List[Dict[str, List[Dict[str, Any]]]]:
+        """Como `buscar_actividades`, para queries ya preparadas con `planificar_consulta`."""
+        # Las queries sin palabras significativas no tienen resultados
+        responses = [{'results': [], 'excluded': []} for _ in consultas]
+        pending = [i for i, c in enumerate(consultas) if c.palabras]
+
+        for start in range(0, len(pending), chunk_size):
+            rows = pending[start:start + chunk_size]
+            chunk = self._score_chunk([consultas[i] for i in rows], top_n)
+            for i, response in zip(rows, chunk, strict=True):
+                responses[i] = response
+        return responses
+
+
+_ENGINES: "weakref.WeakKeyDictionary[SearchIndex, VectorEngine]" = weakref.WeakKeyDictionary()
+
+
+def get_vector_engine(index: Optional[SearchIndex] = None) -> VectorEngine:
+    """Devuelve el motor vectorizado de `index` (por defecto, el del mapeo del paquete)."""
+    if index is None:
+        index = get_search_index()
+    engine = _ENGINES.get(index)
+    if engine is None:
+        start = time.perf_counter()
+        engine = VectorEngine(index)
+        metrics.observe_build("numpy_engine", time.perf_counter() - start)
+        _ENGINES[index] = engine
+    return engine
+
+
+def _same_ranking(a: List[Dict[str, Any]], b: List[Dict[str, Any]], tolerance: float) -> bool:
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b, strict=True):
+        if x['codigo_nace'] != y['codigo_nace'] or x.get('razon_exclusion') != y.get('razon_exclusion'):
+            return False
+        if abs(x['relevancia'] - y['relevancia']) > tolerance:
+            return False
+    return True
+
+
+def check_parity(
+    queries: Sequence[str],
+    index: Optional[SearchIndex] = None,
+    top_n: int = 10,
+    tolerance: float = 1e-9,
+) -> List[Dict[str, Any]]:
+    """Compara el motor NumPy con el motor en Python puro.
+
+    Devuelve la lista de discrepancias (vacía si ambos coinciden), cada una con
+    la query y las respuestas de los dos motores.
+    """
+    if index is None:
+        index = get_search_index()
+    vectorized = get_vector_engine(index).buscar_actividades(queries, top_n=top_n)
+    mismatches = []
+    for query, got in zip(queries, vectorized, strict=True):
+        expected = buscar_actividad(query, index=index, top_n=top_n)
+        if not (
+            _same_ranking(expected['results'], got['results'], tolerance)
+            and _same_ranking(expected['excluded'], got['excluded'], tolerance)
+        ):
+            mismatches.append({'query': query, 'python': expected, 'numpy': got})
+    return mismatches
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Benchmark and differential-parity suite over the bundled query sets.
+
+Runs the queries of data/benchmark_queries.json, data/full_benchmark.json and
+data/stress_test.json (each with an `expected_iaf`) through `buscar_actividad`
+and reports, per engine and dataset:
+
+  - latency percentiles (p50/p90/p95/p99/max) and throughput
+  - peak traced memory (tracemalloc, measured in a separate pass)
+  - top-1 / top-k IAF accuracy of the search results
+  - top-1 accuracy of the search -> `classify_nace` pipeline
+
+plus mapping load / index build / lookup build times, `classify_nace`
+latency over every NACE code and its agreement with the mapping's own
+descriptions. The "batch" section times `buscar_actividades` over all unique
+queries at once, per engine, which is what bulk reclassification and
+POST /search/batch do (and what backs "python" as its default engine).
+
+With --parity, each engine's full rankings (codes, order, scores and
+exclusions) are diffed against the reference implementation
+(`calcular_relevancia` over every description), so a speedup that changes a
+classification shows up here. With --baseline, accuracy drops, latency
+regressions beyond --tolerance and changed top-k rankings against a previous
+--output file make the command exit with status 1.
+
+Usage:
+  python scripts/benchmark.py --output bench.json
+  python scripts/benchmark.py --engine python --engine numpy --parity
+  python scripts/benchmark.py --baseline bench.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from iaf_nace_classifier.index import SearchIndex, get_search_index  # noqa: E402
+from iaf_nace_classifier.mapping import (  # noqa: E402
+    NaceLookup,
+    classify_nace,
+    clean_mapping,
+    load_mapping,
+    read_mapping_source,
+)
+from iaf_nace_classifier.search import buscar_actividad, buscar_actividades  # noqa: E402
+
+DATASETS = ["benchmark_queries.json", "full_benchmark.json", "stress_test.json"]
+PERCENTILES = (50, 90, 95, 99)
+
+
+def load_dataset(path: Path) -> List[Dict[str, Any]]:
+    with path.open("r", encoding="utf-8") as f:
+        return [q for q in json.load(f) if q.get("query")]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _timed(fn, *args, **kwargs) -> Tuple[float, Any]:
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    return time.perf_counter() - start, value
+
+
+def bench_load(repeat: int) -> Dict[str, float]:
+    """Load and build times (best of `repeat`), in milliseconds."""
+    def best(fn) -> float:
+        return min(_timed(fn)[0] for _ in range(repeat)) * 1000
+
+    raw = read_mapping_source()
+    mapping = clean_mapping(json.loads(raw))
+    return {
+        "parse_and_clean_ms": best(lambda: clean_mapping(json.loads(raw))),
+        "load_mapping_ms": best(load_mapping),
+        "index_build_ms": best(lambda: SearchIndex(mapping)),
+        "lookup_build_ms": best(lambda: NaceLookup(mapping)),
+    }
+
+
+def bench_classify(mapping: List[Dict[str, Any]], index: SearchIndex, repeat: int) -> Dict[str, Any]:
+    """classify_nace latency over every dd / dd.d / dd.dd code, and agreement with the mapping."""
+    codes = [f"{a:02d}" for a in range(100)]
+    codes += [f"{a:02d}.{b}" for a in range(100) for b in range(10)]
+    codes += [f"{a:02d}.{b:02d}" for a in range(100) for b in range(100)]
+    classify_nace(codes[0], mapping)  # build the lookup table outside the timing
+
+    elapsed = min(_timed(lambda: [classify_nace(c, mapping) for c in codes])[0] for _ in range(repeat))
+
+    # Every description's own code should classify into the sector that lists it
+    # (codes shared by several sectors count as agreeing with any of them)
+    sectors: Dict[str, set] = {}
+    for doc in index.documents:
+        sectors.setdefault(doc.codigo_nace, set()).add(doc.codigo_iaf)
+    agree = 0
+    for code, iafs in sectors.items():
+        res = classify_nace(code, mapping)
+        agree += bool(res and res["codigo_iaf"] in iafs)
+
+    return {
+        "codes": len(codes),
+        "mean_us": elapsed / len(codes) * 1e6,
+        "codes_per_s": len(codes) / elapsed if elapsed else 0.0,
+        "agreement": agree / len(sectors) if sectors else 0.0,
+        "agreement_codes": len(sectors),
+    }
+
+
+def run_queries(
+    queries: List[Dict[str, Any]], mapping: List[Dict[str, Any]], engine: str, top_k: int, use_cache: bool
+) -> Tuple[List[float], List[Dict[str, Any]]]:
+    latencies: List[float] = []
+    responses: List[Dict[str, Any]] = []
+    for q in queries:
+        elapsed, response = _timed(
+            buscar_actividad, q["query"], mapping=mapping, top_n=top_k, engine=engine, use_cache=use_cache
+        )
+        latencies.append(elapsed)
+        responses.append(response)
+    return latencies, responses
+
+
+def bench_search(
+    queries: List[Dict[str, Any]],
+    mapping: List[Dict[str, Any]],
+    engine: str,
+    top_k: int,
+    use_cache: bool,
+    memory: bool,
+) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+    # Warm-up pass (index / NumPy engine construction is measured separately)
+    run_queries(queries[:5], mapping, engine, top_k, use_cache)
+    wall, (latencies, responses) = _timed(run_queries, queries, mapping, engine, top_k, use_cache)
+
+    top1 = topk = pipeline = 0
+    rankings: Dict[str, List[str]] = {}
+    for q, response in zip(queries, responses, strict=True):
+        results = response["results"]
+        iafs = [r["codigo_iaf"] for r in results]
+        expected = q.get("expected_iaf")
+        top1 += bool(iafs) and iafs[0] == expected
+        topk += expected in iafs[:top_k]
+        if results:
+            cls = classify_nace(results[0]["codigo_nace"], mapping)
+            pipeline += bool(cls) and cls["codigo_iaf"] == expected
+        rankings[q["query"]] = [r["codigo_nace"] for r in results[:top_k]]
+
+    ms = sorted(t * 1000 for t in latencies)
+    n = len(queries)
+    stats: Dict[str, Any] = {
+        "queries": n,
+        "mean_ms": statistics.fmean(ms) if ms else 0.0,
+        **{f"p{p}_ms": percentile(ms, p) for p in PERCENTILES},
+        "max_ms": ms[-1] if ms else 0.0,
+        "qps": n / wall if wall else 0.0,
+        "top1_accuracy": top1 / n if n else 0.0,
+        f"top{top_k}_accuracy": topk / n if n else 0.0,
+        "classify_top1_accuracy": pipeline / n if n else 0.0,
+    }
+
+    if memory:
+        tracemalloc.start()
+        run_queries(queries, mapping, engine, top_k, use_cache)
+        stats["peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return stats, rankings
+
+
+def bench_batch(
+    queries: List[str], mapping: List[Dict[str, Any]], engine: str, top_k: int, repeat: int
+) -> Dict[str, float]:
+    """Throughput of `buscar_actividades` over the whole query list in one call (no result cache)."""
+    buscar_actividades(queries[:5], mapping=mapping, top_n=top_k, engine=engine, use_cache=False)
+    wall = min(
+        _timed(buscar_actividades, queries, mapping=mapping, top_n=top_k, engine=engine, use_cache=False)[0]
+        for _ in range(max(1, repeat))
+    )
+    return {"queries": len(queries), "seconds": wall, "qps": len(queries) / wall if wall else 0.0}
+
+
+def _comparable(response: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Tuple[Any, ...]]]:
+    return {
+        key: [(r["codigo_nace"], r["codigo_iaf"], r["relevancia"], r.get("razon_exclusion")) for r in response[key]]
+        for key in ("results", "excluded")
+    }
+
+
+def parity(
+    queries: List[str], mapping: List[Dict[str, Any]], engines: List[str], top_n: int, limit: int
+) -> Dict[str, Dict[str, Any]]:
+    """Diff each engine's full responses against the reference implementation."""
+    sample = queries[:limit] if limit else queries
+    reference = [
+        _comparable(buscar_actividad(q, mapping=mapping, top_n=top_n, engine="reference")) for q in sample
+    ]
+    report: Dict[str, Dict[str, Any]] = {}
+    for engine in engines:
+        if engine == "reference":
+            continue
+        mismatches = []
+        for q, expected in zip(sample, reference, strict=True):
+            got = _comparable(buscar_actividad(q, mapping=mapping, top_n=top_n, engine=engine, use_cache=False))
+            if got != expected:
+                mismatches.append({"query": q, "reference": expected, engine: got})
+        report[engine] = {"compared": len(sample), "mismatches": len(mismatches), "examples": mismatches[:10]}
+    return report
+
+
+def compare_baseline(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human-readable regressions of `current` against `baseline`."""
+    problems: List[str] = []
+    for engine, datasets in current.get("search", {}).items():
+        for name, stats in datasets.items():
+            base = baseline.get("search", {}).get(engine, {}).get(name)
+            if not base:
+                continue
+            for key, value in stats.items():
+                if key.endswith("_accuracy") and key in base and value < base[key]:
+                    problems.append(f"{engine}/{name}: {key} {base[key]:.3f} -> {value:.3f}")
+            for key in ("p50_ms", "p95_ms"):
+                if base.get(key) and stats[key] > base[key] * (1 + tolerance):
+                    problems.append(f"{engine}/{name}: {key} {base[key]:.3f} -> {stats[key]:.3f} ms")
+
+    for engine, rankings in current.get("rankings", {}).items():
+        base_rankings = baseline.get("rankings", {}).get(engine, {})
+        changed = [q for q, codes in rankings.items() if q in base_rankings and base_rankings[q] != codes]
+        if changed:
+            examples = "; ".join(f"{q!r}: {base_rankings[q]} -> {rankings[q]}" for q in changed[:5])
+            problems.append(f"{engine}: {len(changed)} rankings changed ({examples})")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark buscar_actividad / classify_nace on the bundled query sets")
+    parser.add_argument("--data-dir", default=str(REPO_ROOT / "data"), help="Directory with the query sets")
+    parser.add_argument("--dataset", action="append", help=f"Query set file name (default: {', '.join(DATASETS)})")
+    parser.add_argument(
+        "--engine", action="append", choices=["python", "numpy", "reference"],
+        help="Engine to benchmark (repeatable; default: python, plus numpy if installed)",
+    )
+    parser.add_argument("--top-k", type=int, default=5, help="k for top-k accuracy and stored rankings")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions for load/classify timings (best counts)")
+    parser.add_argument("--cache", action="store_true", help="Let buscar_actividad use its result cache")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--parity", action="store_true", help="Diff every engine's rankings against the reference")
+    parser.add_argument("--parity-limit", type=int, default=0, help="Only diff the first N queries (0 = all)")
+    parser.add_argument("--output", "-o", help="Write the results as JSON")
+    parser.add_argument("--baseline", "-b", help="Compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative latency regression")
+    args = parser.parse_args(argv)
+
+    engines = args.engine
+    if not engines:
+        engines = ["python"]
+        try:
+            import numpy  # noqa: F401
+            engines.append("numpy")
+        except ImportError:
+            pass
+
+    data_dir = Path(args.data_dir)
+    datasets = {name: load_dataset(data_dir / name) for name in (args.dataset or DATASETS)}
+
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "engines": engines,
+            "top_k": args.top_k,
+            "cache": args.cache,
+        },
+        "load": bench_load(args.repeat),
+    }
+    print("load: " + ", ".join(f"{k} {v:.1f}" for k, v in results["load"].items()))
+
+    mapping = load_mapping()
+    index = get_search_index(mapping)
+    results["classify_nace"] = bench_classify(mapping, index, args.repeat)
+    c = results["classify_nace"]
+    print(f"classify_nace: {c['mean_us']:.2f} us/code, agreement {c['agreement']:.3f} over {c['agreement_codes']} codes")
+
+    results["search"] = {}
+    results["rankings"] = {}
+    for engine in engines:
+        results["search"][engine] = {}
+        results["rankings"][engine] = {}
+        for name, queries in datasets.items():
+            stats, rankings = bench_search(queries, mapping, engine, args.top_k, args.cache, not args.no_memory)
+            results["search"][engine][name] = stats
+            results["rankings"][engine].update(rankings)
+            print(
+                f"{engine:9s} {name:24s} n={stats['queries']:4d} "
+                f"p50 {stats['p50_ms']:.2f} p95 {stats['p95_ms']:.2f} p99 {stats['p99_ms']:.2f} ms "
+                f"{stats['qps']:.0f} q/s  top1 {stats['top1_accuracy']:.3f} "
+                f"top{args.top_k} {stats[f'top{args.top_k}_accuracy']:.3f} "
+                f"cls {stats['classify_top1_accuracy']:.3f}"
+                + (f"  peak {stats['peak_kb']:.0f} KB" if "peak_kb" in stats else "")
+            )
+
+    all_queries = list(dict.fromkeys(q["query"] for qs in datasets.values() for q in qs))
+    results["batch"] = {}
+    for engine in engines:
+        if engine == "reference":
+            continue
+        batch = bench_batch(all_queries, mapping, engine, args.top_k, args.repeat)
+        results["batch"][engine] = batch
+        print(f"batch {engine:9s} n={batch['queries']:4d} {batch['seconds'] * 1000:.1f} ms {batch['qps']:.0f} q/s")
+
+    if args.parity:
+        results["parity"] = parity(all_queries, mapping, engines, 20, args.parity_limit)
+        for engine, report in results["parity"].items():
+            print(f"parity {engine}: {report['mismatches']} mismatches in {report['compared']} queries")
+
+    status = 0
+    if args.parity and any(r["mismatches"] for r in results["parity"].values()):
+        status = 1
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare_baseline(results, json.load(f), args.tolerance)
+        results["regressions"] = problems
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            status = 1
+        else:
+            print("no regressions against baseline")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
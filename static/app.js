@@ -1,15 +1,28 @@
 const searchInput = document.getElementById('searchInput');
 const resultsContainer = document.getElementById('resultsContainer');
 const loadingSpinner = document.getElementById('loadingSpinner');
+const suggestionsList = document.getElementById('suggestions');
 
 let debounceTimer;
+let suggestTimer;
+let suggestController;
+let suggestions = [];
+let activeSuggestion = -1;
+let lastSearched = '';
+
+// Mientras se escribe solo se piden sugerencias (/suggest, sin puntuar);
+// /search se lanza al confirmar (Enter o elegir una sugerencia) o tras una pausa larga
+const SUGGEST_DELAY = 80;
+const SEARCH_IDLE_DELAY = 1200;
 
 searchInput.addEventListener('input', (e) => {
     const query = e.target.value.trim();
 
     clearTimeout(debounceTimer);
+    clearTimeout(suggestTimer);
 
     if (query.length < 2) {
+        hideSuggestions();
         resultsContainer.innerHTML = `
             <div class="empty-state">
                 <p>Escribe al menos 2 caracteres para buscar...</p>
@@ -18,13 +31,115 @@ searchInput.addEventListener('input', (e) => {
         return;
     }
 
-    loadingSpinner.classList.remove('hidden');
+    suggestTimer = setTimeout(() => {
+        fetchSuggestions(e.target.value);
+    }, SUGGEST_DELAY);
 
     debounceTimer = setTimeout(() => {
-        fetchResults(query);
-    }, 400); // 400ms debounce
+        commitSearch(query);
+    }, SEARCH_IDLE_DELAY);
+});
+
+searchInput.addEventListener('keydown', (e) => {
+    if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+        if (suggestions.length === 0) return;
+        e.preventDefault();
+        const step = e.key === 'ArrowDown' ? 1 : -1;
+        // Posiciones -1 (el texto escrito) .. n-1, de forma circular
+        const positions = suggestions.length + 1;
+        activeSuggestion = (activeSuggestion + 1 + step + positions) % positions - 1;
+        highlightSuggestion();
+    } else if (e.key === 'Enter') {
+        e.preventDefault();
+        if (activeSuggestion >= 0) {
+            chooseSuggestion(activeSuggestion);
+        } else {
+            commitSearch(searchInput.value.trim());
+        }
+    } else if (e.key === 'Escape') {
+        hideSuggestions();
+    }
+});
+
+searchInput.addEventListener('blur', () => {
+    // Dejar que el clic sobre una sugerencia llegue antes de ocultarlas
+    setTimeout(hideSuggestions, 150);
+});
+
+suggestionsList.addEventListener('mousedown', (e) => {
+    const item = e.target.closest('[data-index]');
+    if (!item) return;
+    e.preventDefault();
+    chooseSuggestion(Number(item.dataset.index));
 });
 
+async function fetchSuggestions(text) {
+    if (suggestController) suggestController.abort();
+    suggestController = new AbortController();
+    try {
+        const response = await fetch(`/suggest?q=${encodeURIComponent(text)}&limit=6`, {
+            signal: suggestController.signal
+        });
+        if (!response.ok) return;
+        const data = await response.json();
+        // La respuesta puede llegar tarde: solo sirve si el texto no ha cambiado
+        if (data.query !== searchInput.value) return;
+        renderSuggestions(data);
+    } catch (error) {
+        if (error.name !== 'AbortError') console.error(error);
+    }
+}
+
+function renderSuggestions(data) {
+    suggestions = [
+        ...(data.completions || []).map(c => ({ query: c.texto, html: escapeHtml(c.texto) })),
+        ...(data.activities || []).map(a => ({
+            query: a.titulo,
+            html: `<span class="suggestion-code">NACE ${escapeHtml(a.codigo_nace)}</span> ${escapeHtml(a.titulo)}`
+        }))
+    ];
+    activeSuggestion = -1;
+    if (suggestions.length === 0) {
+        hideSuggestions();
+        return;
+    }
+    suggestionsList.innerHTML = suggestions
+        .map((s, i) => `<li role="option" data-index="${i}">${s.html}</li>`)
+        .join('');
+    suggestionsList.classList.remove('hidden');
+}
+
+function highlightSuggestion() {
+    suggestionsList.querySelectorAll('li').forEach((li, i) => {
+        li.classList.toggle('active', i === activeSuggestion);
+    });
+}
+
+function chooseSuggestion(index) {
+    const suggestion = suggestions[index];
+    if (!suggestion) return;
+    searchInput.value = suggestion.query;
+    commitSearch(suggestion.query);
+}
+
+function hideSuggestions() {
+    suggestions = [];
+    activeSuggestion = -1;
+    suggestionsList.classList.add('hidden');
+    suggestionsList.innerHTML = '';
+}
+
+function commitSearch(query) {
+    clearTimeout(debounceTimer);
+    clearTimeout(suggestTimer);
+    if (suggestController) suggestController.abort();
+    hideSuggestions();
+    if (query.length < 2 || query === lastSearched) return;
+    lastSearched = query;
+    loadingSpinner.classList.remove('hidden');
+    fetchResults(query);
+}
+
 async function fetchResults(query) {
     try {
         const response = await fetch(`/search?q=${encodeURIComponent(query)}`);
@@ -38,6 +153,7 @@ async function fetchResults(query) {
         renderResults(results, excluded, query);
     } catch (error) {
         console.error(error);
+        lastSearched = '';
         resultsContainer.innerHTML = `
             <div class="empty-state" style="color: #ef4444;">
                 <p>Ocurrió un error al buscar. Inténtalo de nuevo.</p>
@@ -0,0 +1,156 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from iaf_nace_classifier import api
+from iaf_nace_classifier.overlay import Overlay
+from iaf_nace_classifier.search import buscar_actividades
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    """Token de administración y overlay vacío (se restauran al terminar)."""
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "secreto")
+    monkeypatch.setattr(api, "OVERLAY", Overlay())
+    return {"X-Admin-Token": "secreto"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Sin pool: las búsquedas se puntúan en el thread pool de FastAPI
+    monkeypatch.setenv("IAF_NACE_POOL_WORKERS", "0")
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_search_batch(client):
+    response = client.post("/search/batch", json={"queries": ["restaurante", "venta de ropa"], "top_n": 3})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 2
+    assert [item["query"] for item in body["items"]] == ["restaurante", "venta de ropa"]
+    assert all(0 < len(item["results"]) <= 3 for item in body["items"])
+
+
+@pytest.mark.parametrize("top_n", [0, -1, api.MAX_TOP_N + 1])
+def test_search_batch_top_n_fuera_de_rango(client, top_n):
+    response = client.post("/search/batch", json={"queries": ["restaurante"], "top_n": top_n})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "top_n"]
+
+
+def test_search_batch_demasiadas_queries(client):
+    queries = ["restaurante"] * (api.MAX_BATCH_QUERIES + 1)
+    response = client.post("/search/batch", json={"queries": queries})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "queries"]
+
+
+def _muestra(texto, prefijo):
+    """Valor de la primera línea de /metrics que empieza por `prefijo`."""
+    for linea in texto.splitlines():
+        if linea.startswith(prefijo):
+            return float(linea.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_con_pool_de_procesos(monkeypatch):
+    # Las búsquedas se puntúan en un worker; sus métricas vuelven con cada resultado
+    monkeypatch.setenv("IAF_NACE_POOL_WORKERS", "1")
+    monkeypatch.setenv("IAF_NACE_POOL_KIND", "process")
+    monkeypatch.setattr(api.metrics, "ENABLED", True)
+    consultas = 'iaf_nace_search_queries_total{engine="python"}'
+    puntuacion = 'iaf_nace_search_stage_seconds_count{stage="puntuacion"}'
+    with TestClient(api.app) as client:
+        antes = client.get("/metrics").text
+        assert client.get("/search", params={"q": "reparación de bicicletas eléctricas"}).status_code == 200
+        response = client.post("/search/batch", json={"queries": ["cultivo de olivos", "taller de cerámica"]})
+        assert response.status_code == 200
+        despues = client.get("/metrics").text
+    assert _muestra(despues, consultas) - _muestra(antes, consultas) == 3
+    assert _muestra(despues, puntuacion) - _muestra(antes, puntuacion) == 3
+    assert _muestra(despues, "iaf_nace_search_documents_scored_total") > _muestra(
+        antes, "iaf_nace_search_documents_scored_total"
+    )
+
+
+@pytest.mark.parametrize("engine", ["python", "reference", "numpy"])
+def test_metrics_cuentan_todos_los_motores(monkeypatch, engine):
+    if engine == "numpy":
+        pytest.importorskip("numpy")
+    monkeypatch.setattr(api.metrics, "ENABLED", True)
+    consultas = f'iaf_nace_search_queries_total{{engine="{engine}"}}'
+    antes = api.metrics.render()
+    # La consulta sin palabras no se puntúa y no cuenta en ningún motor
+    buscar_actividades(["cultivo de olivos", "taller de cerámica", "de la"], engine=engine, use_cache=False)
+    despues = api.metrics.render()
+    assert _muestra(despues, consultas) - _muestra(antes, consultas) == 2
+
+
+def _codigos(response):
+    assert response.status_code == 200
+    return [r["codigo_nace"] for r in response.json()["results"]]
+
+
+def test_overlay_alias_de_codigo_inexistente(client, admin):
+    response = client.post("/overlay/aliases/99.99", json={"alias": "cría de dragones"}, headers=admin)
+    assert response.status_code == 422
+    assert len(api.OVERLAY) == 0
+    response = client.post("/overlay/aliases/56.10", json={"alias": "chiringuito playero"}, headers=admin)
+    assert response.status_code == 200
+
+
+def test_search_con_pool_usa_un_solo_overlay(monkeypatch, admin):
+    monkeypatch.setenv("IAF_NACE_POOL_WORKERS", "1")
+    monkeypatch.setenv("IAF_NACE_POOL_KIND", "process")
+    query = {"q": "chiringuito playero"}
+    nuevo = Overlay()
+    nuevo.agregar_alias("56.10", "chiringuito playero")
+    original = api._mapping_async
+
+    async def cambiar_overlay_durante(overlay=None):
+        # Un cambio en /overlay llega entre la lectura del mapeo y el envío al pool
+        mapping = await original(overlay)
+        monkeypatch.setattr(api, "OVERLAY", nuevo)
+        return mapping
+
+    with TestClient(api.app) as client:
+        monkeypatch.setattr(api, "_mapping_async", cambiar_overlay_durante)
+        # La petición en curso termina con el overlay con el que empezó...
+        assert "56.10" not in _codigos(client.get("/search", params=query))
+        monkeypatch.setattr(api, "_mapping_async", original)
+        # ...y la siguiente usa el nuevo (otra versión del índice, otra entrada de caché)
+        assert _codigos(client.get("/search", params=query))[0] == "56.10"
+        response = client.post("/search/batch", json={"queries": [query["q"]]})
+        assert response.json()["items"][0]["results"][0]["codigo_nace"] == "56.10"
+
+
+@pytest.mark.parametrize("workers", ["0", "1"], ids=["sin_pool", "pool"])
+def test_cache_invalidada_al_cambiar_el_indice(monkeypatch, admin, workers):
+    # Con pool, la caché del proceso padre se usa con buscar_en_cache/guardar_en_cache
+    monkeypatch.setenv("IAF_NACE_POOL_WORKERS", workers)
+    monkeypatch.setenv("IAF_NACE_POOL_KIND", "process")
+    query = {"q": "chiringuito playero"}
+    with TestClient(api.app) as client:
+
+        def cache():
+            return client.get("/cache/stats").json()
+
+        inicial = _codigos(client.get("/search", params=query))
+        antes = cache()
+        assert _codigos(client.get("/search", params=query)) == inicial
+        assert cache()["hits"] == antes["hits"] + 1
+
+        # Overlay: nueva versión del índice, la respuesta anterior ya no se sirve
+        response = client.post("/overlay/aliases/56.10", json={"alias": "chiringuito playero"}, headers=admin)
+        assert response.status_code == 200
+        antes = cache()
+        con_alias = _codigos(client.get("/search", params=query))
+        assert con_alias[0] == "56.10" and con_alias != inicial
+        assert cache()["misses"] == antes["misses"] + 1
+
+        # Recarga: se vacía la caché y la búsqueda vuelve a puntuarse
+        assert client.post("/admin/reload", headers=admin).status_code == 200
+        assert cache()["size"] == 0
+        antes = cache()
+        assert _codigos(client.get("/search", params=query)) == con_alias
+        assert cache()["misses"] == antes["misses"] + 1
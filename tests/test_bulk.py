@@ -0,0 +1,28 @@
+import io
+
+import pytest
+
+from iaf_nace_classifier.bulk import read_rows
+
+
+def test_read_rows_jsonl():
+    fh = io.StringIO('{"id": 1, "query": "restaurante"}\n\n{"id": 2}\n')
+    assert list(read_rows(fh, "jsonl", None)) == [
+        ({"id": 1, "query": "restaurante"}, "restaurante"),
+        ({"id": 2}, ""),
+    ]
+
+
+@pytest.mark.parametrize(
+    "linea, error",
+    [
+        ("{query: 1}", "invalid JSON"),
+        ('["restaurante"]', r"not a JSON object \(list\)"),
+        ("42", r"not a JSON object \(int\)"),
+    ],
+)
+def test_read_rows_jsonl_linea_no_valida(linea, error):
+    # El número de línea cuenta también las líneas vacías
+    fh = io.StringIO('{"query": "restaurante"}\n\n' + linea + "\n")
+    with pytest.raises(SystemExit, match=f"Line 3: .*{error}"):
+        list(read_rows(fh, "jsonl", None))
@@ -0,0 +1,60 @@
+"""
+Presupuesto de tiempo de importación (`python -X importtime`).
+
+Cada punto de entrada se importa en un intérprete nuevo; cuenta el tiempo
+propio de los módulos del paquete (las dependencias como FastAPI no entran
+en el presupuesto) y vale la mejor de varias ejecuciones. También falla si
+la importación arrastra módulos que deben cargarse bajo demanda, como el
+motor de búsqueda o NumPy con `import iaf_nace_classifier`.
+
+En máquinas lentas, IAF_NACE_IMPORT_BUDGET_SCALE multiplica los presupuestos.
+"""
+
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+import pytest
+
+PACKAGE = "iaf_nace_classifier"
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RUNS = 3
+SCALE = float(os.environ.get("IAF_NACE_IMPORT_BUDGET_SCALE", "1"))
+
+# módulo, presupuesto para los módulos propios (ms), módulos que no debe importar
+BUDGETS = [
+    (PACKAGE, 10.0, (f"{PACKAGE}.search", f"{PACKAGE}.index", "numpy")),
+    (f"{PACKAGE}.cli", 20.0, (f"{PACKAGE}.search", "numpy")),
+    (f"{PACKAGE}.api", 60.0, ()),
+]
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+
+def _medir(module: str) -> Tuple[float, List[str]]:
+    """(ms propios del paquete, módulos importados) al importar `module` en un intérprete nuevo."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True, cwd=REPO_ROOT,
+    )
+    own_us = 0
+    imported = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        name = m.group(3)
+        imported.append(name)
+        if name == PACKAGE or name.startswith(PACKAGE + "."):
+            own_us += int(m.group(1))
+    return own_us / 1000, imported
+
+
+@pytest.mark.parametrize("module, budget, forbidden", BUDGETS, ids=[b[0] for b in BUDGETS])
+def test_import_time(module, budget, forbidden):
+    own, imported = min((_medir(module) for _ in range(RUNS)), key=lambda r: r[0])
+    assert not sorted(set(forbidden) & set(imported)), "importa módulos que deben cargarse bajo demanda"
+    assert own <= budget * SCALE, f"{module}: {own:.1f} ms propios (presupuesto {budget * SCALE:.0f} ms)"
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from iaf_nace_classifier.index import SearchIndex, get_search_index
+from iaf_nace_classifier.mapping import default_mapping
+from iaf_nace_classifier.overlay import Overlay, desde_estado
+from iaf_nace_classifier.pool import ScoringPool
+from iaf_nace_classifier.search import buscar_actividad
+
+QUERIES = [
+    "restaurante",
+    "chiringuito playero",
+    "restaurantes de playa",
+    "cría de dragones",
+    "venta de ropa",
+    "fabricación de muebles de madera",
+    "desarrollo de software",
+    "cultivo de cereales",
+]
+
+CAMBIOS = {
+    "sustituir": lambda o: o.poner_descripcion("56.10", "Restaurantes y chiringuitos de playa"),
+    "añadir": lambda o: o.poner_descripcion("99.99", "Cría de dragones y otros animales fantásticos", 1),
+    "retirar": lambda o: o.retirar("56.10"),
+    "alias": lambda o: o.agregar_alias("56.10", "chiringuito playero"),
+}
+
+
+def _overlay(*nombres):
+    overlay = Overlay()
+    for nombre in nombres:
+        CAMBIOS[nombre](overlay)
+    return overlay
+
+
+def _ranking(response):
+    return [
+        (r["codigo_nace"], round(r["relevancia"], 9), r.get("razon_exclusion"))
+        for r in response["results"] + response["excluded"]
+    ]
+
+
+@pytest.mark.parametrize("cambios", [("sustituir",), ("añadir",), ("retirar",), ("alias",), tuple(CAMBIOS)])
+def test_indice_incremental_igual_que_reconstruido(cambios):
+    base = default_mapping()
+    mapping = _overlay(*cambios).aplicar(base)
+    incremental = get_search_index(mapping)
+    reconstruido = SearchIndex(mapping)
+    assert incremental is not get_search_index(base)
+    for query in QUERIES:
+        esperado = buscar_actividad(query, index=reconstruido, top_n=20, use_cache=False)
+        obtenido = buscar_actividad(query, index=incremental, top_n=20, use_cache=False)
+        assert _ranking(obtenido) == _ranking(esperado), query
+
+
+def test_cambios_visibles_en_la_busqueda():
+    mapping = _overlay("alias", "añadir").aplicar(default_mapping())
+    codigos = [r["codigo_nace"] for r in buscar_actividad("chiringuito playero", mapping=mapping)["results"]]
+    assert codigos[0] == "56.10"
+    codigos = [r["codigo_nace"] for r in buscar_actividad("cría de dragones", mapping=mapping)["results"]]
+    assert codigos[0] == "99.99"
+    retirado = _overlay("retirar").aplicar(default_mapping())
+    codigos = [r["codigo_nace"] for r in buscar_actividad("restaurante", mapping=retirado)["results"]]
+    assert "56.10" not in codigos
+
+
+def test_alias_sin_descripcion():
+    overlay = Overlay()
+    overlay.agregar_alias("99.99", "cría de dragones")
+    with pytest.raises(ValueError):
+        overlay.aplicar(default_mapping())
+
+
+def test_estado_en_worker_del_pool():
+    overlay = _overlay(*CAMBIOS)
+    assert desde_estado(overlay.estado()).to_dict() == overlay.to_dict()
+    mapping = overlay.aplicar(default_mapping())
+
+    async def buscar_en_pool():
+        pool = ScoringPool(1, kind="process")
+        try:
+            return [await pool.buscar(q, top_n=20, mapping=mapping, overlay=overlay.estado()) for q in QUERIES]
+        finally:
+            pool.shutdown()
+
+    # El índice de `mapping` es nuevo: nada está en caché y todo lo puntúa el worker
+    respuestas = asyncio.run(buscar_en_pool())
+    for query, respuesta in zip(QUERIES, respuestas, strict=True):
+        esperado = buscar_actividad(query, mapping=mapping, top_n=20, use_cache=False)
+        assert _ranking(respuesta) == _ranking(esperado), query
@@ -0,0 +1,95 @@
+"""
+Paridad de los motores de búsqueda con la implementación de referencia.
+
+`engine="reference"` puntúa todas las descripciones con `calcular_relevancia`;
+el motor por defecto (bitsets de candidatos, puntuación agrupada y selección
+top-K con poda), el recorrido completo (`full_scan=True`) y el motor NumPy
+deben devolver los mismos códigos, en el mismo orden, con los mismos scores y
+exclusiones.
+"""
+
+from functools import cache
+
+import pytest
+
+from iaf_nace_classifier.search import buscar_actividad, buscar_actividades
+
+QUERIES = [
+    "restaurante",
+    "venta de ropa",
+    "comercio al por menor de prendas de vestir",
+    "fabricación de muebles",
+    "fabricación de muebles de madera",
+    "muebles de metal",
+    "desarrollo de software",
+    "consultoría informática",
+    "reparación de computadoras",
+    "reparación de vehículos de motor",
+    "cultivo de cereales",
+    "cría de ganado bovino",
+    "transporte de mercancías por carretera",
+    "construcción de edificios residenciales",
+    "instalaciones eléctricas",
+    "servicios de limpieza",
+    "peluquería y estética",
+    "hotel",
+    "call center",
+    "facility management",
+    "operación médica",
+    "clínica dental",
+    "fabricación de productos farmacéuticos",
+    "venta de medicamentos",
+    "esferas navideñas",
+    "tienda de pc",
+    "impresión de periódicos",
+    "actividades de seguridad privada",
+    "educación secundaria",
+    "producción de energía eléctrica",
+    "de la",
+    "x",
+]
+
+TOP_N = [1, 5, 20, 50]
+TOLERANCIA = 1e-9
+
+
+def _igual(obtenido, esperado):
+    for clave in ("results", "excluded"):
+        a, b = obtenido[clave], esperado[clave]
+        assert [r["codigo_nace"] for r in a] == [r["codigo_nace"] for r in b], clave
+        assert [r.get("razon_exclusion") for r in a] == [r.get("razon_exclusion") for r in b], clave
+        for x, y in zip(a, b, strict=True):
+            assert abs(x["relevancia"] - y["relevancia"]) <= TOLERANCIA, (clave, x["codigo_nace"])
+
+
+@cache
+def _referencia(query, top_n):
+    return buscar_actividad(query, top_n=top_n, engine="reference")
+
+
+@pytest.mark.parametrize("top_n", TOP_N)
+@pytest.mark.parametrize("query", QUERIES)
+def test_python_igual_que_referencia(query, top_n):
+    _igual(buscar_actividad(query, top_n=top_n, engine="python", use_cache=False), _referencia(query, top_n))
+
+
+@pytest.mark.parametrize("top_n", TOP_N)
+@pytest.mark.parametrize("query", QUERIES)
+def test_full_scan_igual_que_referencia(query, top_n):
+    _igual(buscar_actividad(query, top_n=top_n, full_scan=True), _referencia(query, top_n))
+
+
+@pytest.mark.parametrize("top_n", TOP_N)
+def test_numpy_igual_que_referencia(top_n):
+    pytest.importorskip("numpy")
+    respuestas = buscar_actividades(QUERIES, top_n=top_n, engine="numpy", use_cache=False)
+    for query, respuesta in zip(QUERIES, respuestas, strict=True):
+        _igual(respuesta, _referencia(query, top_n))
+        _igual(buscar_actividad(query, top_n=top_n, engine="numpy", use_cache=False), _referencia(query, top_n))
+
+
+@pytest.mark.parametrize("top_n", TOP_N)
+def test_lote_igual_que_referencia(top_n):
+    respuestas = buscar_actividades(QUERIES, top_n=top_n, use_cache=False)
+    for query, respuesta in zip(QUERIES, respuestas, strict=True):
+        _igual(respuesta, _referencia(query, top_n))